@@ -1,27 +1,50 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # Startup timing (see /api/stats and scripts/startup_profile.py)
 import os
 import shutil
 import uuid
 import asyncio
-import glob
+import hashlib
+import mimetypes
+import json
+import zipfile
+from collections import deque
 from typing import List, Dict, Optional, Union
-from fastapi import FastAPI, UploadFile, File, WebSocket, BackgroundTasks, HTTPException, Request
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket, BackgroundTasks, HTTPException, Request, Header, Response
 from fastapi.exceptions import RequestValidationError
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import uvicorn
+import numpy as np
 from contextlib import asynccontextmanager
 
-# Import existing backend logic
-from mesh_repair import repair_worker
+# Import existing backend logic. The repair pipeline and the geometry stacks it needs
+# (pymeshlab, trimesh, scipy) load only in the processes worker_entry starts
+import worker_entry
+from mesh_fidelity import deviation_map_path
+from job_scheduler import JobScheduler, estimate_cost, LEASE_SECONDS
+from job_store import JobStore, JobEventQueue, dumps
+from large_mesh import upload_limit_bytes, in_memory_limit_bytes, binary_stl_size
+from compact_mesh import CompactMesh
+from zip_stream import ZipStream, extract_meshes
+from shapes import validate_shapes, transform_shapes
+from incremental import validate_delta, defect_map_path
+import mesh_codec
+import mesh_lod
+import mesh_export
+import mesh_storage
+from chunked_upload import (HASH_BLOCK, MAX_CHUNK, ContentHasher, block_digests, content_hash, block_count,
+                            missing_ranges, check_chunk, write_at, link_or_copy)
 
-from multiprocessing import Process, Queue
-import queue # for queue.Empty exception
+from multiprocessing import Process
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pydantic import BaseModel
 
-# Store active repair jobs
-# job_id -> { 'status': '...', 'progress': 0, 'result': None, 'process': Process, 'queue': Queue }
-active_jobs: Dict[str, dict] = {}
+# Repair jobs live in a shared SQLite store (NAOSHI_JOB_DB) so any uvicorn worker can
+# accept an upload, report a job's progress or serve its download
+store = JobStore()
 
 FRONTEND_DIR = os.path.join(os.path.dirname(__file__), "web")
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_uploads")
@@ -30,26 +53,107 @@ OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "fixed_meshes")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Memory-derived (large binary STLs repair out-of-core, see large_mesh); NAOSHI_MAX_UPLOAD_MB overrides.
+# OBJ and ASCII STL have no large-mesh mode, so they are held to what an in-memory repair fits
+MAX_UPLOAD_SIZE = upload_limit_bytes()
+IN_MEMORY_UPLOAD_SIZE = in_memory_limit_bytes()
+
+# Repair jobs are dispatched shortest-first; jobs costed above LARGE_JOB_COST only get
+# LARGE_JOB_WORKERS slots so small repairs always have a fast lane
+REPAIR_WORKERS = int(os.environ.get('NAOSHI_REPAIR_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+LARGE_JOB_WORKERS = int(os.environ.get('NAOSHI_LARGE_JOB_WORKERS', max(1, REPAIR_WORKERS // 2)))
+LARGE_JOB_COST = 120.0
+
+def run_options(job):
+    """Worker options for a claimed job: a preview-ready progressive job is refining its draft."""
+    options = dict(job['options'] or {})
+    if job.get('preview_ready'):
+        options.pop('progressive', None)
+    return options
+
+def launch_repair(job):
+    """Starts the repair process for a claimed job; it reports straight into the store."""
+    p = Process(target=worker_entry.repair_worker, args=(job['input_path'], job['output_path'],
+                                            JobEventQueue(store.path, job['job_id'], job['attempt']),
+                                            run_options(job)))
+    p.start()
+    return p
+
+scheduler = JobScheduler(store, launch_repair, REPAIR_WORKERS, large_cost=LARGE_JOB_COST, large_workers=LARGE_JOB_WORKERS)
+
+async def run_scheduler():
+    # In a thread: its store calls can wait up to the busy timeout on another writer's lock
+    while True:
+        try:
+            await asyncio.to_thread(scheduler.poll)
+        except Exception as e:
+            print(f"Scheduler error: {e}")
+        await asyncio.sleep(0.1)
+
+# Remote worker agents (worker_agent.py) lease jobs over HTTP; set NAOSHI_AGENT_TOKEN
+# to require agents to present it in the X-Agent-Token header
+AGENT_TOKEN = os.environ.get('NAOSHI_AGENT_TOKEN')
+
+# Orientation runs in its own small process pool so heavy models never occupy the
+# default executor threads (or the GIL the event loop needs). Its process imports the
+# orientation code at startup, in the background, unless NAOSHI_PREWARM=0
+ORIENT_WORKERS = 1
+PREWARM = os.environ.get('NAOSHI_PREWARM', '1') != '0'
+orient_executor: Optional[ProcessPoolExecutor] = None
+
+def get_orient_executor():
+    global orient_executor
+    if orient_executor is None:
+        orient_executor = ProcessPoolExecutor(max_workers=ORIENT_WORKERS)
+    return orient_executor
+
+# Event-loop lag samples (ms): how late a fixed-interval sleep wakes up
+LOOP_LAG_INTERVAL = 0.05
+loop_lag_samples = deque(maxlen=200)
+
+# Seconds from the start of this module's import to its end, and to the end of lifespan startup
+startup_times = {'import_s': None, 'ready_s': None}
+
+async def monitor_loop_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag_samples.append(max(0.0, (loop.time() - t0 - LOOP_LAG_INTERVAL) * 1000))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("Starting Mesher API Server...")
     
-    # Clean temp folder on start
-    print(f"Cleaning temp folder: {UPLOAD_DIR}")
-    try:
-        for f in os.listdir(UPLOAD_DIR):
-            fp = os.path.join(UPLOAD_DIR, f)
-            if os.path.isfile(fp):
-                os.remove(fp)
-    except Exception as e:
-        print(f"Error cleaning temp folder: {e}")
+    # Clean temp folder on start (only the first worker up; the others share its files)
+    if store.register_instance(scheduler.owner):
+        print(f"Cleaning temp folder: {UPLOAD_DIR}")
+        try:
+            for f in os.listdir(UPLOAD_DIR):
+                fp = os.path.join(UPLOAD_DIR, f)
+                if os.path.isfile(fp):
+                    os.remove(fp)
+        except Exception as e:
+            print(f"Error cleaning temp folder: {e}")
+        store.fail_orphans()
+        store.clear_uploads()
 
+    if PREWARM:
+        get_orient_executor().submit(worker_entry.warm_up)
+
+    lag_task = asyncio.create_task(monitor_loop_lag())
+    scheduler_task = asyncio.create_task(run_scheduler())
+    startup_times['ready_s'] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    print(f"Ready in {startup_times['ready_s']}s (imports {startup_times['import_s']}s)")
     yield
     # Shutdown: Clean up processes
-    for job_id, job in active_jobs.items():
-        if job['process'].is_alive():
-            job['process'].terminate()
+    lag_task.cancel()
+    scheduler_task.cancel()
+    if orient_executor is not None:
+        orient_executor.shutdown(wait=False, cancel_futures=True)
+    scheduler.shutdown()
+    store.unregister_instance(scheduler.owner)
     print("Shutting down...")
 
 app = FastAPI(lifespan=lifespan)
@@ -72,8 +176,44 @@ app.add_middleware(
 )
 
 # --- MODELS ---
+class AgentLeaseRequest(BaseModel):
+    agent: str # Agent name, unique per agent process (e.g. host:pid)
+
+class AgentEventsRequest(BaseModel):
+    attempt: int
+    events: List[list] = [] # [type, content] pairs as sent by repair_worker; empty just renews the lease
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int # Total bytes; chunks are PUT at block-aligned offsets
+
+class ShapeSpec(BaseModel):
+    type: str # cube, cylinder, sphere, cone (built from params) or mesh (vertices/faces)
+    params: Dict[str, float] = {} # size, width/height/depth, radius, segments (mm)
+    matrix: Optional[Union[List[List[float]], List[float]]] = None # Placement relative to the uploaded model
+    vertices: Optional[List[float]] = None # Flat xyz (type 'mesh')
+    faces: Optional[List[int]] = None # Flat index triples (type 'mesh'; omitted for triangle soup)
+
+class FaceEdit(BaseModel):
+    remove: List[int] = [] # Faces of the previous result (STL face order) being replaced
+    vertices: List[float] = [] # Flat xyz of the replacement faces
+    faces: Optional[List[int]] = None # Flat index triples into vertices (omitted for triangle soup)
+
+class RepairDelta(BaseModel):
+    faces: Optional[FaceEdit] = None # Replaced faces; only the region around them is repaired again
+    transform: Optional[Union[List[List[float]], List[float]]] = None # Applied to the whole previous result
+    shapes: Optional[List[ShapeSpec]] = None # Unioned in, placed in the (transformed) result's coordinates
+
 class RepairRequest(BaseModel):
     transform: Optional[Union[List[List[float]], List[float]]] = None # 4x4 matrix or flat 16-float list
+    max_deviation: Optional[float] = None # Reject Tier 2/3 results deviating more than this fraction of the bbox diagonal
+    deviation_map: bool = False # Write per-corner deviation values for /api/deviation
+    shapes: Optional[List[ShapeSpec]] = None # Editor shapes to union into the repaired model
+    progressive: bool = False # Publish a quick draft result first ('preview' event), then refine it
+    target_faces: Optional[int] = None # Simplify the result toward this many faces...
+    target_ratio: Optional[float] = None # ...or this share of the input's faces
+    simplify_tolerance: Optional[float] = None # Max deviation simplifying may add (fraction of the bbox diagonal)
+    output_format: Optional[str] = None # Also write the result as ply or 3mf; downloads default to it
 
 # --- ENDPOINTS ---
 
@@ -84,56 +224,221 @@ async def upload_file(file: UploadFile = File(...)):
     if ext not in ['.stl', '.obj']:
         raise HTTPException(status_code=400, detail="Invalid file type. Only .stl and .obj supported.")
 
-    # 2. Validate Size & Save (Stream to avoid memory issues, limit 100MB)
-    MAX_SIZE = 100 * 1024 * 1024
+    # 2. Validate Size & Save (Stream to avoid memory issues)
     file_id = str(uuid.uuid4())
     safe_name = f"{file_id}{ext}"
     file_path = os.path.join(UPLOAD_DIR, safe_name)
-    
+    digest, size = await save_upload(file, file_path)
+
+    deduplicated = await store_upload(file_id, file_path, file_path, digest, size)
+    return {"id": file_id, "filename": file.filename, "path": file_path, "deduplicated": deduplicated}
+
+async def save_upload(file, file_path):
+    """Streams an UploadFile to file_path within its size limit (upload_size_error). Returns (content hash, size)."""
+    ext = os.path.splitext(file_path)[1].lower()
+    hasher = ContentHasher()
     try:
         size = 0
+        header = b''
         with open(file_path, "wb") as buffer:
             while chunk := await file.read(1024 * 1024): # 1MB chunks
                 size += len(chunk)
-                if size > MAX_SIZE:
-                    buffer.close()
-                    os.remove(file_path)
-                    raise HTTPException(status_code=413, detail="File too large (Max 100MB)")
+                header += chunk[:84 - len(header)]
+                error = upload_size_error(ext, header, size)
+                if error:
+                    raise HTTPException(status_code=413, detail=error)
                 buffer.write(chunk)
+                hasher.update(chunk)
+        error = upload_size_error(ext, header, size, complete=True)
+        if error:
+            raise HTTPException(status_code=413, detail=error)
     except Exception as e:
          if os.path.exists(file_path): os.remove(file_path)
          raise e
+    return hasher.hexdigest(), size
+
+def upload_size_error(ext, header, size, complete=False):
+    """
+    Why `size` bytes of an upload (of a file starting with `header`) are too many, or None.
+    Binary STLs may use MAX_UPLOAD_SIZE (large ones repair out-of-core); other meshes are
+    repaired in memory, so past IN_MEMORY_UPLOAD_SIZE only a binary STL of exactly its
+    declared size is accepted. Other files (ZIPs) have only MAX_UPLOAD_SIZE.
+    """
+    if size > MAX_UPLOAD_SIZE:
+        return f"File too large (Max {MAX_UPLOAD_SIZE // (1024 * 1024)}MB)"
+    if ext not in ('.stl', '.obj') or size <= IN_MEMORY_UPLOAD_SIZE:
+        return None
+    declared = binary_stl_size(header) if ext == '.stl' else None
+    if declared is None or size > declared or (complete and size != declared):
+        return (f"File too large (Max {IN_MEMORY_UPLOAD_SIZE // (1024 * 1024)}MB for OBJ and ASCII STL; "
+                f"binary STL up to {MAX_UPLOAD_SIZE // (1024 * 1024)}MB)")
+    return None
+
+def register_upload(file_id, data_path, file_path, digest, size):
+    """
+    Records a finished upload under file_path. If identical content is already stored, the
+    data at data_path is dropped and file_path becomes a hard link to the existing copy.
+    Returns True when deduplicated.
+    """
+    for existing in store.find_uploads(digest, size):
+        source = mesh_storage.stored(existing['path'])
+        if existing['path'] != file_path and source is not None:
+            os.remove(data_path)
+            link_or_copy(source, file_path + source[len(existing['path']):])  # In the same stored form
+            store.add_upload(file_id, digest, size, file_path)
+            print(f"Upload {file_id} deduplicated against {existing['file_id']}")
+            return True
+    if data_path != file_path:
+        os.replace(data_path, file_path)
+    store.add_upload(file_id, digest, size, file_path)
+    return False
+
+async def store_upload(file_id, data_path, file_path, digest, size):
+    """register_upload, then the stored file is compressed at rest (mesh_storage), both off the event loop."""
+    deduplicated = await asyncio.to_thread(register_upload, file_id, data_path, file_path, digest, size)
+    await asyncio.to_thread(mesh_storage.compress, file_path)
+    return deduplicated
+
+def find_upload(file_id):
+    """Path of an uploaded file (stored plain or compressed), or None."""
+    for ext in ('.stl', '.obj'):
+        path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
+        if mesh_storage.exists(path):
+            return path
+    return None
+
+def transform_file(input_path, matrix, output_path):
+    """Writes the mesh at input_path, moved by `matrix` (row-major 4x4), to output_path as binary STL."""
+    with mesh_storage.local_copy(input_path) as local_input:
+        mesh = CompactMesh.load(local_input, weld=False)
+    vertices = mesh.vertices @ matrix[:3, :3].T + matrix[:3, 3]
+    # A mirroring transform turns the faces inside out unless their winding is reversed too
+    faces = mesh.faces[:, ::-1] if np.linalg.det(matrix[:3, :3]) < 0 else mesh.faces
+    mesh_export.write(output_path, 'stl', vertices, faces)
+
+# --- CHUNKED UPLOADS ---
+# Protocol: POST /api/uploads -> PUT chunks at block-aligned offsets (any order, in parallel,
+# retried freely) -> GET status for what's missing -> POST finalize. Blocks are hashed as
+# they land, so finalize only combines digests before deduplicating.
+
+@app.post("/api/uploads")
+async def create_upload(request: UploadSessionRequest):
+    ext = os.path.splitext(request.filename)[1].lower()
+    if ext not in ['.stl', '.obj']:
+        raise HTTPException(status_code=400, detail="Invalid file type. Only .stl and .obj supported.")
+    if request.size <= 0 or request.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large (Max {MAX_UPLOAD_SIZE // (1024 * 1024)}MB)")
+    if ext != '.stl' and request.size > IN_MEMORY_UPLOAD_SIZE:
+        # A large STL may still be binary; finalize checks its header
+        raise HTTPException(status_code=413, detail=upload_size_error(ext, b'', request.size))
+
+    upload_id = str(uuid.uuid4())
+    part_path = os.path.join(UPLOAD_DIR, f"upload_{upload_id}.part")
+
+    def create_part():
+        with open(part_path, "wb") as f:
+            f.truncate(request.size)
+        store.create_upload_session(upload_id, request.filename, request.size, part_path)
+
+    await asyncio.to_thread(create_part)
+    return {"upload_id": upload_id, "block_size": HASH_BLOCK, "max_chunk": MAX_CHUNK}
+
+def get_session(upload_id):
+    session = store.get_upload_session(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
 
-    return {"id": file_id, "filename": file.filename, "path": file_path}
+@app.put("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    session = await asyncio.to_thread(get_session, upload_id)
+    if session['file_id']:
+        raise HTTPException(status_code=409, detail="Upload already finalized")
+
+    length = int(request.headers.get('content-length', -1))
+    error = check_chunk(offset, length, session['size']) if length >= 0 else None
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    data = await request.body()
+    error = check_chunk(offset, len(data), session['size'])
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+
+    def write_chunk():
+        write_at(session['part_path'], offset, data)
+        store.add_upload_blocks(upload_id, block_digests(data, offset // HASH_BLOCK))
+
+    await asyncio.to_thread(write_chunk)
+    return {"received": len(data)}
+
+@app.get("/api/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    session = await asyncio.to_thread(get_session, upload_id)
+    received = await asyncio.to_thread(store.upload_blocks, upload_id)
+    missing = [] if session['file_id'] else missing_ranges(session['size'], received)
+    return {
+        "upload_id": upload_id,
+        "size": session['size'],
+        "block_size": HASH_BLOCK,
+        "received_bytes": session['size'] - sum(end - start for start, end in missing),
+        "missing": missing,
+        "file_id": session['file_id'],
+    }
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str):
+    session = await asyncio.to_thread(get_session, upload_id)
+    if session['file_id']:
+        upload = await asyncio.to_thread(store.get_upload, session['file_id'])
+        return {"id": session['file_id'], "filename": session['filename'], "path": upload['path'] if upload else None}
+
+    received = await asyncio.to_thread(store.upload_blocks, upload_id)
+    missing = missing_ranges(session['size'], received)
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload incomplete", "missing": missing})
+
+    ext = os.path.splitext(session['filename'])[1].lower()
+    with open(session['part_path'], 'rb') as f:
+        error = upload_size_error(ext, f.read(84), session['size'], complete=True)
+    if error:
+        raise HTTPException(status_code=413, detail=error)
+
+    digest = content_hash([received[b] for b in range(block_count(session['size']))], session['size'])
+    file_id = str(uuid.uuid4())
+    file_path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
+    deduplicated = await store_upload(file_id, session['part_path'], file_path, digest, session['size'])
+    await asyncio.to_thread(store.finish_upload_session, upload_id, file_id)
+
+    return {"id": file_id, "filename": session['filename'], "path": file_path,
+            "hash": digest, "deduplicated": deduplicated}
 
 @app.post("/api/auto_orient/{file_id}")
 async def auto_orient_file(file_id: str):
-    files = glob.glob(os.path.join(UPLOAD_DIR, f"{file_id}*"))
-    if not files:
+    input_path = find_upload(file_id)
+    if input_path is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    input_path = files[0]
-    
-    # Run calculation in thread pool to avoid blocking async loop
+    # Run calculation in the orientation process pool to avoid blocking async loop
+    global orient_executor
     loop = asyncio.get_event_loop()
     try:
-        from calculate_orientation import get_best_orientation
         print(f"Calculating orientation for {input_path}")
-        transform = await loop.run_in_executor(None, get_best_orientation, input_path)
+        result = await loop.run_in_executor(get_orient_executor(), mesh_storage.on_local_copy,
+                                            worker_entry.compute_orientation, input_path)
     except Exception as e:
          print(f"Orientation error: {e}")
+         if isinstance(e, BrokenProcessPool):
+             orient_executor = None # Recreated on next request
          # Return identity if failure
          transform = [[1.0,0.0,0.0,0.0],[0.0,1.0,0.0,0.0],[0.0,0.0,1.0,0.0],[0.0,0.0,0.0,1.0]]
+         return {"transform": transform}
 
-    print(f"Calculated transform: {transform}")
+    print(f"Calculated transform: {result['transform']} ({'cached' if result['cached'] else str(result['time']) + 's'})")
     
-    return {"transform": transform}
+    return {"transform": result['transform'], "candidates": result['candidates'], "cached": result['cached']}
 
 @app.post("/api/validate_mesh")
 async def validate_mesh(file: UploadFile = File(...)):
-    import trimesh
-    import numpy as np
-
     file_id = str(uuid.uuid4())
     temp_path = os.path.join(UPLOAD_DIR, f"validate_{file_id}.stl")
     
@@ -143,19 +448,9 @@ async def validate_mesh(file: UploadFile = File(...)):
 
         def validate_worker(path):
             try:
-                # process=True merges vertices which is needed for water tightness check on STL
-                mesh = trimesh.load(path, process=True) 
-                return {
-                    "valid": bool(mesh.is_watertight),
-                    "details": {
-                        "watertight": bool(mesh.is_watertight),
-                        "winding_consistent": bool(mesh.is_winding_consistent),
-                        "euler_number": int(mesh.euler_number),
-                        "volume": float(mesh.volume),
-                        "vertices": len(mesh.vertices),
-                        "faces": len(mesh.faces)
-                    }
-                }
+                # Welded on load, which is needed for the watertightness check on STL
+                details = CompactMesh.load(path).validation()
+                return {"valid": details['watertight'], "details": details}
             except Exception as e:
                 return {"error": str(e)}
 
@@ -178,27 +473,62 @@ async def validate_mesh(file: UploadFile = File(...)):
 @app.post("/api/repair/{file_id}")
 async def start_repair(file_id: str, request: RepairRequest = None, background_tasks: BackgroundTasks = None):
     # Find file
-    files = glob.glob(os.path.join(UPLOAD_DIR, f"{file_id}*"))
-    if not files:
+    input_path = find_upload(file_id)
+    if input_path is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    input_path = files[0]
+    transform = request.transform if request else None
+    options = {
+        'max_deviation': request.max_deviation if request else None,
+        'deviation_map': request.deviation_map if request else False,
+        'previews': True,
+        'frames': True,
+        'compress_output': True,
+    }
+    if request and request.progressive:
+        options['progressive'] = True
+    if request and request.output_format:
+        if request.output_format not in mesh_export.FORMATS:
+            raise HTTPException(status_code=400, detail=f"output_format must be one of {', '.join(mesh_export.FORMATS)}")
+        options['output_format'] = request.output_format
+    if request and (request.target_faces is not None or request.target_ratio is not None):
+        if request.target_faces is not None and request.target_faces < 4:
+            raise HTTPException(status_code=400, detail="target_faces must be at least 4")
+        if request.target_ratio is not None and not 0 < request.target_ratio <= 1:
+            raise HTTPException(status_code=400, detail="target_ratio must be in (0, 1]")
+        options['target_faces'] = request.target_faces
+        options['target_ratio'] = request.target_ratio
+        options['simplify_tolerance'] = request.simplify_tolerance
+    if request and request.shapes:
+        options['shapes'] = [shape.model_dump(exclude_none=True) for shape in request.shapes]
+        try:
+            validate_shapes(options['shapes'])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await submit_repair(file_id, input_path, options, transform)
+
+async def submit_repair(file_id, input_path, options, transform=None):
+    """Queues a repair of an uploaded file (or completes it from an identical earlier one)."""
     filename = os.path.basename(input_path)
     output_filename = f"fixed_{filename}"
     output_path = os.path.join(OUTPUT_DIR, output_filename)
-    
-    transform = request.transform if request else None
+
+    # Identical content repaired with identical settings before: reuse that result
+    upload = await asyncio.to_thread(store.get_upload, file_id)
+    repair_key = None
+    if upload:
+        repair_key = hashlib.sha256(dumps([upload['content_hash'], transform, options]).encode()).hexdigest()
+        previous = await asyncio.to_thread(store.find_done_job, repair_key)
+        if previous and mesh_storage.exists(previous['output_path']):
+            return await reuse_repair(file_id, previous, input_path, output_path, filename, options, repair_key)
 
     # Handle Transform & Create Final Input
     final_input_path = input_path
     cleanup_path = None # File to delete after job
     
+    loop = asyncio.get_event_loop()
     if transform:
-        import trimesh
-        import numpy as np
         try:
-            mesh = trimesh.load(input_path, process=False)
-            
             # Handle Transform Format
             matrix = np.array(transform)
             
@@ -210,107 +540,633 @@ async def start_repair(file_id: str, request: RepairRequest = None, background_t
                  print(f"Invalid matrix shape: {matrix.shape}")
                  matrix = np.eye(4)
 
-            mesh.apply_transform(matrix)
-            
-            # Save to a new temp path
-            oriented_filename = f"oriented_{filename}"
-            final_input_path = os.path.join(UPLOAD_DIR, oriented_filename)
-            mesh.export(final_input_path)
-            cleanup_path = final_input_path
+            if mesh_storage.needs_large_mode(input_path):
+                # Too big to load here: the large-mesh pipeline applies it while streaming
+                options['transform'] = matrix.tolist()
+            else:
+                # Save to a new temp path (binary STL whatever the input format)
+                oriented_filename = f"oriented_{os.path.splitext(filename)[0]}.stl"
+                final_input_path = os.path.join(UPLOAD_DIR, oriented_filename)
+                await loop.run_in_executor(None, transform_file, input_path, matrix, final_input_path)
+                cleanup_path = final_input_path
+
+            if options.get('shapes'):
+                # Shapes are placed relative to the model as uploaded, so they follow its transform
+                options['shapes'] = transform_shapes(options['shapes'], matrix)
         except Exception as e:
             print(f"Error applying transform: {e}")
             final_input_path = input_path
 
-    # Launch Process
-    q = Queue()
-    p = Process(target=repair_worker, args=(final_input_path, output_path, q))
-    p.start()
-    
-    active_jobs[file_id] = {
-        'status': 'starting',
-        'progress': 0,
-        'process': p,
-        'queue': q,
-        'output_path': output_path,
-        'filename': filename,
-        'cleanup_path': cleanup_path
-    }
+    # Estimate cost (probes small binary STLs for open/non-manifold edges)
+    try:
+        estimate = await loop.run_in_executor(None, mesh_storage.on_local_copy, estimate_cost, final_input_path)
+    except Exception as e:
+        print(f"Cost estimate failed: {e}")
+        estimate = {'cost': LARGE_JOB_COST, 'defects': None}
+
+    # Queue the job (started by whichever worker's scheduler claims it first);
+    # re-repair replaces any earlier job for this upload
+    position = await asyncio.to_thread(scheduler.submit, file_id, input_path=final_input_path,
+                                       output_path=output_path, filename=filename, cleanup_path=cleanup_path,
+                                       options=options, cost=estimate['cost'], repair_key=repair_key)
     
-    return {"status": "started", "job_id": file_id}
+    return {"status": "started" if position == 0 else "queued", "job_id": file_id,
+            "queue_position": position, "estimated_cost": estimate['cost']}
+
+async def reuse_repair(file_id, previous, input_path, output_path, filename, options, repair_key):
+    """Completes a repair request immediately from a previous job with the same repair key."""
+    result = dict(previous['result'])
+    result['reused_from'] = previous['job_id']
+    previous_map = deviation_map_path(previous['output_path'])
+
+    def copy_outputs():
+        # Copies, not links: the earlier job's files may be rewritten by a later re-repair
+        if previous['output_path'] != output_path:
+            mesh_storage.copy(previous['output_path'], output_path)
+            if result.get('deviation_map') and os.path.exists(previous_map):
+                shutil.copyfile(previous_map, deviation_map_path(output_path))
+            mesh_lod.clear_previews(output_path)
+            for preview in result.get('previews') or []:
+                source = mesh_lod.lod_path(previous['output_path'], preview['lod'])
+                if os.path.exists(source):
+                    shutil.copyfile(source, mesh_lod.lod_path(output_path, preview['lod']))
+        if result.get('deviation_map'):
+            result['deviation_map'] = deviation_map_path(output_path)
+
+    def complete():
+        copy_outputs()
+        scheduler.cancel(file_id)
+        store.create_job(file_id, status='running', input_path=input_path, output_path=output_path,
+                         filename=filename, options=options, repair_key=repair_key)
+        store.record(file_id, 'done', result)
+
+    await asyncio.to_thread(complete)
+    print(f"Repair {file_id} reused result of {previous['job_id']}")
+    return {"status": "done", "job_id": file_id, "queue_position": 0, "estimated_cost": 0.0, "reused": True}
+
+@app.post("/api/repair/{file_id}/delta")
+async def repair_delta(file_id: str, request: RepairDelta):
+    """Applies an edit to this upload's last repair result, repairing only the region it touches."""
+    job = await asyncio.to_thread(store.get_job, file_id)
+    if job is None or job['status'] != 'done' or not mesh_storage.exists(job['output_path']):
+        raise HTTPException(status_code=409, detail="No finished repair to update")
+
+    delta = request.model_dump(exclude_none=True)
+    try:
+        validate_delta(delta)
+        if delta.get('shapes'):
+            validate_shapes(delta['shapes'])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The update rewrites the job's output, so it starts from a plain copy (with the defect map)
+    output_path = job['output_path']
+    base_path = os.path.join(UPLOAD_DIR, f"base_{file_id}{os.path.splitext(output_path)[1]}")
+
+    def copy_base():
+        mesh_storage.extract(output_path, base_path)
+        if os.path.exists(defect_map_path(output_path)):
+            shutil.copy2(defect_map_path(output_path), defect_map_path(base_path))
+
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, copy_base)
+
+    options = {k: v for k, v in (job['options'] or {}).items()
+               if k not in ('delta', 'shapes', 'transform', 'deviation_map')}
+    options['delta'] = delta
+    try:
+        estimate = await loop.run_in_executor(None, estimate_cost, base_path)
+    except Exception as e:
+        print(f"Cost estimate failed: {e}")
+        estimate = {'cost': LARGE_JOB_COST, 'defects': None}
+
+    position = await asyncio.to_thread(scheduler.submit, file_id, input_path=base_path, output_path=output_path,
+                                       filename=job['filename'], cleanup_path=base_path, options=options,
+                                       cost=estimate['cost'])
+    return {"status": "started" if position == 0 else "queued", "job_id": file_id,
+            "queue_position": position, "estimated_cost": estimate['cost'], "incremental": True}
 
 @app.websocket("/ws/progress/{file_id}")
 async def websocket_endpoint(websocket: WebSocket, file_id: str):
     await websocket.accept()
     
-    if file_id not in active_jobs:
+    job = await asyncio.to_thread(store.get_job, file_id)
+    if job is None:
         await websocket.send_json({'type': 'error', 'message': 'Job not found'})
         await websocket.close()
         return
 
-    job = active_jobs[file_id]
-    q = job['queue']
-    p = job['process']
+    generation = job['generation']
+    last_event = 0
+    last_position = None
     
     try:
         while True:
-            try:
-                # Drain queue
-                while not q.empty():
-                    msg_type, content = q.get_nowait()
-                    
-                    if msg_type == 'progress':
-                        text, val = content
-                        job['progress'] = val
-                        await websocket.send_json({'type': 'progress', 'text': text, 'value': val})
-                    
-                    elif msg_type == 'status':
-                        await websocket.send_json({'type': 'status', 'text': content})
-                        
-                    elif msg_type == 'done':
-                        job['status'] = 'done'
-                        await websocket.send_json({'type': 'done', 'result': content})
-                        
-                    elif msg_type == 'error':
-                        job['status'] = 'error'
-                        await websocket.send_json({'type': 'error', 'message': content})
-            except queue.Empty:
-                pass
-            except Exception as e:
-                print(f"Queue error: {e}")
+            job, events = await asyncio.to_thread(job_progress, file_id, last_event)
+            if job is None or job['generation'] != generation:
+                await websocket.send_json({'type': 'error', 'message': 'Job replaced by a newer repair'})
                 break
-            
-            # Check liveness
-            if not p.is_alive() and job['status'] not in ['done', 'error']:
-                 # If process died without sending 'done' or 'error', assume crash
-                 job['status'] = 'error'
-                 await websocket.send_json({'type': 'error', 'message': 'Process terminated unexpectedly'})
 
-            if job.get('status') in ['done', 'error']:
+            # Forward new events (whichever worker process is running the repair). Before the
+            # queue check: a draft's 'preview' puts the job back in the queue for its refinement
+            frame = None
+            for event_id, msg_type, content in events:
+                last_event = event_id
+                if msg_type == 'frame':
+                    frame = content  # Only the newest frame of a batch is sent
+                elif msg_type == 'progress':
+                    text, val = content
+                    await websocket.send_json({'type': 'progress', 'text': text, 'value': val})
+                elif msg_type == 'status':
+                    await websocket.send_json({'type': 'status', 'text': content})
+                elif msg_type == 'preview':
+                    frame = None
+                    await websocket.send_json({'type': 'preview', 'result': content})
+                elif msg_type == 'done':
+                    frame = None
+                    await websocket.send_json({'type': 'done', 'result': content})
+                elif msg_type == 'error':
+                    frame = None
+                    await websocket.send_json({'type': 'error', 'message': content})
+            if frame is not None:
+                await send_frame(websocket, job, frame)
+
+            if job['status'] == 'cancelled':
+                await websocket.send_json({'type': 'error', 'message': 'Repair cancelled'})
                 break
-                
+            if job['status'] in ['done', 'error']:
+                break
+
+            # Still waiting for a worker slot
+            if job['status'] == 'queued':
+                position = await asyncio.to_thread(scheduler.position, file_id)
+                if position != last_position:
+                    last_position = position
+                    text = f"{'Draft ready; refinement' if job['preview_ready'] else 'Waiting'} in queue (#{position})..."
+                    await websocket.send_json({'type': 'status', 'text': text, 'queue_position': position})
+                await asyncio.sleep(0.25)
+                continue
+
             await asyncio.sleep(0.1)
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        # Cleanup temporary files (oriented input)
-        if job.get('cleanup_path') and os.path.exists(job['cleanup_path']):
+        # Cleanup temporary files (oriented input), unless a draft's refinement still needs it
+        job = await asyncio.to_thread(store.get_job, file_id) or job
+        refining = job and job.get('preview_ready') and job['status'] not in ('done', 'error', 'cancelled')
+        if job and job.get('cleanup_path') and os.path.exists(job['cleanup_path']) and not refining:
             try:
                 os.remove(job['cleanup_path'])
+                if os.path.exists(defect_map_path(job['cleanup_path'])):
+                    os.remove(defect_map_path(job['cleanup_path']))
                 print(f"Cleaned up temp file: {job['cleanup_path']}")
             except: pass
 
 
 
-@app.get("/api/download/{file_id}")
-async def download_fixed(file_id: str):
-    if file_id not in active_jobs:
+def job_progress(file_id, after_id):
+    """(job, its events after after_id). The job is read first, so a finished job's last event is included."""
+    return store.get_job(file_id), store.events_after(file_id, after_id)
+
+async def send_frame(websocket, job, frame):
+    """
+    A progress frame as a {'type': 'frame', ...} message followed by the geometry (the compact
+    encoding) as one binary message. Frames the worker has already replaced are skipped; as
+    the sender only picks the newest frame per poll, a slow client receives fewer frames
+    rather than a backlog.
+    """
+    try:
+        with open(mesh_lod.frame_path(job['output_path'], frame['seq']), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return
+    await websocket.send_json({'type': 'frame', **frame})
+    await websocket.send_bytes(data)
+
+def result_job(file_id):
+    """The job of file_id if it has a result to serve: finished, or a progressive job's draft. Raises HTTPException."""
+    job = store.get_job(file_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-        
-    job = active_jobs[file_id]
-    if job['status'] != 'done':
+    if job['status'] != 'done' and not (job['preview_ready'] and job['status'] not in ('error', 'cancelled')):
         raise HTTPException(status_code=400, detail="Repair not finished")
-        
-    return FileResponse(job['output_path'], filename=f"fixed_{job['filename']}")
+    return job
+
+def compact_codec(accept, format):
+    """Codec of the compact encoding the client asked for, or None for the original file."""
+    if format == 'compact':
+        return 'gzip'
+    for item in (accept or '').split(','):
+        media_type, *params = [p.strip() for p in item.split(';')]
+        if media_type == mesh_codec.MEDIA_TYPE:
+            params = dict(p.split('=', 1) for p in params if '=' in p)
+            if params.get('q') in ('0', '0.0'):
+                return None
+            return 'zstd' if params.get('codec') == 'zstd' and mesh_codec.zstd_available() else 'gzip'
+    return None
+
+def accepts_encoding(accept_encoding, encoding):
+    """True if an Accept-Encoding header lists `encoding` (or *) without q=0."""
+    for item in (accept_encoding or '').split(','):
+        name, *params = [p.strip() for p in item.split(';')]
+        if name.lower() in (encoding, '*'):
+            return not any(p.replace(' ', '') in ('q=0', 'q=0.0') for p in params)
+    return False
+
+def stored_file_response(path, request, filename, media_type=None, headers=None):
+    """
+    Response for a file kept by mesh_storage. Compressed bytes pass through as
+    Content-Encoding: gzip to clients that accept it (Range requests then address them);
+    other clients get a decompressing stream.
+    """
+    source = mesh_storage.stored(path)
+    if source is None:
+        raise HTTPException(status_code=404, detail="File missing")
+    headers = dict(headers or {})
+    headers['Vary'] = ', '.join(filter(None, [headers.get('Vary'), 'Accept-Encoding']))
+    media_type = media_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if source == path:
+        return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    if accepts_encoding(request.headers.get('accept-encoding'), mesh_storage.ENCODING):
+        return FileResponse(source, media_type=media_type, filename=filename,
+                            headers={**headers, 'Content-Encoding': mesh_storage.ENCODING})
+    return StreamingResponse(mesh_storage.chunks(path), media_type=media_type,
+                             headers={**headers, 'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.get("/api/download/{file_id}")
+async def download_fixed(file_id: str, request: Request, format: Optional[str] = None):
+    """
+    The repaired file, or with `Accept: application/vnd.naoshi.mesh` (optionally `;codec=zstd`)
+    or ?format=compact the quantized, indexed encoding from mesh_codec for the viewer.
+    ?format=stl|ply|3mf picks a print format (default: the repair's output_format, else the
+    file as saved); a result not already written in it is converted once (mesh_export).
+    All support Range requests; a result stored compressed is served as Content-Encoding: gzip
+    to clients that accept it (see stored_file_response). While a progressive job refines,
+    this is its draft (X-Naoshi-Quality: draft).
+    """
+    if format not in (None, 'compact') and format not in mesh_export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    job = await asyncio.to_thread(result_job, file_id)
+    quality = {'Vary': 'Accept', 'X-Naoshi-Quality': (job['result'] or {}).get('quality', 'full')}
+
+    codec = compact_codec(request.headers.get('accept'), format)
+    if codec:
+        loop = asyncio.get_event_loop()
+        path = await loop.run_in_executor(None, mesh_codec.ensure_encoded, job['output_path'], codec)
+        name = os.path.splitext(job['filename'])[0]
+        return FileResponse(path, media_type=mesh_codec.MEDIA_TYPE, filename=f"fixed_{name}.nmsh", headers=quality)
+
+    fmt = format or (job['options'] or {}).get('output_format')
+    if fmt and mesh_export.format_path(job['output_path'], fmt) != job['output_path']:
+        loop = asyncio.get_event_loop()
+        path = await loop.run_in_executor(None, mesh_export.ensure_format, job['output_path'], fmt)
+        name = os.path.splitext(job['filename'])[0]
+        return FileResponse(path, media_type=mesh_export.FORMATS[fmt], filename=f"fixed_{name}.{fmt}", headers=quality)
+
+    return stored_file_response(job['output_path'], request, f"fixed_{job['filename']}",
+                                mesh_export.FORMATS.get(fmt), quality)
+
+@app.get("/api/preview/{file_id}")
+async def download_preview(file_id: str, lod: Optional[str] = None):
+    """
+    A repair result in the compact encoding at a level of detail: one of the face budgets
+    listed in the result's 'previews' (default: the coarsest) or 'full'. Results without
+    previews (small or large-mesh mode ones) are served in full.
+    """
+    job = await asyncio.to_thread(result_job, file_id)
+
+    previews = {p['lod']: p['faces'] for p in (job['result'] or {}).get('previews') or []}
+    if lod is None and previews:
+        lod = str(min(previews))
+    if lod not in (None, 'full'):
+        try:
+            level = int(lod)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="lod must be a face budget or 'full'")
+        path = mesh_lod.lod_path(job['output_path'], level)
+        if level in previews and os.path.exists(path):
+            return FileResponse(path, media_type=mesh_codec.MEDIA_TYPE,
+                                headers={'X-Preview-Lod': str(level), 'X-Preview-Faces': str(previews[level])})
+        if level not in previews:
+            raise HTTPException(status_code=404, detail=f"No {lod} preview (available: {sorted(previews)} or 'full')")
+
+    # Full detail (also when a listed preview is missing, e.g. a result uploaded by an agent)
+    loop = asyncio.get_event_loop()
+    path = await loop.run_in_executor(None, mesh_codec.ensure_encoded, job['output_path'], 'gzip')
+    return FileResponse(path, media_type=mesh_codec.MEDIA_TYPE,
+                        headers={'X-Preview-Lod': 'full', 'X-Preview-Faces': str((job['result'] or {}).get('final_faces', ''))})
+
+@app.get("/api/stats")
+async def server_stats():
+    """Event-loop lag, repair worker saturation (sampled by scripts/load_test.py) and startup timing."""
+    lags = list(loop_lag_samples)
+    running = len(await asyncio.to_thread(store.list_jobs, ('starting', 'running')))
+    return {
+        'time': time.time(),
+        'loop_lag_ms': {
+            'last': round(lags[-1], 2) if lags else 0.0,
+            'mean': round(sum(lags) / len(lags), 2) if lags else 0.0,
+            'max': round(max(lags), 2) if lags else 0.0,
+        },
+        'jobs': {'total': await asyncio.to_thread(store.count_jobs), 'running': running},
+        'scheduler': await asyncio.to_thread(scheduler.snapshot),
+        'cpu_count': os.cpu_count(),
+        'startup': {**startup_times, 'heavy_modules': worker_entry.loaded_heavy_modules()},
+    }
+
+@app.get("/api/deviation/{file_id}")
+async def download_deviation(file_id: str):
+    """Per-corner float32 deviation (3 values per face, STL face order) for coloring the viewer."""
+    job = await asyncio.to_thread(result_job, file_id)
+    path = deviation_map_path(job['output_path'])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No deviation map for this job")
+
+    return FileResponse(path, media_type="application/octet-stream")
+
+# --- BATCH REPAIR ---
+# POST /api/batch with several meshes and/or ZIPs of them -> one queued job per part ->
+# WS /ws/batch/{id} for aggregated progress -> GET /api/batch/{id}/download streams a ZIP
+# that grows as parts finish (it can be requested right away).
+
+MAX_BATCH_FILES = 500
+# All parts of one batch together, as uploaded or extracted (a small ZIP can otherwise expand
+# to MAX_BATCH_FILES x MAX_UPLOAD_SIZE on disk); NAOSHI_MAX_BATCH_MB overrides
+MAX_BATCH_SIZE = int(float(os.environ.get('NAOSHI_MAX_BATCH_MB', 0)) * 1024 * 1024) or 4 * MAX_UPLOAD_SIZE
+BATCH_POLL_INTERVAL = 0.25
+
+@app.post("/api/batch")
+async def create_batch(files: List[UploadFile] = File(...), max_deviation: Optional[float] = Form(None)):
+    loop = asyncio.get_event_loop()
+    parts = []  # (name, file_id, path, digest, size)
+    skipped = []
+    try:
+        for upload in files:
+            ext = os.path.splitext(upload.filename or '')[1].lower()
+            if ext == '.zip':
+                zip_path = os.path.join(UPLOAD_DIR, f"batch_{uuid.uuid4()}.zip")
+                await save_upload(upload, zip_path)
+                try:
+                    members, ignored = await loop.run_in_executor(
+                        None, extract_meshes, zip_path, UPLOAD_DIR, ('.stl', '.obj'),
+                        MAX_BATCH_FILES - len(parts), MAX_UPLOAD_SIZE, MAX_BATCH_SIZE - sum(p[4] for p in parts))
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"{upload.filename} is not a valid ZIP")
+                except ValueError as e:
+                    raise HTTPException(status_code=413, detail=str(e))
+                finally:
+                    os.remove(zip_path)
+                for name, path, digest, size in members:
+                    parts.append((name, os.path.splitext(os.path.basename(path))[0], path, digest, size))
+                    with open(path, 'rb') as f:
+                        error = upload_size_error(os.path.splitext(path)[1], f.read(84), size, complete=True)
+                    if error:
+                        raise HTTPException(status_code=413, detail=f"{name}: {error}")
+                skipped.extend(ignored)
+            elif ext in ('.stl', '.obj'):
+                if len(parts) >= MAX_BATCH_FILES:
+                    raise HTTPException(status_code=413, detail=f"Too many parts (max {MAX_BATCH_FILES})")
+                file_id = str(uuid.uuid4())
+                path = os.path.join(UPLOAD_DIR, f"{file_id}{ext}")
+                digest, size = await save_upload(upload, path)
+                parts.append((os.path.basename(upload.filename), file_id, path, digest, size))
+                if sum(p[4] for p in parts) > MAX_BATCH_SIZE:
+                    raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE // (1024 * 1024)}MB)")
+            else:
+                raise HTTPException(status_code=400, detail=f"{upload.filename}: only .stl, .obj and .zip supported")
+    except Exception:
+        for part in parts:
+            if os.path.exists(part[2]):
+                os.remove(part[2])
+        raise
+    if not parts:
+        raise HTTPException(status_code=400, detail="No .stl or .obj parts found")
+
+    options = {'max_deviation': max_deviation, 'deviation_map': False, 'compress_output': True}
+    items = []
+    for name, file_id, path, digest, size in parts:
+        await store_upload(file_id, path, path, digest, size)
+        queued = await submit_repair(file_id, path, dict(options))
+        items.append({'job_id': file_id, 'name': name, 'status': queued['status']})
+
+    batch_id = str(uuid.uuid4())
+    await asyncio.to_thread(store.create_batch, batch_id, [{'job_id': i['job_id'], 'name': i['name']} for i in items])
+    print(f"Batch {batch_id}: {len(items)} part(s) queued")
+    return {"batch_id": batch_id, "count": len(items), "parts": items, "skipped": skipped}
+
+def get_batch_or_404(batch_id):
+    batch = store.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+def batch_parts(batch):
+    """Current state of every part, in upload order."""
+    jobs = store.batch_jobs([item['job_id'] for item in batch['items']])
+    parts = []
+    for item in batch['items']:
+        job = jobs.get(item['job_id'])
+        if job is None:
+            job = {'status': 'error', 'progress': 0.0, 'error': 'Job not found', 'result': None, 'output_path': None}
+        finished = job['status'] in ('done', 'error', 'cancelled')
+        parts.append({'job_id': item['job_id'], 'name': item['name'], 'status': job['status'],
+                      'progress': 1.0 if finished else job['progress'], 'error': job['error'],
+                      'result': job['result'], 'output_path': job['output_path'], 'finished': finished})
+    return parts
+
+def batch_summary(parts):
+    return {
+        'total': len(parts),
+        'done': sum(1 for p in parts if p['status'] == 'done'),
+        'failed': sum(1 for p in parts if p['status'] in ('error', 'cancelled')),
+        'running': sum(1 for p in parts if p['status'] in ('starting', 'running')),
+        'queued': sum(1 for p in parts if p['status'] == 'queued'),
+        'value': sum(p['progress'] for p in parts) / len(parts) if parts else 1.0,
+    }
+
+def batch_part_report(part):
+    report = {'name': part['name'], 'job_id': part['job_id'], 'status': part['status']}
+    if part['status'] == 'done':
+        result = part['result'] or {}
+        for key in ('method', 'tier', 'is_watertight', 'original_faces', 'final_faces', 'time'):
+            report[key] = result.get(key)
+    else:
+        report['error'] = part['error'] or 'Repair cancelled'
+    return report
+
+@app.get("/api/batch/{batch_id}")
+async def batch_status(batch_id: str):
+    batch = await asyncio.to_thread(get_batch_or_404, batch_id)
+    parts = await asyncio.to_thread(batch_parts, batch)
+    return {"batch_id": batch_id, **batch_summary(parts),
+            "parts": [{**batch_part_report(p), 'progress': p['progress']} for p in parts]}
+
+@app.websocket("/ws/batch/{batch_id}")
+async def batch_websocket(websocket: WebSocket, batch_id: str):
+    await websocket.accept()
+    batch = await asyncio.to_thread(store.get_batch, batch_id)
+    if batch is None:
+        await websocket.send_json({'type': 'error', 'message': 'Batch not found'})
+        await websocket.close()
+        return
+
+    reported = set()
+    last_summary = None
+    try:
+        while True:
+            parts = await asyncio.to_thread(batch_parts, batch)
+            for part in parts:
+                if part['finished'] and part['job_id'] not in reported:
+                    reported.add(part['job_id'])
+                    await websocket.send_json({'type': 'part', **batch_part_report(part)})
+
+            summary = batch_summary(parts)
+            if summary != last_summary:
+                last_summary = summary
+                await websocket.send_json({'type': 'progress', **summary})
+
+            if len(reported) == len(parts):
+                await websocket.send_json({'type': 'done', **summary})
+                break
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+    except Exception as e:
+        print(f"Batch WebSocket error: {e}")
+
+@app.get("/api/batch/{batch_id}/download")
+async def download_batch(batch_id: str):
+    """ZIP of the repaired parts, each added as soon as it finishes (failed parts are listed in batch_report.json)."""
+    batch = await asyncio.to_thread(get_batch_or_404, batch_id)
+
+    async def archive():
+        loop = asyncio.get_event_loop()
+        stream = ZipStream()
+        written = set()
+        reports = []
+        while len(written) < len(batch['items']):
+            for part in await asyncio.to_thread(batch_parts, batch):
+                if not part['finished'] or part['job_id'] in written:
+                    continue
+                written.add(part['job_id'])
+                reports.append(batch_part_report(part))
+                if part['status'] != 'done' or not mesh_storage.exists(part['output_path']):
+                    continue
+                folder, base = os.path.split(part['name'])
+                chunks = stream.file_chunks(f"{folder}/fixed_{base}" if folder else f"fixed_{base}", part['output_path'])
+                # File reads and deflate happen off the event loop, one chunk at a time
+                while (data := await loop.run_in_executor(None, next, chunks, None)) is not None:
+                    if data:
+                        yield data
+            if len(written) < len(batch['items']):
+                await asyncio.sleep(BATCH_POLL_INTERVAL)
+
+        yield stream.write_bytes('batch_report.json', json.dumps({'batch_id': batch_id, 'parts': reports}, indent=2))
+        yield stream.close()
+
+    return StreamingResponse(archive(), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="naoshi_batch_{batch_id[:8]}.zip"'})
+
+# --- WORKER AGENTS ---
+# Protocol: lease -> GET input -> POST events (progress, also renews the lease) ->
+# PUT result -> POST events with 'done'. A 409 means the lease was lost (expired,
+# cancelled or re-queued) and the agent should abandon the job.
+
+def check_agent_token(token):
+    if AGENT_TOKEN and token != AGENT_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid agent token")
+
+def agent_job(job_id, agent, attempt):
+    """The job if `agent` still holds this attempt (lease renewed as a side effect)."""
+    job = store.get_job(job_id)
+    if job is None or store.touch_lease(job_id, f"agent:{agent}", attempt, LEASE_SECONDS) is None:
+        raise HTTPException(status_code=409, detail="Lease lost")
+    return job
+
+@app.post("/api/agent/lease")
+async def agent_lease(request: AgentLeaseRequest, x_agent_token: Optional[str] = Header(None)):
+    check_agent_token(x_agent_token)
+    job = await asyncio.to_thread(store.claim_next, f"agent:{request.agent}", 0, 0, scheduler.aging_rate,
+                                  LEASE_SECONDS, remote=True)
+    if job is None:
+        return Response(status_code=204)
+    print(f"Job {job['job_id']} leased to agent {request.agent} (attempt {job['attempt']})")
+    return {
+        'job_id': job['job_id'],
+        'attempt': job['attempt'],
+        'filename': job['filename'],
+        'input_ext': os.path.splitext(job['input_path'])[1],
+        'options': run_options(job),
+        'lease_seconds': LEASE_SECONDS,
+    }
+
+@app.get("/api/agent/jobs/{job_id}/input")
+async def agent_input(job_id: str, agent: str, attempt: int, request: Request,
+                      x_agent_token: Optional[str] = Header(None)):
+    check_agent_token(x_agent_token)
+    job = await asyncio.to_thread(agent_job, job_id, agent, attempt)
+    if not mesh_storage.exists(job['input_path']):
+        raise HTTPException(status_code=404, detail="Input file missing")
+    return stored_file_response(job['input_path'], request, os.path.basename(job['input_path']),
+                                "application/octet-stream")
+
+@app.put("/api/agent/jobs/{job_id}/result")
+async def agent_result(job_id: str, agent: str, attempt: int, request: Request, kind: str = 'mesh',
+                       lod: Optional[int] = None, encoding: Optional[str] = None,
+                       x_agent_token: Optional[str] = Header(None)):
+    """
+    Streams an uploaded result ('mesh', 'deviation' map or 'preview' at `lod`) into place. A
+    mesh may arrive already compressed (encoding=gzip) and is then stored as it is.
+    """
+    check_agent_token(x_agent_token)
+    job = await asyncio.to_thread(agent_job, job_id, agent, attempt)
+    if kind not in ('mesh', 'deviation', 'preview') or (kind == 'preview' and lod is None):
+        raise HTTPException(status_code=400, detail="Unknown result kind")
+    if encoding not in (None, mesh_storage.ENCODING) or (encoding and kind != 'mesh'):
+        raise HTTPException(status_code=400, detail="Unsupported result encoding")
+
+    if kind == 'preview':
+        path = mesh_lod.lod_path(job['output_path'], lod)
+    else:
+        path = job['output_path'] if kind == 'mesh' else deviation_map_path(job['output_path'])
+    part_path = f"{path}.{attempt}.part"
+    try:
+        with open(part_path, "wb") as buffer:
+            async for chunk in request.stream():
+                buffer.write(chunk)
+        if kind == 'mesh':
+            mesh_storage.store(part_path, path, compressed=bool(encoding))
+        else:
+            os.replace(part_path, path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    if kind == 'mesh' and not encoding and (job['options'] or {}).get('compress_output'):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, mesh_storage.compress, path)
+    return {'ok': True}
+
+@app.post("/api/agent/jobs/{job_id}/events")
+async def agent_events(job_id: str, agent: str, request: AgentEventsRequest,
+                       x_agent_token: Optional[str] = Header(None)):
+    check_agent_token(x_agent_token)
+    job = await asyncio.to_thread(agent_job, job_id, agent, request.attempt)
+    return await asyncio.to_thread(record_agent_events, job, request.events, request.attempt)
+
+def record_agent_events(job, events, attempt):
+    """Records an agent's events for its job (file checks and store writes, off the event loop)."""
+    job_id = job['job_id']
+    for event in events:
+        msg_type, content = event
+        if msg_type in ('preview', 'done'):
+            # Paths in the payload are the agent's; point the deviation map at our copy
+            path = deviation_map_path(job['output_path'])
+            content['deviation_map'] = path if content.get('deviation_map') and os.path.exists(path) else None
+            content['previews'] = [p for p in content.get('previews') or []
+                                   if os.path.exists(mesh_lod.lod_path(job['output_path'], p['lod']))]
+            if not mesh_storage.exists(job['output_path']):
+                msg_type, content = 'error', "Agent reported done without uploading a result"
+        if not store.record(job_id, msg_type, content, attempt):
+            raise HTTPException(status_code=409, detail="Lease lost")
+    return {'status': store.get_job(job_id)['status']}
 
 # Mount Frontend (Last route)
 if os.path.exists(FRONTEND_DIR):
@@ -326,6 +1182,8 @@ async def add_no_cache_header(request: Request, call_next):
     response.headers["Expires"] = "0"
     return response
 
+startup_times['import_s'] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
 def find_free_port(start_port=8000):
     """Finds the first available port starting from start_port."""
     port = start_port
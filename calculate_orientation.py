@@ -1,27 +1,283 @@
-import trimesh
-import numpy as np
+import os
 import sys
 import json
+import time
+import hashlib
+from collections import OrderedDict
+
+import trimesh
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "orientation")
+MEMORY_CACHE_SIZE = 32
+
+OVERHANG_ANGLE = 45.0   # degrees from vertical; steeper down-facing faces need support
+BED_TOLERANCE = 1e-3    # fraction of bbox diagonal counted as "on the bed"
+MAX_CANDIDATES = 64
+HULL_MAX_POINTS = 100_000
+FACE_CHUNK = 131072     # faces per batched scoring block (bounds the (F, K) temporaries)
+
+# Lower score is better. Areas are normalized by total surface area, height by the
+# bbox diagonal and footprint by the largest candidate footprint.
+DEFAULT_WEIGHTS = {
+    'support_contact_area': 1.0,
+    'overhang_area': 0.25,
+    'build_height': 0.5,
+    'base_footprint': 0.5,
+}
+UNSTABLE_PENALTY = 10.0
+
+_memory_cache = OrderedDict()  # content hash -> result dict
+
+
+def file_hash(filepath, chunk_size=1024 * 1024):
+    h = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_get(key):
+    if key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        return _memory_cache[key]
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            _cache_put(key, result, persist=False)
+            return result
+        except Exception:
+            return None
+    return None
+
+
+def _cache_put(key, result, persist=True):
+    _memory_cache[key] = result
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+    if persist:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(os.path.join(CACHE_DIR, f"{key}.json"), 'w') as f:
+                json.dump(result, f)
+        except OSError as e:
+            sys.stderr.write(f"Orientation cache write failed: {e}\n")
+
+
+def surface_arrays(mesh):
+    """Per-face normals, areas and centroids straight from the triangles (no vertex merging)."""
+    tri = mesh.vertices[mesh.faces]
+    cross = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    double_area = np.linalg.norm(cross, axis=1)
+    normals = np.divide(cross, double_area[:, None], out=np.zeros_like(cross), where=double_area[:, None] > 0)
+    # Signed tetra volumes against the origin give volume and center of mass for closed meshes
+    tet = np.einsum('ij,ij->i', tri[:, 0], np.cross(tri[:, 1], tri[:, 2])) / 6.0
+    volume = float(tet.sum())
+    com = (tet[:, None] * tri.sum(axis=1)).sum(axis=0) / (4.0 * volume) if volume else None
+    # float32 halves the cost of the batched (F, K) scoring pass
+    return {
+        'normals': normals.astype(np.float32),
+        'areas': (double_area / 2.0).astype(np.float32),
+        'centroids': tri.mean(axis=1).astype(np.float32),
+        'volume': volume,
+        'center_mass': com,
+    }
+
+
+def convex_hull(points, max_points=HULL_MAX_POINTS, seed=0):
+    """
+    scipy ConvexHull after Akl-Toussaint culling: points strictly inside the hull of the
+    extreme points along 26 directions can't be hull vertices, so qhull never sees them.
+    Dense smooth surfaces can leave millions of candidates; those are randomly thinned to
+    max_points (the extremes are always kept), giving a slightly inscribed hull.
+    """
+    from scipy.spatial import ConvexHull
+
+    dirs = np.array([[x, y, z] for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)
+                     if (x, y, z) != (0, 0, 0)], dtype=float)
+    # Culling only decides what qhull sees, so float32 is precise enough and twice as fast
+    pts32 = points.astype(np.float32)
+    extremes = np.unique(np.argmax(pts32 @ dirs.T.astype(np.float32), axis=0))
+    keep = np.ones(len(points), dtype=bool)
+    try:
+        coarse = ConvexHull(points[extremes])
+        normals = coarse.equations[:, :3].T.astype(np.float32)
+        offsets = coarse.equations[:, 3].astype(np.float32)
+        eps = 1e-6 * float(np.ptp(points[extremes], axis=0).max() or 1.0)
+        for start in range(0, len(points), FACE_CHUNK):
+            block = pts32[start:start + FACE_CHUNK]
+            inside = np.all(block @ normals + offsets < -eps, axis=1)
+            keep[start:start + FACE_CHUNK] = ~inside
+    except Exception:
+        pass  # Degenerate extreme set (flat input): let qhull handle everything
+
+    candidates = np.flatnonzero(keep)
+    if len(candidates) > max_points:
+        rng = np.random.default_rng(seed)
+        candidates = np.union1d(rng.choice(candidates, max_points, replace=False), extremes)
+    points = points[candidates]
+    return points, ConvexHull(points)
+
+
+def hull_candidates(points, hull, max_candidates=MAX_CANDIDATES):
+    """
+    Candidate "down" directions: one per group of coplanar hull facets (rounded normals),
+    largest support polygons first. Returns (normals (K,3), areas (K,), group id per hull facet).
+    """
+    normals = hull.equations[:, :3]
+    tri = points[hull.simplices]
+    facet_areas = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1) / 2.0
+
+    # Integer-hash the rounded normals: much faster than np.unique(axis=0)
+    rounded = np.round(normals * 1000).astype(np.int64) + 1000
+    _, group = np.unique((rounded[:, 0] * 2001 + rounded[:, 1]) * 2001 + rounded[:, 2], return_inverse=True)
+    group = group.reshape(-1)
+    n_groups = int(group.max()) + 1
+
+    areas = np.bincount(group, weights=facet_areas, minlength=n_groups)
+    summed = np.zeros((n_groups, 3))
+    np.add.at(summed, group, normals * facet_areas[:, None])
+    group_normals = summed / np.linalg.norm(summed, axis=1, keepdims=True)
+
+    order = np.argsort(-areas)[:max_candidates]
+    remap = np.full(n_groups, -1)
+    remap[order] = np.arange(len(order))
+    return group_normals[order], areas[order], remap[group]
+
+
+def hull_center_mass(points, hull):
+    tri = points[hull.simplices]
+    apex = points[hull.vertices].mean(axis=0)
+    heights = -(hull.equations[:, :3] @ apex + hull.equations[:, 3])
+    areas = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1) / 2.0
+    vols = areas * heights / 3.0
+    return ((tri.sum(axis=1) + apex) / 4.0 * vols[:, None]).sum(axis=0) / vols.sum()
+
+
+def stable_candidates(points, hull, face_group, n_candidates, center_mass):
+    """Whether the center of mass projects inside each candidate's support polygon (vectorized over hull facets)."""
+    tri = points[hull.simplices]
+    n = hull.equations[:, :3]
+    # Project the COM onto every hull facet plane along that facet's normal
+    p = center_mass - ((center_mass - tri[:, 0]) * n).sum(axis=1)[:, None] * n
+    bary = trimesh.triangles.points_to_barycentric(tri, p)
+    inside = np.all(bary >= -1e-6, axis=1) & (face_group >= 0)
+
+    stable = np.zeros(n_candidates, dtype=bool)
+    stable[face_group[inside]] = True
+    return stable
+
+
+def score_candidates(surface, hull_points, down, hull_areas, weights):
+    """
+    Scores all candidate down directions in one batched pass over the faces.
+    Returns a dict of metric arrays, each shaped (K,).
+    """
+    up = -down                                    # (K, 3) build direction in mesh frame
+    cos_limit = np.cos(np.radians(90.0 - OVERHANG_ANGLE))
+    diag = float(np.linalg.norm(np.ptp(hull_points, axis=0))) or 1.0
+    tol = BED_TOLERANCE * diag
+
+    # Height extremes are always attained at hull vertices
+    up32 = up.astype(np.float32)
+    heights = hull_points @ up.T                  # (H, K)
+    base = heights.min(axis=0)
+    build_height = heights.max(axis=0) - base
+
+    normals, areas, centroids = surface['normals'], surface['areas'], surface['centroids']
+    overhang = np.zeros(len(up))
+    support_contact = np.zeros(len(up))
+    for start in range(0, len(areas), FACE_CHUNK):
+        sl = slice(start, start + FACE_CHUNK)
+        facing = normals[sl] @ up32.T               # (F, K): -1 = facing straight down
+        downward = facing < -cos_limit
+        on_bed = (centroids[sl] @ up32.T - base) < tol
+        a = areas[sl][:, None]
+        overhang += (downward * a).sum(axis=0)
+        support_contact += ((downward & ~on_bed) * a).sum(axis=0)
+
+    total_area = float(areas.sum()) or 1.0
+    footprint = hull_areas
+    score = (weights['support_contact_area'] * support_contact / total_area
+             + weights['overhang_area'] * overhang / total_area
+             + weights['build_height'] * build_height / diag
+             - weights['base_footprint'] * footprint / (footprint.max() or 1.0))
+    return {
+        'score': score,
+        'overhang_area': overhang,
+        'support_contact_area': support_contact,
+        'build_height': build_height,
+        'base_footprint': footprint,
+    }
+
+
+def pose_transform(hull_points, down):
+    """4x4 transform rotating `down` to -Z and resting the mesh on z=0, centered in XY."""
+    matrix = trimesh.geometry.align_vectors(down, [0.0, 0.0, -1.0])
+    moved = trimesh.transform_points(hull_points, matrix)
+    lo, hi = moved.min(axis=0), moved.max(axis=0)
+    matrix[:3, 3] = [-(lo[0] + hi[0]) / 2, -(lo[1] + hi[1]) / 2, -lo[2]]
+    return matrix
+
+
+def compute_orientation(filepath, weights=None, max_candidates=MAX_CANDIDATES, top=5):
+    """
+    Print-orientation search: candidates from convex hull facets, scored in one batched
+    pass on overhang, support contact, build height and base footprint.
+    Results are cached by file content hash (memory LRU + CACHE_DIR).
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    key = file_hash(filepath)
+    cache_key = hashlib.sha1(f"{key}:{max_candidates}:{sorted(weights.items())}".encode()).hexdigest()
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return {**cached, 'cached': True}
+
+    t0 = time.perf_counter()
+    # process=False: merging STL vertices costs more than the whole search
+    mesh = trimesh.load(filepath, force='mesh', process=False)
+    surface = surface_arrays(mesh)
+    hull_points, hull = convex_hull(mesh.vertices)
+
+    down, hull_areas, face_group = hull_candidates(hull_points, hull, max_candidates)
+
+    # Surface COM is only trustworthy for (nearly) closed, outward-wound meshes
+    com = surface['center_mass']
+    if com is None or not (0.05 * hull.volume < surface['volume'] <= 1.01 * hull.volume):
+        com = hull_center_mass(hull_points, hull)
+    stable = stable_candidates(hull_points, hull, face_group, len(down), com)
+
+    metrics = score_candidates(surface, hull_points[hull.vertices], down, hull_areas, weights)
+    metrics['score'] = metrics['score'] + UNSTABLE_PENALTY * ~stable
+
+    order = np.argsort(metrics['score'])
+    best = int(order[0])
+    result = {
+        'hash': key,
+        'transform': pose_transform(hull_points[hull.vertices], down[best]).tolist(),
+        'candidates': [{
+            'down': down[i].round(6).tolist(),
+            'stable': bool(stable[i]),
+            **{name: float(values[i]) for name, values in metrics.items()},
+        } for i in order[:top]],
+        'evaluated': int(len(down)),
+        'time': round(time.perf_counter() - t0, 3),
+    }
+    _cache_put(cache_key, result)
+    return {**result, 'cached': False}
+
 
 def get_best_orientation(filepath):
     """
-    Calculates the most stable pose for a mesh.
+    Calculates the best print orientation for a mesh.
     Returns the 4x4 transformation matrix.
     """
     try:
-        mesh = trimesh.load(filepath, process=False)
-        
-        # compute_stable_poses uses convex hull, which is fast
-        transforms, probs = trimesh.poses.compute_stable_poses(mesh)
-        
-        # Get the most probable stable pose (highest probability)
-        # They are usually sorted, but let's be safe
-        best_idx = np.argmax(probs)
-        best_transform = transforms[best_idx]
-        
-        # Convert to list for JSON serialization
-        return best_transform.tolist()
-        
+        return compute_orientation(filepath)['transform']
     except Exception as e:
         sys.stderr.write(str(e))
         return np.eye(4).tolist()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import hashlib
+
+# Content hashes are computed per fixed block so chunks can arrive in any order (and on any
+# API worker): the file hash is sha256 over the ordered block digests. Chunk offsets must be
+# block aligned, which makes the hash independent of how a client sized its chunks.
+HASH_BLOCK = 4 * 1024 * 1024
+MAX_CHUNK = 64 * 1024 * 1024
+
+
+def block_digests(data, first_block):
+    """[(block_index, sha256 digest)] for a block-aligned chunk starting at block `first_block`."""
+    view = memoryview(data)
+    return [(first_block + i, hashlib.sha256(view[pos:pos + HASH_BLOCK]).digest())
+            for i, pos in enumerate(range(0, len(view), HASH_BLOCK))]
+
+
+def content_hash(digests, size):
+    """File hash from ordered block digests (size is folded in so empty/short files can't collide)."""
+    h = hashlib.sha256(size.to_bytes(8, 'little'))
+    for digest in digests:
+        h.update(digest)
+    return h.hexdigest()
+
+
+class ContentHasher:
+    """Incremental content_hash for data arriving in order (e.g. a streamed multipart upload)."""
+
+    def __init__(self):
+        self.digests = []
+        self.size = 0
+        self._block = hashlib.sha256()
+        self._filled = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        self.size += len(view)
+        while len(view):
+            take = min(HASH_BLOCK - self._filled, len(view))
+            self._block.update(view[:take])
+            self._filled += take
+            view = view[take:]
+            if self._filled == HASH_BLOCK:
+                self.digests.append(self._block.digest())
+                self._block = hashlib.sha256()
+                self._filled = 0
+
+    def hexdigest(self):
+        digests = self.digests + ([self._block.digest()] if self._filled else [])
+        return content_hash(digests, self.size)
+
+
+def block_count(size):
+    return (size + HASH_BLOCK - 1) // HASH_BLOCK
+
+
+def missing_ranges(size, received_blocks):
+    """Byte ranges [start, end) still to upload, given the set of received block indexes."""
+    ranges = []
+    for block in range(block_count(size)):
+        if block in received_blocks:
+            continue
+        start, end = block * HASH_BLOCK, min(size, (block + 1) * HASH_BLOCK)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def check_chunk(offset, length, size):
+    """Returns an error message if a chunk is misaligned or out of bounds, else None."""
+    if offset < 0 or offset % HASH_BLOCK:
+        return f"Offset must be a multiple of {HASH_BLOCK} bytes"
+    if length == 0 or length > MAX_CHUNK:
+        return f"Chunk must be 1..{MAX_CHUNK} bytes"
+    if offset + length > size:
+        return "Chunk extends past the declared file size"
+    if length % HASH_BLOCK and offset + length != size:
+        return f"Chunk length must be a multiple of {HASH_BLOCK} bytes except for the last chunk"
+    return None
+
+
+def write_at(path, offset, data):
+    """Writes a chunk at its offset in a preallocated part file."""
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def link_or_copy(src, dst):
+    """Hard-links dst to src (no extra storage); copies where links aren't supported."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
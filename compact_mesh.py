@@ -0,0 +1,164 @@
+"""
+Compact mesh container for pipeline-internal work.
+
+Vertices are float32 and faces int32 (half the footprint of trimesh's float64/int64 copies).
+Derived arrays (unique edges, edge counts, normals, areas) are computed on first use and
+cached; drop() releases them once a stage is done. Library structures are built only at the
+boundaries: to_meshlab() for the MeshSet tiers, to_trimesh() for callers that need one.
+"""
+import numpy as np
+
+import large_mesh
+
+
+class CompactMesh:
+    def __init__(self, vertices, faces):
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)
+        self._derived = {}
+
+    # --- Boundaries ---
+
+    @classmethod
+    def load(cls, path, weld=True):
+        """
+        Loads a mesh file. Binary STLs are read straight into float32 corners; other formats
+        go through trimesh once and are converted. STL is non-indexed, so corners are welded
+        (exactly coincident vertices merged) unless weld=False.
+        """
+        count = large_mesh.stl_face_count(path)
+        if count is not None:
+            corners = np.empty((count, 3, 3), dtype=np.float32)
+            for start, tri in large_mesh.iter_triangles(path, count):
+                corners[start:start + len(tri)] = tri
+            mesh = cls(corners.reshape(-1, 3), np.arange(count * 3, dtype=np.int32))
+            del corners
+        else:
+            import trimesh
+            loaded = trimesh.load(path, process=False, force='mesh')
+            mesh = cls(loaded.vertices, loaded.faces)
+            del loaded
+        return mesh.welded() if weld else mesh
+
+    @classmethod
+    def from_meshlab(cls, mesh):
+        """From a pymeshlab.Mesh (e.g. ms.current_mesh())."""
+        return cls(mesh.vertex_matrix(), mesh.face_matrix())
+
+    def to_meshlab(self):
+        import pymeshlab
+        return pymeshlab.Mesh(vertex_matrix=self.vertices.astype(np.float64), face_matrix=self.faces)
+
+    def to_trimesh(self, process=False):
+        import trimesh
+        return trimesh.Trimesh(vertices=self.vertices, faces=self.faces, process=process)
+
+    # --- Derived arrays ---
+
+    def _get(self, name, compute):
+        value = self._derived.get(name)
+        if value is None:
+            value = self._derived[name] = compute()
+        return value
+
+    def drop(self, *names):
+        """Releases cached derived arrays (all of them by default). They are recomputed on next use."""
+        for name in names or list(self._derived):
+            self._derived.pop(name, None)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the mesh and its currently cached derived arrays."""
+        return self.vertices.nbytes + self.faces.nbytes + sum(
+            v.nbytes for v in self._derived.values() if isinstance(v, np.ndarray))
+
+    def _edge_keys(self, directed):
+        f = self.faces.astype(np.int64)
+        a = np.concatenate([f[:, 0], f[:, 1], f[:, 2]])
+        b = np.concatenate([f[:, 1], f[:, 2], f[:, 0]])
+        del f
+        if not directed:
+            a, b = np.minimum(a, b), np.maximum(a, b)
+        return a * len(self.vertices) + b
+
+    def _unique_edges(self):
+        keys, counts = np.unique(self._edge_keys(directed=False), return_counts=True)
+        n = len(self.vertices)
+        self._derived['edge_counts'] = counts.astype(np.int32)
+        return np.stack([keys // n, keys % n], axis=1).astype(np.int32)
+
+    @property
+    def edges_unique(self):
+        """(E, 2) int32 undirected edges."""
+        return self._get('edges_unique', self._unique_edges)
+
+    @property
+    def edge_counts(self):
+        """Faces sharing each of edges_unique."""
+        if 'edge_counts' not in self._derived:
+            self._derived['edges_unique'] = self._unique_edges()
+        return self._derived['edge_counts']
+
+    def _normals(self):
+        normals, areas = large_mesh.face_normals(self.vertices[self.faces])
+        self._derived['face_areas'] = areas.astype(np.float32)
+        return normals.astype(np.float32)
+
+    @property
+    def face_normals(self):
+        return self._get('face_normals', self._normals)
+
+    @property
+    def face_areas(self):
+        if 'face_areas' not in self._derived:
+            self._derived['face_normals'] = self._normals()
+        return self._derived['face_areas']
+
+    # --- Queries ---
+
+    def welded(self):
+        """Copy with exactly coincident vertices merged (what trimesh's process=True does for STL)."""
+        if not len(self.vertices):
+            return CompactMesh(self.vertices, self.faces)
+        _, first, inverse = np.unique(self.vertices.view(np.dtype((np.void, 12))).reshape(-1),
+                                      return_index=True, return_inverse=True)
+        return CompactMesh(self.vertices[first], inverse.reshape(-1).astype(np.int32)[self.faces])
+
+    @property
+    def bounds(self):
+        return np.array([self.vertices.min(axis=0), self.vertices.max(axis=0)])
+
+    @property
+    def is_watertight(self):
+        """Every edge shared by exactly two faces."""
+        return bool(len(self.faces)) and bool(np.all(self.edge_counts == 2))
+
+    @property
+    def is_winding_consistent(self):
+        """No directed edge is used twice (neighbouring faces traverse shared edges in opposite directions)."""
+        keys = self._edge_keys(directed=True)
+        return bool(len(self.faces)) and len(np.unique(keys)) == len(keys)
+
+    @property
+    def euler_number(self):
+        return int(len(self.vertices) - len(self.edges_unique) + len(self.faces))
+
+    @property
+    def volume(self):
+        """Signed volume (positive for outward-facing closed meshes), accumulated in float64."""
+        total = 0.0
+        for start in range(0, len(self.faces), large_mesh.FACE_CHUNK):
+            tri = self.vertices[self.faces[start:start + large_mesh.FACE_CHUNK]].astype(np.float64)
+            total += float(np.einsum('ij,ij->', tri[:, 0], np.cross(tri[:, 1], tri[:, 2])))
+        return total / 6.0
+
+    def validation(self):
+        """Watertightness summary shared by the validate endpoint and the legacy analyzer."""
+        return {
+            'watertight': self.is_watertight,
+            'winding_consistent': self.is_winding_consistent,
+            'euler_number': self.euler_number,
+            'volume': self.volume,
+            'vertices': len(self.vertices),
+            'faces': len(self.faces),
+        }
@@ -0,0 +1,128 @@
+"""
+Incremental re-repair: edits applied to a cached repair result instead of repairing the
+upload again.
+
+A delta (POST /api/repair/{id}/delta) may carry any of
+    faces      - {'remove': [face indices], 'vertices': [xyz...], 'faces': [abc...]}: faces of
+                 the cached result replaced by new geometry (faces omitted = triangle soup)
+    transform  - 4x4 matrix applied to the whole result (three.js elements or row-major)
+    shapes     - editor shapes to union in (see shapes.py)
+and is applied in that order. Only the region around replaced faces, plus whatever the
+cached defect map still lists, is re-repaired.
+
+The defect map is an int32 array of the faces of a result that touch an open or
+non-manifold edge, written next to each output.
+"""
+import os
+
+import numpy as np
+
+from compact_mesh import CompactMesh
+from shapes import parse_matrix
+
+REGION_RINGS = 2  # Vertex rings around edited faces that the local repair may touch
+
+
+def defect_map_path(output_path):
+    return os.path.splitext(output_path)[0] + '.defects.i32'
+
+
+def defect_faces(mesh):
+    """Indices of faces with an edge not shared by exactly two faces."""
+    f = mesh.faces.astype(np.int64)
+    a = np.concatenate([f[:, 0], f[:, 1], f[:, 2]])
+    b = np.concatenate([f[:, 1], f[:, 2], f[:, 0]])
+    keys = np.minimum(a, b) * len(mesh.vertices) + np.maximum(a, b)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    bad = (counts != 2)[inverse.reshape(-1)].reshape(3, -1).any(axis=0)
+    return np.flatnonzero(bad).astype(np.int32)
+
+
+def write_defect_map(mesh, output_path):
+    defect_faces(mesh).tofile(defect_map_path(output_path))
+
+
+def load_defect_map(path, mesh):
+    """
+    The defect map stored next to the mesh file at `path`, or computed from `mesh` if there
+    is none or it is older than the file (replaced by a reused or uploaded result).
+    """
+    map_path = defect_map_path(path)
+    if os.path.exists(map_path) and os.path.getmtime(map_path) >= os.path.getmtime(path):
+        defects = np.fromfile(map_path, dtype=np.int32)
+        if not len(defects) or defects.max() < len(mesh.faces):
+            return defects
+    return defect_faces(mesh)
+
+
+def validate_delta(delta):
+    """Checks a delta (dict) before a job is queued. Raises ValueError."""
+    if not any(delta.get(key) for key in ('faces', 'transform', 'shapes')):
+        raise ValueError("Empty delta: expected faces, transform and/or shapes")
+    if delta.get('transform') is not None:
+        matrix = parse_matrix(delta['transform'])
+        if abs(np.linalg.det(matrix[:3, :3])) < 1e-12:
+            raise ValueError("Transform is singular")
+    edit = delta.get('faces')
+    if edit:
+        vertices = edit.get('vertices') or []
+        faces = edit.get('faces')
+        if len(vertices) % 3 or (faces is None and len(vertices) % 9) or (faces is not None and len(faces) % 3):
+            raise ValueError("faces.vertices must be xyz triples and faces.faces index triples")
+        if faces and (min(faces) < 0 or max(faces) >= len(vertices) // 3):
+            raise ValueError("faces.faces index out of range")
+        if any(i < 0 for i in edit.get('remove') or []):
+            raise ValueError("faces.remove indices must be non-negative")
+
+
+def transformed(mesh, matrix):
+    """Copy of `mesh` under a 4x4 row-major matrix (winding flipped for mirroring matrices)."""
+    vertices = mesh.vertices.astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+    faces = mesh.faces if np.linalg.det(matrix[:3, :3]) > 0 else mesh.faces[:, ::-1]
+    return CompactMesh(vertices, faces)
+
+
+def splice(mesh, defects, edit):
+    """
+    Replaces edit['remove'] faces of `mesh` with the edit's geometry (welded onto the
+    surrounding vertices). Returns (mesh, region) where region flags the faces to re-repair:
+    new faces, the rings around removed ones and the remaining known defects.
+    """
+    remove = np.asarray(edit.get('remove') or [], dtype=np.int64)
+    if len(remove) and remove.max() >= len(mesh.faces):
+        raise ValueError(f"faces.remove index out of range ({len(mesh.faces):,} faces)")
+    keep = np.ones(len(mesh.faces), dtype=bool)
+    keep[remove] = False
+
+    # Vertices the edit touches: the removed faces' and any new vertex
+    touched = np.zeros(len(mesh.vertices), dtype=bool)
+    touched[mesh.faces[remove].reshape(-1)] = True
+    flagged = np.zeros(len(mesh.faces), dtype=bool)
+    flagged[defects] = True
+
+    vertices = np.asarray(edit.get('vertices') or [], dtype=np.float32).reshape(-1, 3)
+    faces = edit.get('faces')
+    faces = np.arange(len(vertices), dtype=np.int32) if faces is None else np.asarray(faces, dtype=np.int32)
+    faces = faces.reshape(-1, 3) + len(mesh.vertices)
+
+    spliced = CompactMesh(np.concatenate([mesh.vertices, vertices]),
+                          np.concatenate([mesh.faces[keep], faces])).welded()
+    touched = np.concatenate([touched, np.ones(len(vertices), dtype=bool)])
+    region = np.concatenate([flagged[keep], np.ones(len(faces), dtype=bool)])
+
+    # Map touched vertices through the weld (face order is unchanged by welded())
+    old_faces = np.concatenate([mesh.faces[keep], faces])
+    welded_touched = np.zeros(len(spliced.vertices), dtype=bool)
+    corner_touched = touched[old_faces.reshape(-1)]
+    welded_touched[spliced.faces.reshape(-1)[corner_touched]] = True
+    region |= welded_touched[spliced.faces].any(axis=1)
+    return spliced, grow_region(spliced, region)
+
+
+def grow_region(mesh, region, rings=REGION_RINGS):
+    """Face flags dilated by `rings` rings of shared vertices."""
+    for _ in range(rings):
+        marked = np.zeros(len(mesh.vertices), dtype=bool)
+        marked[mesh.faces[region].reshape(-1)] = True
+        region = marked[mesh.faces].any(axis=1)
+    return region
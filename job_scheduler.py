@@ -0,0 +1,211 @@
+import os
+import time
+import threading
+import numpy as np
+import memory_guard
+from job_store import instance_id, dumps
+from large_mesh import stl_face_count
+
+# Cost model (units: estimated seconds on one core). Rough fits from scripts/bench_repair.py:
+# Tier 1/2 scale with face count; reconstruction (alpha wrap / Poisson) adds a large,
+# mostly resolution-bound constant on top.
+COST_BASE = 0.5
+COST_PER_FACE = 4e-6
+COST_PER_MB = 0.02
+COST_RECONSTRUCTION = 60.0
+COST_RECONSTRUCTION_PER_FACE = 2e-5
+
+LEASE_SECONDS = 30.0       # Active jobs whose owner stops renewing for this long are re-queued
+PROBE_MAX_FACES = 200_000  # Defect probing is skipped above this (cost is then size-based only)
+OBJ_BYTES_PER_FACE = 60    # Rough ASCII OBJ density when we can't cheaply count faces
+
+
+def probe_defects(path, max_faces=PROBE_MAX_FACES):
+    """
+    Cheap topology probe for binary STLs: boundary and non-manifold edge counts after
+    exact vertex welding. Returns None when the file is too large or not binary STL.
+    """
+    count = stl_face_count(path)
+    if count is None or count == 0 or count > max_faces:
+        return None
+
+    dtype = np.dtype([('normal', '<f4', 3), ('verts', '<f4', (3, 3)), ('attr', '<u2')])
+    data = np.fromfile(path, dtype=dtype, offset=84, count=count)
+    corners = np.ascontiguousarray(data['verts'].reshape(-1, 3))
+    _, ids = np.unique(corners.view(np.dtype((np.void, 12))).reshape(-1), return_inverse=True)
+    faces = ids.reshape(-1, 3)
+
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    _, edge_counts = np.unique(edges[:, 0].astype(np.int64) * (faces.max() + 1) + edges[:, 1],
+                               return_counts=True)
+    degenerate = int(np.count_nonzero((faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2])
+                                      | (faces[:, 0] == faces[:, 2])))
+    return {
+        'boundary_edges': int(np.count_nonzero(edge_counts == 1)),
+        'non_manifold_edges': int(np.count_nonzero(edge_counts > 2)),
+        'degenerate_faces': degenerate,
+    }
+
+
+def estimate_cost(path, defects=None):
+    """
+    Estimated repair cost for a mesh file, from face count, file size and defect statistics.
+    Returns a dict with 'cost' plus the inputs used, so callers can log/show them.
+    """
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    faces = stl_face_count(path)
+    if faces is None:
+        faces = int(size_mb * 1024 * 1024 / (OBJ_BYTES_PER_FACE if path.lower().endswith('.obj') else 250))
+    if defects is None:
+        defects = probe_defects(path)
+
+    cost = COST_BASE + COST_PER_FACE * faces + COST_PER_MB * size_mb
+    if defects is None:
+        # Unknown: assume a coin flip on needing reconstruction
+        reconstruction = 0.5
+    else:
+        open_edges = defects.get('boundary_edges', 0) + defects.get('non_manifold_edges', 0)
+        # Many open/non-manifold edges relative to size usually defeat Tier 2
+        reconstruction = min(1.0, open_edges / max(faces * 0.001, 50.0))
+    cost += reconstruction * (COST_RECONSTRUCTION + COST_RECONSTRUCTION_PER_FACE * faces)
+
+    return {'cost': round(cost, 2), 'faces': faces, 'size_mb': round(size_mb, 2), 'defects': defects}
+
+
+class JobScheduler:
+    """
+    Shortest-job-first dispatcher with aging and an optional large-job lane.
+
+    A waiting job's effective cost is `cost - aging_rate * waited`; since every job ages at
+    the same rate this equals the static key `cost + aging_rate * submitted`, so the queue is
+    a plain ORDER BY. Jobs at or above `large_cost` may only use `large_workers` of the
+    `workers` slots, keeping the rest as a fast lane for interactive-sized repairs.
+
+    Queue and slot accounting live in the shared JobStore, so every API worker process runs
+    its own scheduler and they cooperate: claims are atomic and slots are machine-wide.
+    The caller drives it: submit() enqueues, poll() reaps local processes and dispatches.
+    Both may be called from any thread (the API server runs them off its event loop).
+    """
+
+    def __init__(self, store, launch, workers, aging_rate=0.5, large_cost=120.0, large_workers=None,
+                 owner=None, lease=LEASE_SECONDS):
+        self.store = store
+        self.launch = launch          # launch(job_row) -> started Process
+        self.workers = max(0, workers)  # 0: remote agents only (see worker_agent.py)
+        self.aging_rate = aging_rate
+        self.large_cost = large_cost
+        self.large_workers = self.workers if large_workers is None else min(max(1, large_workers), self.workers)
+        self.owner = owner or instance_id()
+        self.lease = lease
+        self._local = {}              # job_id -> (generation, attempt, Process) launched by this process
+        self._last_renew = 0.0
+        self._lock = threading.RLock()  # Guards _local across the threads driving the scheduler
+
+    def lane(self, cost):
+        return 'large' if cost >= self.large_cost else 'small'
+
+    def submit(self, job_id, **fields):
+        """Queue a job (fields as JobStore.create_job; 'cost' drives ordering). Returns its queue position."""
+        cost = fields.get('cost', 0.0)
+        with self._lock:
+            self.cancel(job_id)  # Re-submitting replaces any earlier run
+            self.store.create_job(job_id, status='queued', lane=self.lane(cost), **fields)
+            self.poll()
+        return self.position(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            cancelled = self.store.cancel_job(job_id)
+            local = self._local.pop(job_id, None)
+        if local is not None and local[2].is_alive():
+            local[2].terminate()
+        return cancelled
+
+    def poll(self):
+        """Reap finished local jobs, renew their leases and start waiting jobs while slots are free."""
+        with self._lock:
+            return self._poll()
+
+    def _poll(self):
+        for job_id, (generation, attempt, process) in list(self._local.items()):
+            job = self.store.get_job(job_id)
+            if (job is None or job['generation'] != generation or job['attempt'] != attempt
+                    or job['status'] in ('cancelled', 'queued')):
+                # Replaced, cancelled, or our lease lapsed and the job went back to the queue
+                if process.is_alive():
+                    process.terminate()
+                del self._local[job_id]
+            elif not process.is_alive():
+                del self._local[job_id]
+                if job['status'] in ('done', 'error'):
+                    continue
+                if memory_guard.is_memory_failure(process.exitcode):
+                    self.retry_lower_memory(job, generation, attempt)
+                else:
+                    # Died without sending 'done' or 'error': assume crash
+                    self.store.record(job_id, 'error', 'Process terminated unexpectedly', attempt)
+
+        # Lease bookkeeping is a few writes; once a second is plenty against a 30 s lease
+        now = time.time()
+        if now - self._last_renew >= 1.0:
+            self._last_renew = now
+            self.store.heartbeat(self.owner)
+            self.store.renew_leases(self.owner, list(self._local), self.lease)
+            self.store.expire_leases()
+
+        started = []
+        while True:
+            job = self.store.claim_next(self.owner, self.workers, self.large_workers, self.aging_rate, self.lease)
+            if job is None:
+                break
+            stale = self._local.pop(job['job_id'], None)
+            if stale is not None and stale[2].is_alive():
+                stale[2].terminate()  # Earlier attempt of a job we just re-claimed
+            try:
+                self._local[job['job_id']] = (job['generation'], job['attempt'], self.launch(job))
+                started.append(job['job_id'])
+            except Exception as e:
+                self.store.record(job['job_id'], 'error', f"Failed to start worker: {e}", job['attempt'])
+        return started
+
+    def retry_lower_memory(self, job, generation, attempt):
+        """Restarts a job that hit its memory ceiling one rung down memory_guard's ladder, in the same slot."""
+        job_id = job['job_id']
+        limit = memory_guard.worker_memory_limit_mb(job['options'])
+        self.store.update_job(job_id, peak_memory_mb=max(job['peak_memory_mb'] or 0, limit))
+        options = memory_guard.downgrade_options(job['options'], job['input_path'])
+        if options is None:
+            self.store.record(job_id, 'error', f"Out of memory (limit {limit:.0f} MB) even at the lowest settings", attempt)
+            return
+        self.store.update_job(job_id, options=dumps(options))
+        self.store.record(job_id, 'status', f"Out of memory; retrying at memory level {options['memory_level']}", attempt)
+        job['options'] = options
+        try:
+            self._local[job_id] = (generation, attempt, self.launch(job))
+        except Exception as e:
+            self.store.record(job_id, 'error', f"Failed to start worker: {e}", attempt)
+
+    def position(self, job_id):
+        """1-based dispatch order among waiting jobs (0 if not waiting)."""
+        return self.store.queue_position(job_id, self.aging_rate)
+
+    def shutdown(self):
+        with self._lock:
+            for _, _, process in self._local.values():
+                if process.is_alive():
+                    process.terminate()
+            self._local.clear()
+
+    def snapshot(self):
+        now = time.time()
+        running = self.store.list_jobs(('starting', 'running'))
+        waiting = self.store.list_jobs(('queued',))
+        return {
+            'workers': self.workers,
+            'large_workers': self.large_workers,
+            'running': [{'job_id': j['job_id'], 'cost': j['cost'], 'lane': j['lane'], 'owner': j['owner'],
+                         'running_s': round(now - (j['started'] or now), 1)} for j in running],
+            'waiting': sorted(({'job_id': j['job_id'], 'cost': j['cost'], 'lane': j['lane'],
+                                'waiting_s': round(now - j['submitted'], 1)} for j in waiting),
+                              key=lambda w: w['cost'] - self.aging_rate * w['waiting_s']),
+        }
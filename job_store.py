@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+DB_PATH = os.environ.get('NAOSHI_JOB_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'naoshi_jobs.db'))
+
+ACTIVE_STATUSES = ('starting', 'running')
+TERMINAL_STATUSES = ('done', 'error', 'cancelled')
+INSTANCE_TTL = 10.0  # seconds without a heartbeat before an API worker counts as gone
+MAX_ATTEMPTS = 3     # runs per job before a lost worker fails it instead of re-queueing
+REFINE_DELAY = 120.0  # seconds a refinement queues behind: it ranks as if submitted this much later
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    input_path TEXT,
+    output_path TEXT,
+    filename TEXT,
+    cleanup_path TEXT,
+    options TEXT,
+    cost REAL NOT NULL DEFAULT 0,
+    lane TEXT NOT NULL DEFAULT 'small',
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    attempt INTEGER NOT NULL DEFAULT 0,
+    remote INTEGER NOT NULL DEFAULT 0,
+    repair_key TEXT,
+    peak_memory_mb REAL,
+    preview_ready INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    submitted REAL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    payload TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events (job_id, id);
+CREATE TABLE IF NOT EXISTS instances (
+    owner TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    file_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_hash ON uploads (content_hash);
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    upload_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    part_path TEXT NOT NULL,
+    file_id TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_blocks (
+    upload_id TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (upload_id, block)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    items TEXT NOT NULL,
+    created REAL NOT NULL
+);
+"""
+
+# Columns added after the first release of the schema (name -> definition)
+MIGRATIONS = {
+    'attempt': "INTEGER NOT NULL DEFAULT 0",
+    'remote': "INTEGER NOT NULL DEFAULT 0",
+    'repair_key': "TEXT",
+    'peak_memory_mb': "REAL",
+    'preview_ready': "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def instance_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _json_default(value):
+    # numpy scalars / arrays from the pipeline
+    if hasattr(value, 'item') and getattr(value, 'ndim', 0) == 0:
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value):
+    return json.dumps(value, default=_json_default)
+
+
+class JobStore:
+    """
+    Job state and progress events shared by every API worker process (SQLite, WAL mode).
+    Connections are per thread; each write is a short autocommit statement or an
+    explicit IMMEDIATE transaction, so readers never block writers.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        columns = {r['name'] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for name, definition in MIGRATIONS.items():
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Immediate(self._conn())
+
+    # --- Jobs ---
+
+    def create_job(self, job_id, **fields):
+        """Insert (or replace, bumping generation) a job and drop any events of the previous run."""
+        fields.setdefault('status', 'queued')
+        fields.setdefault('submitted', time.time())
+        if isinstance(fields.get('options'), dict):
+            fields['options'] = dumps(fields['options'])
+        with self._transaction() as conn:
+            row = conn.execute("SELECT generation FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+            fields['generation'] = row['generation'] + 1 if row else 0
+            conn.execute("DELETE FROM events WHERE job_id=?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id=?", (job_id,))
+            cols = ['job_id'] + list(fields)
+            conn.execute(f"INSERT INTO jobs ({','.join(cols)}) VALUES ({','.join('?' * len(cols))})",
+                         [job_id] + list(fields.values()))
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for key in ('options', 'result'):
+            if job[key]:
+                job[key] = json.loads(job[key])
+        return job
+
+    def update_job(self, job_id, **fields):
+        if not fields:
+            return
+        sets = ','.join(f"{k}=?" for k in fields)
+        self._conn().execute(f"UPDATE jobs SET {sets} WHERE job_id=?", list(fields.values()) + [job_id])
+
+    def cancel_job(self, job_id):
+        """Marks a queued/active job cancelled (dropping its events); its owner terminates the process on its next poll."""
+        with self._transaction() as conn:
+            cur = conn.execute(
+                f"UPDATE jobs SET status='cancelled', finished=? WHERE job_id=? AND status NOT IN {TERMINAL_STATUSES}",
+                (time.time(), job_id))
+            if cur.rowcount > 0:
+                conn.execute("DELETE FROM events WHERE job_id=?", (job_id,))
+        return cur.rowcount > 0
+
+    # --- Events ---
+
+    def record(self, job_id, msg_type, content, attempt=None):
+        """
+        Appends a worker message ('progress'/'status'/'preview'/'done'/'error') and applies its
+        state change. With `attempt`, messages from a run that has since lost its lease are
+        dropped too. 'preview' is the draft result of a progressive repair: the job keeps it as
+        its result, is marked preview-ready and goes back to the queue, behind new work (see
+        REFINE_DELAY), to be refined.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, attempt FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+            if row is None or row['status'] in TERMINAL_STATUSES:
+                return False  # Cancelled/replaced/finished: late messages are dropped
+            if attempt is not None and (row['attempt'] != attempt or row['status'] == 'queued'):
+                return False
+            event_id = conn.execute("INSERT INTO events (job_id, type, payload, created) VALUES (?,?,?,?)",
+                                    (job_id, msg_type, dumps(content), now)).lastrowid
+            if msg_type in ('done', 'error'):
+                # Finished: late readers only need this last event, so the run's history is dropped
+                conn.execute("DELETE FROM events WHERE job_id=? AND id<?", (job_id, event_id))
+            if msg_type == 'progress':
+                conn.execute("UPDATE jobs SET status='running', progress=? WHERE job_id=?", (content[1], job_id))
+            elif msg_type == 'status':
+                conn.execute("UPDATE jobs SET status='running' WHERE job_id=? AND status='starting'", (job_id,))
+            elif msg_type == 'preview':
+                conn.execute("UPDATE jobs SET status='queued', preview_ready=1, progress=0, result=?, owner=NULL, "
+                             "lease_expires=NULL, started=NULL, submitted=?, "
+                             "peak_memory_mb=MAX(COALESCE(peak_memory_mb, 0), ?) WHERE job_id=?",
+                             (dumps(content), now + REFINE_DELAY, content.get('peak_memory_mb') or 0, job_id))
+            elif msg_type == 'done':
+                conn.execute("UPDATE jobs SET status='done', progress=1.0, result=?, finished=?, "
+                             "peak_memory_mb=MAX(COALESCE(peak_memory_mb, 0), ?) WHERE job_id=?",
+                             (dumps(content), now, content.get('peak_memory_mb') or 0, job_id))
+            elif msg_type == 'error':
+                conn.execute("UPDATE jobs SET status='error', error=?, finished=? WHERE job_id=?",
+                             (str(content), now, job_id))
+        return True
+
+    def events_after(self, job_id, after_id=0):
+        rows = self._conn().execute(
+            "SELECT id, type, payload FROM events WHERE job_id=? AND id>? ORDER BY id", (job_id, after_id)).fetchall()
+        return [(r['id'], r['type'], json.loads(r['payload'])) for r in rows]
+
+    # --- Scheduling ---
+
+    def claim_next(self, owner, workers, large_workers, aging_rate, lease, remote=False):
+        """
+        Atomically picks the next queued job for `owner` (shortest effective cost first, see
+        job_scheduler.JobScheduler) if a machine-wide slot is free. Returns the job or None.
+        Remote agents bring their own slots, so `remote` claims skip the local slot limits.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            if remote:
+                lanes = ('small', 'large')
+            else:
+                counts = dict(conn.execute(
+                    f"SELECT lane, COUNT(*) FROM jobs WHERE status IN {ACTIVE_STATUSES} AND remote=0 "
+                    "GROUP BY lane").fetchall())
+                if sum(counts.values()) >= workers:
+                    return None
+                lanes = ('small', 'large') if counts.get('large', 0) < large_workers else ('small',)
+            row = conn.execute(
+                f"SELECT job_id FROM jobs WHERE status='queued' AND lane IN ({','.join('?' * len(lanes))}) "
+                "ORDER BY cost + ? * submitted, submitted LIMIT 1", (*lanes, aging_rate)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status='starting', owner=?, lease_expires=?, started=?, "
+                         "attempt=attempt+1, remote=? WHERE job_id=?",
+                         (owner, now + lease, now, int(remote), row['job_id']))
+        return self.get_job(row['job_id'])
+
+    def renew_leases(self, owner, job_ids, lease):
+        if job_ids:
+            self._conn().execute(
+                f"UPDATE jobs SET lease_expires=? WHERE owner=? AND job_id IN ({','.join('?' * len(job_ids))})",
+                (time.time() + lease, owner, *job_ids))
+
+    def touch_lease(self, job_id, owner, attempt, lease):
+        """Renews one job's lease if `owner` still holds that attempt. Returns the job status or None if lost."""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, owner, attempt FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+            if row is None or row['owner'] != owner or row['attempt'] != attempt or row['status'] == 'queued':
+                return None
+            if row['status'] in ACTIVE_STATUSES:
+                conn.execute("UPDATE jobs SET lease_expires=? WHERE job_id=?", (time.time() + lease, job_id))
+        return row['status']
+
+    def expire_leases(self, max_attempts=MAX_ATTEMPTS):
+        """
+        Re-queues active jobs whose owner stopped renewing (worker or agent gone), or fails
+        them once they have used `max_attempts` runs. Returns their ids.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(f"SELECT job_id, attempt FROM jobs WHERE status IN {ACTIVE_STATUSES} "
+                                "AND lease_expires<?", (now,)).fetchall()
+            for row in rows:
+                if row['attempt'] < max_attempts:
+                    message = f"Worker lost, re-queued (attempt {row['attempt'] + 1} of {max_attempts})"
+                    conn.execute("INSERT INTO events (job_id, type, payload, created) VALUES (?,?,?,?)",
+                                 (row['job_id'], 'status', dumps(message), now))
+                    conn.execute("UPDATE jobs SET status='queued', progress=0, owner=NULL, lease_expires=NULL, "
+                                 "started=NULL WHERE job_id=?", (row['job_id'],))
+                    continue
+                conn.execute("DELETE FROM events WHERE job_id=?", (row['job_id'],))
+                conn.execute("INSERT INTO events (job_id, type, payload, created) VALUES (?,?,?,?)",
+                             (row['job_id'], 'error', dumps('Worker lost (lease expired)'), now))
+                conn.execute("UPDATE jobs SET status='error', error=?, finished=? WHERE job_id=?",
+                             ('Worker lost (lease expired)', now, row['job_id']))
+        return [r['job_id'] for r in rows]
+
+    def queue_position(self, job_id, aging_rate):
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM jobs j, jobs me WHERE me.job_id=? AND me.status='queued' AND j.status='queued' "
+            "AND j.cost + ? * j.submitted <= me.cost + ? * me.submitted", (job_id, aging_rate, aging_rate)).fetchone()
+        return row[0]
+
+    def list_jobs(self, statuses):
+        rows = self._conn().execute(
+            f"SELECT job_id, status, cost, lane, owner, submitted, started FROM jobs "
+            f"WHERE status IN ({','.join('?' * len(statuses))})", tuple(statuses)).fetchall()
+        return [dict(r) for r in rows]
+
+    def find_done_job(self, repair_key):
+        """Most recent finished job with this repair key (same input content and settings), or None."""
+        row = self._conn().execute(
+            "SELECT job_id FROM jobs WHERE repair_key=? AND status='done' ORDER BY finished DESC LIMIT 1",
+            (repair_key,)).fetchone()
+        return self.get_job(row['job_id']) if row else None
+
+    def count_jobs(self):
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    # --- Batches ---
+
+    def create_batch(self, batch_id, items):
+        """items: [{'job_id', 'name'}] in upload order (one job per part)."""
+        self._conn().execute("INSERT INTO batches (batch_id, items, created) VALUES (?,?,?)",
+                             (batch_id, dumps(items), time.time()))
+
+    def get_batch(self, batch_id):
+        row = self._conn().execute("SELECT * FROM batches WHERE batch_id=?", (batch_id,)).fetchone()
+        return {'batch_id': row['batch_id'], 'items': json.loads(row['items']), 'created': row['created']} if row else None
+
+    def batch_jobs(self, job_ids):
+        """{job_id: row} with the state a batch reports (one query for the whole batch)."""
+        rows = self._conn().execute(
+            f"SELECT job_id, status, progress, output_path, result, error, finished FROM jobs "
+            f"WHERE job_id IN ({','.join('?' * len(job_ids))})", tuple(job_ids)).fetchall()
+        jobs = {}
+        for r in rows:
+            job = dict(r)
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            jobs[job['job_id']] = job
+        return jobs
+
+    # --- Uploads ---
+
+    def add_upload(self, file_id, content_hash, size, path):
+        self._conn().execute("INSERT OR REPLACE INTO uploads (file_id, content_hash, size, path, created) "
+                             "VALUES (?,?,?,?,?)", (file_id, content_hash, size, path, time.time()))
+
+    def get_upload(self, file_id):
+        row = self._conn().execute("SELECT * FROM uploads WHERE file_id=?", (file_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_uploads(self, content_hash, size):
+        rows = self._conn().execute("SELECT * FROM uploads WHERE content_hash=? AND size=? ORDER BY created",
+                                    (content_hash, size)).fetchall()
+        return [dict(r) for r in rows]
+
+    def create_upload_session(self, upload_id, filename, size, part_path):
+        self._conn().execute("INSERT INTO upload_sessions (upload_id, filename, size, part_path, created) "
+                             "VALUES (?,?,?,?,?)", (upload_id, filename, size, part_path, time.time()))
+
+    def get_upload_session(self, upload_id):
+        row = self._conn().execute("SELECT * FROM upload_sessions WHERE upload_id=?", (upload_id,)).fetchone()
+        return dict(row) if row else None
+
+    def add_upload_blocks(self, upload_id, digests):
+        """Records the digests of blocks written for a session ([(block, digest)], re-sends overwrite)."""
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO upload_blocks (upload_id, block, digest) VALUES (?,?,?)",
+                             [(upload_id, block, digest) for block, digest in digests])
+
+    def upload_blocks(self, upload_id):
+        """{block: digest} received so far."""
+        rows = self._conn().execute("SELECT block, digest FROM upload_blocks WHERE upload_id=?", (upload_id,))
+        return {r['block']: r['digest'] for r in rows}
+
+    def finish_upload_session(self, upload_id, file_id):
+        with self._transaction() as conn:
+            conn.execute("UPDATE upload_sessions SET file_id=? WHERE upload_id=?", (file_id, upload_id))
+            conn.execute("DELETE FROM upload_blocks WHERE upload_id=?", (upload_id,))
+
+    def clear_uploads(self):
+        """Forgets all uploads and sessions (their files are wiped with the temp folder)."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM uploads")
+            conn.execute("DELETE FROM upload_sessions")
+            conn.execute("DELETE FROM upload_blocks")
+
+    # --- API worker instances ---
+
+    def heartbeat(self, owner):
+        self._conn().execute("INSERT OR REPLACE INTO instances (owner, heartbeat) VALUES (?,?)", (owner, time.time()))
+
+    def register_instance(self, owner):
+        """Registers an API worker. Returns True if no other live instance exists (first one up)."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM instances WHERE heartbeat<?", (now - INSTANCE_TTL,))
+            others = conn.execute("SELECT COUNT(*) FROM instances WHERE owner!=?", (owner,)).fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO instances (owner, heartbeat) VALUES (?,?)", (owner, now))
+        return others == 0
+
+    def unregister_instance(self, owner):
+        self._conn().execute("DELETE FROM instances WHERE owner=?", (owner,))
+
+    def fail_orphans(self, message="Server restarted"):
+        """On a cold start nothing can still be running: fail whatever the last run left behind."""
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM events WHERE job_id IN "
+                         f"(SELECT job_id FROM jobs WHERE status NOT IN {TERMINAL_STATUSES})")
+            conn.execute(f"UPDATE jobs SET status='error', error=?, finished=? "
+                         f"WHERE status NOT IN {TERMINAL_STATUSES}", (message, time.time()))
+
+
+class _Immediate:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK context (takes the write lock up front)."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class JobEventQueue:
+    """
+    Queue-like sink handed to repair_worker in place of multiprocessing.Queue:
+    put((type, content)) records the event straight into the shared store.
+    Picklable (only the DB path, job id and attempt travel to the child process).
+    """
+
+    def __init__(self, path, job_id, attempt=None):
+        self.path = path
+        self.job_id = job_id
+        self.attempt = attempt
+        self._store = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'path': self.path, 'job_id': self.job_id, 'attempt': self.attempt}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['job_id'], state.get('attempt'))
+
+    def put(self, item):
+        msg_type, content = item
+        with self._lock:  # repair_worker's heartbeat thread also puts
+            if self._store is None:
+                self._store = JobStore(self.path)
+            self._store.record(self.job_id, msg_type, content, self.attempt)
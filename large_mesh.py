@@ -0,0 +1,314 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Large-mesh mode: binary STLs too big for the in-memory pipeline are welded, cleaned and
+# validated in spatial slabs through memory-mapped scratch files, then written out in chunks.
+# Peak RSS scales with the slab/chunk sizes below (plus ~0.35 bytes per input byte for the
+# corner->vertex map and vertex table), not with the full mesh.
+
+STL_DTYPE = np.dtype([('normal', '<f4', 3), ('verts', '<f4', (3, 3)), ('attr', '<u2')])
+CORNER_DTYPE = np.dtype([('p', '<f4', 3), ('c', '<i8')])
+
+FACE_CHUNK = 500_000         # faces per streamed chunk (~25 MB of STL records)
+SLAB_CORNERS = 3_000_000     # corners welded per slab (~150 MB working set)
+FACE_PART = 2_000_000        # faces per duplicate/edge partition
+HIST_BINS = 4096
+SAMPLE_POINTS = 1_000_000    # oriented points fed to Poisson when the mesh needs reconstruction
+POISSON_DEPTH = 9
+
+# Peak RSS per input byte: the in-memory pipeline peaked at 1.5 GB on a 48 MB (1M-face) STL;
+# large-mesh mode at 0.5 GB on a 300 MB (6M-face) one. Poisson adds a fixed ~1.3 GB at depth 9.
+IN_MEMORY_BYTES_PER_BYTE = 32
+LARGE_MODE_BYTES_PER_BYTE = 1.5
+MIN_UPLOAD_MB = 100
+
+
+def stl_face_count(path):
+    """Face count from a binary STL header (None for ASCII STL / other formats / unreadable files)."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    if size < 84:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(80)
+        count = int.from_bytes(f.read(4), 'little')
+    return count if 84 + 50 * count == size else None
+
+
+def total_memory_mb():
+    """Physical memory in MB (None if it can't be determined)."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().total / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def memory_budget_mb():
+    """Memory one repair may use: NAOSHI_MEMORY_BUDGET_MB, else half of physical memory."""
+    env = os.environ.get('NAOSHI_MEMORY_BUDGET_MB')
+    if env:
+        return float(env)
+    total = total_memory_mb()
+    return total / 2 if total else 4096.0
+
+
+def upload_limit_bytes():
+    """Largest accepted upload: NAOSHI_MAX_UPLOAD_MB, else what large-mesh mode fits in the budget."""
+    env = os.environ.get('NAOSHI_MAX_UPLOAD_MB')
+    if env:
+        return int(float(env) * 1024 * 1024)
+    derived = memory_budget_mb() / LARGE_MODE_BYTES_PER_BYTE
+    return int(max(MIN_UPLOAD_MB, derived) * 1024 * 1024)
+
+
+def in_memory_limit_bytes():
+    """Largest upload that has no large-mesh mode (OBJ, ASCII STL): what the in-memory pipeline fits in the budget."""
+    derived = memory_budget_mb() / IN_MEMORY_BYTES_PER_BYTE * 1024 * 1024
+    return int(min(upload_limit_bytes(), derived))
+
+
+def binary_stl_size(header):
+    """File size a binary STL with these first 84 bytes must have (None if too short to tell)."""
+    if len(header) < 84:
+        return None
+    return 84 + 50 * int.from_bytes(header[80:84], 'little')
+
+
+def needs_large_mode(path, budget_mb=None):
+    """True for binary STLs whose in-memory repair would exceed the memory budget."""
+    if stl_face_count(path) is None:
+        return False
+    return exceeds_budget(os.path.getsize(path), budget_mb)
+
+
+def exceeds_budget(stl_bytes, budget_mb=None):
+    """True if repairing a binary STL of stl_bytes in memory would exceed the memory budget."""
+    budget = memory_budget_mb() if budget_mb is None else budget_mb
+    return stl_bytes * IN_MEMORY_BYTES_PER_BYTE / (1024 * 1024) > budget
+
+
+def window(path, dtype, start, count, shape=()):
+    """Read-only memmap over records [start, start+count) of a flat scratch file."""
+    dtype = np.dtype(dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=start * dtype.itemsize, shape=(count,) + shape)
+
+
+def iter_triangles(path, count, transform=None, chunk=FACE_CHUNK):
+    """Yields (first_face, (n, 3, 3) float32 corners) from a binary STL, optionally transformed."""
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        data = np.fromfile(path, dtype=STL_DTYPE, count=n, offset=84 + start * STL_DTYPE.itemsize)
+        tri = data['verts']
+        if transform is not None:
+            tri = (tri @ transform[:3, :3].T + transform[:3, 3]).astype(np.float32)
+        yield start, np.ascontiguousarray(tri)
+
+
+def iter_faces(path, count, chunk=FACE_CHUNK):
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        yield start, np.array(window(path, np.int32, start * 3, n * 3).reshape(-1, 3))
+
+
+def face_normals(tri):
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    length = np.linalg.norm(n, axis=1, keepdims=True)
+    return n / np.where(length > 0, length, 1), length[:, 0] / 2
+
+
+class Scratch:
+    """Temporary directory for memory-mapped intermediates (removed on close)."""
+
+    def __init__(self, base_dir=None):
+        self.dir = tempfile.mkdtemp(prefix='naoshi_large_', dir=base_dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def slab_bounds(path, count, transform, slabs):
+    """x thresholds splitting the corners into `slabs` roughly equal groups (from a histogram pass)."""
+    lo, hi = np.inf, -np.inf
+    for _, tri in iter_triangles(path, count, transform):
+        x = tri[..., 0]
+        lo, hi = min(lo, float(x.min())), max(hi, float(x.max()))
+    if slabs <= 1 or hi <= lo:
+        return np.empty(0, dtype=np.float32)
+
+    hist = np.zeros(HIST_BINS, dtype=np.int64)
+    for _, tri in iter_triangles(path, count, transform):
+        hist += np.histogram(tri[..., 0], bins=HIST_BINS, range=(lo, hi))[0]
+    cum = np.cumsum(hist)
+    targets = cum[-1] * np.arange(1, slabs) / slabs
+    edges = np.linspace(lo, hi, HIST_BINS + 1)
+    return np.unique(edges[1:][np.searchsorted(cum, targets)]).astype(np.float32)
+
+
+def weld(path, count, scratch, transform=None, log=None):
+    """
+    Exact vertex welding in x-slabs (identical positions always share a slab). Writes
+    'vertices.f32' (V x 3) and 'faces.i32' (F x 3) to scratch; returns the vertex count.
+    """
+    bounds = slab_bounds(path, count, transform, -(-3 * count // SLAB_CORNERS))
+    slab_paths = [scratch.path(f"slab_{k}.bin") for k in range(len(bounds) + 1)]
+    slab_files = [open(p, 'wb') for p in slab_paths]
+    try:
+        for start, tri in iter_triangles(path, count, transform):
+            corners = tri.reshape(-1, 3)
+            records = np.empty(len(corners), dtype=CORNER_DTYPE)
+            records['p'] = corners
+            records['c'] = np.arange(start * 3, start * 3 + len(corners))
+            slab = np.searchsorted(bounds, corners[:, 0], side='right')
+            order = np.argsort(slab, kind='stable')
+            splits = np.cumsum(np.bincount(slab, minlength=len(slab_files)))[:-1]
+            for f, part in zip(slab_files, np.split(records[order], splits)):
+                f.write(part.tobytes())
+    finally:
+        for f in slab_files:
+            f.close()
+
+    corner_map = np.memmap(scratch.path('faces.i32'), dtype=np.int32, mode='w+', shape=(3 * count,))
+    vertex_count = 0
+    with open(scratch.path('vertices.f32'), 'wb') as vf:
+        for k, slab_path in enumerate(slab_paths):
+            records = np.fromfile(slab_path, dtype=CORNER_DTYPE)
+            os.remove(slab_path)
+            if len(records) == 0:
+                continue
+            keys = np.ascontiguousarray(records['p']).view(np.dtype((np.void, 12))).reshape(-1)
+            unique, inverse = np.unique(keys, return_inverse=True)
+            vf.write(unique.tobytes())
+            corner_map[records['c']] = inverse.reshape(-1) + vertex_count
+            vertex_count += len(unique)
+            if log:
+                log(f"Welded slab {k + 1}/{len(slab_paths)}")
+    corner_map.flush()
+    del corner_map
+    return vertex_count
+
+
+def partition_write(files, parts, rows):
+    order = np.argsort(parts, kind='stable')
+    splits = np.cumsum(np.bincount(parts, minlength=len(files)))[:-1]
+    for f, chunk in zip(files, np.split(rows[order], splits)):
+        f.write(chunk.tobytes())
+
+
+def clean_faces(scratch, count, vertex_count):
+    """
+    Drops degenerate and duplicate faces, partitioned by lowest vertex id (duplicates always
+    share a partition). Writes 'clean.i32'; returns (faces kept, degenerate, duplicates).
+    """
+    parts = max(1, -(-count // FACE_PART))
+    part_paths = [scratch.path(f"part_{k}.i32") for k in range(parts)]
+    files = [open(p, 'wb') for p in part_paths]
+    degenerate = 0
+    try:
+        for _, faces in iter_faces(scratch.path('faces.i32'), count):
+            bad = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+            degenerate += int(np.count_nonzero(bad))
+            faces = faces[~bad]
+            part = (faces.min(axis=1).astype(np.int64) * parts // max(vertex_count, 1)).astype(np.intp)
+            partition_write(files, part, faces)
+    finally:
+        for f in files:
+            f.close()
+
+    kept = duplicates = 0
+    with open(scratch.path('clean.i32'), 'wb') as out:
+        for part_path in part_paths:
+            faces = np.fromfile(part_path, dtype=np.int32).reshape(-1, 3)
+            os.remove(part_path)
+            if len(faces) == 0:
+                continue
+            keys = np.ascontiguousarray(np.sort(faces, axis=1)).view(np.dtype((np.void, 12))).reshape(-1)
+            _, first = np.unique(keys, return_index=True)
+            duplicates += len(faces) - len(first)
+            faces = faces[np.sort(first)]
+            out.write(faces.tobytes())
+            kept += len(faces)
+    return kept, degenerate, duplicates
+
+
+def edge_stats(scratch, count, vertex_count):
+    """
+    Boundary / non-manifold / inconsistently wound edge counts of 'clean.i32', computed per
+    partition of the lower endpoint. Watertight and consistently wound when all are zero.
+    """
+    parts = max(1, -(-count // FACE_PART))
+    part_paths = [scratch.path(f"edges_{k}.i64") for k in range(parts)]
+    files = [open(p, 'wb') for p in part_paths]
+    try:
+        for _, faces in iter_faces(scratch.path('clean.i32'), count):
+            a = faces.reshape(-1).astype(np.int64)
+            b = faces[:, [1, 2, 0]].reshape(-1).astype(np.int64)
+            lo, hi = np.minimum(a, b), np.maximum(a, b)
+            keys = (lo * vertex_count + hi) * 2 + (a < b)
+            part = (lo * parts // max(vertex_count, 1)).astype(np.intp)
+            partition_write(files, part, keys)
+    finally:
+        for f in files:
+            f.close()
+
+    stats = {'boundary_edges': 0, 'non_manifold_edges': 0, 'inconsistent_edges': 0}
+    for part_path in part_paths:
+        keys = np.sort(np.fromfile(part_path, dtype=np.int64))
+        os.remove(part_path)
+        if len(keys) == 0:
+            continue
+        edge = keys >> 1
+        starts = np.flatnonzero(np.r_[True, edge[1:] != edge[:-1]])
+        counts = np.diff(np.r_[starts, len(edge)])
+        forward = np.add.reduceat(keys & 1, starts)
+        stats['boundary_edges'] += int(np.count_nonzero(counts == 1))
+        stats['non_manifold_edges'] += int(np.count_nonzero(counts > 2))
+        stats['inconsistent_edges'] += int(np.count_nonzero((counts == 2) & (forward != 1)))
+    stats['watertight'] = not any(stats[k] for k in ('boundary_edges', 'non_manifold_edges', 'inconsistent_edges'))
+    return stats
+
+
+def write_stl(path, vertices, faces_path, count, chunk=FACE_CHUNK):
+    """Streams an indexed mesh (faces read in chunks from a scratch file) to binary STL."""
+    with open(path, 'wb') as f:
+        f.write(b'Naoshi large-mesh export'.ljust(80, b' '))
+        f.write(int(count).to_bytes(4, 'little'))
+        for _, faces in iter_faces(faces_path, count, chunk):
+            tri = np.asarray(vertices[faces], dtype=np.float32)
+            records = np.zeros(len(faces), dtype=STL_DTYPE)
+            records['normal'] = face_normals(tri)[0]
+            records['verts'] = tri
+            f.write(records.tobytes())
+
+
+def sample_oriented_points(vertices, faces_path, count, samples=SAMPLE_POINTS, seed=0):
+    """Area-weighted surface samples with face normals, drawn chunk by chunk (two passes)."""
+    rng = np.random.default_rng(seed)
+    areas = np.array([face_normals(np.asarray(vertices[faces], dtype=np.float32))[1].sum()
+                      for _, faces in iter_faces(faces_path, count)])
+    per_chunk = rng.multinomial(samples, areas / areas.sum())
+
+    points, normals = [], []
+    for (_, faces), n in zip(iter_faces(faces_path, count), per_chunk):
+        if n == 0:
+            continue
+        tri = np.asarray(vertices[faces], dtype=np.float32)
+        nrm, area = face_normals(tri)
+        cdf = np.cumsum(area)
+        idx = np.minimum(np.searchsorted(cdf, np.sort(rng.random(n)) * cdf[-1], side='right'), len(tri) - 1)
+        r1 = np.sqrt(rng.random((n, 1)))
+        r2 = rng.random((n, 1))
+        points.append(tri[idx, 0] * (1 - r1) + tri[idx, 1] * (r1 * (1 - r2)) + tri[idx, 2] * (r1 * r2))
+        normals.append(nrm[idx])
+    return np.concatenate(points).astype(np.float64), np.concatenate(normals).astype(np.float64)
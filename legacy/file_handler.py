@@ -1,12 +1,15 @@
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from mesh_repair import analyze_stl, repair_mesh
-import threading
+
+ANALYSIS_WORKERS = 2 # Dropping many files queues their analysis instead of loading them all at once
 
 class FileManager:
     def __init__(self):
         self.files = [] # List of dicts {path, stats, status, output_path}
         self.processing = False
+        self.analysis_pool = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analyze")
         
     def add_file(self, filepath):
         if not filepath.lower().endswith('.stl'):
@@ -27,6 +30,8 @@ class FileManager:
 
     def analyze_file(self, file_data, callback=None):
         def _run():
+            if file_data not in self.files:
+                return # Removed while waiting for a free analysis slot
             try:
                 stats = analyze_stl(file_data['path'])
                 file_data['stats'] = stats
@@ -52,7 +57,7 @@ class FileManager:
             if callback:
                 callback(file_data)
                 
-        threading.Thread(target=_run).start()
+        self.analysis_pool.submit(_run)
 
     def remove_file(self, index):
         if 0 <= index < len(self.files):
@@ -8,6 +8,7 @@ import traceback
 from ui_components import FileListItem, DropZone
 from file_handler import FileManager
 from mesh_repair import repair_mesh
+from repair_queue import RepairQueue, default_workers
 
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
@@ -22,6 +23,8 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         
         self.file_manager = FileManager()
         self.file_items = [] # Store widgets
+        self.repair_queue = None
+        self.jobs = {} # job index -> {'data', 'item', 'output_path', 'started', 'progress', 'status', 'finished', 'failed'}
         
         self.setup_ui()
         
@@ -57,6 +60,14 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         
         self.chk_suffix = ctk.CTkCheckBox(self.controls_frame, text="Add '_fixed' suffix", variable=self.suffix_var)
         self.chk_suffix.pack(side="left", padx=20, pady=20)
+
+        # Simultaneous repairs (each is its own process)
+        self.workers_var = ctk.StringVar(value=str(default_workers()))
+        self.lbl_workers = ctk.CTkLabel(self.controls_frame, text="Parallel:")
+        self.lbl_workers.pack(side="left", padx=(20, 5), pady=20)
+        self.opt_workers = ctk.CTkOptionMenu(self.controls_frame, width=60, variable=self.workers_var,
+                                             values=[str(n) for n in range(1, max(2, os.cpu_count() or 1) + 1)])
+        self.opt_workers.pack(side="left", pady=20)
         
         # Buttons
         self.btn_repair = ctk.CTkButton(self.controls_frame, text="Repair All", command=self.start_repair)
@@ -67,8 +78,10 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         
         # Progress
         self.progress_bar = ctk.CTkProgressBar(self)
-        self.progress_bar.grid(row=3, column=0, padx=20, pady=(0, 20), sticky="ew")
+        self.progress_bar.grid(row=3, column=0, padx=20, pady=(0, 5), sticky="ew")
         self.progress_bar.set(0)
+        self.progress_label = ctk.CTkLabel(self, text="", anchor="w")
+        self.progress_label.grid(row=4, column=0, padx=20, pady=(0, 15), sticky="ew")
 
     def on_drop_event(self, event):
         files = self.tk.splitlist(event.data)
@@ -106,144 +119,105 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         self.file_items = []
 
     def start_repair(self):
-        if not self.file_manager.files:
+        if not self.file_manager.files or self.repair_queue is not None:
             return
         
         self.btn_repair.configure(state="disabled")
         self.progress_bar.set(0)
-        
-        threading.Thread(target=self.run_repair_process).start()
-        
+        self.run_repair_process()
+        
+    def output_path_for(self, input_path):
+        dir_name = os.path.dirname(input_path)
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        suffix = "_fixed" if self.suffix_var.get() else ""
+        if self.save_same_folder.get():
+            return os.path.join(dir_name, f"{name}{suffix}{ext}")
+        out_folder = os.path.join(dir_name, "fixed_meshes")
+        os.makedirs(out_folder, exist_ok=True)
+        return os.path.join(out_folder, f"{name}{suffix}{ext}")
+
     def run_repair_process(self):
         """
-        Multiprocessing Subprocess Manager.
-        Handles Watchdog, Progress Bars, and Sequential Execution.
+        Queues every file on a RepairQueue: up to N repair processes at once, all reporting
+        through one event reader thread. Events are applied on the UI thread; a UI timer
+        refreshes the per-file timers and the aggregated progress/ETA.
         """
-        import time
-        from multiprocessing import Process, Queue
-        from mesh_repair import repair_worker
-        import threading # Keep for legacy if needed, but we use Process
-
-        # We must run this Manager logic in a Thread so we don't block the UI
-        # while waiting for the Subprocess
-        def manager_thread():
-            total_files = len(self.file_manager.files)
-            
-            # Disable button during run
-            self.after(0, lambda: self.btn_repair.configure(state="disabled"))
-            
-            for file_index in range(total_files):
-                file_data = self.file_manager.files[file_index]
-                
-                # Determine paths
-                input_path = file_data['path']
-                dir_name = os.path.dirname(input_path)
-                base_name = os.path.basename(input_path)
-                name, ext = os.path.splitext(base_name)
-                
-                # Access UI var from main thread? CTk vars are usually thread safe-ish
-                # but better to get them via after or assume simple reads work
-                suffix = "_fixed" if self.suffix_var.get() else ""
-                
-                # Assuming self.chk_overwrite is a CTkCheckBox with a BooleanVar
-                # This line was missing in the original context, adding a placeholder for now
-                # If it's not defined, it will cause an error.
-                # For now, let's assume save_same_folder controls overwrite behavior
-                if self.save_same_folder.get(): # Using save_same_folder as a proxy for overwrite
-                    out_path = os.path.join(dir_name, f"{name}{suffix}{ext}")
-                else:
-                    out_folder = os.path.join(dir_name, "fixed_meshes")
-                    os.makedirs(out_folder, exist_ok=True)
-                    out_path = os.path.join(out_folder, f"{name}{suffix}{ext}")
-
-                # UI Setup for this file
-                file_item = self.file_items[file_index]
-                self.after(0, lambda fi=file_item: fi.update_status("Starting Subprocess...", "orange"))
-                self.after(0, lambda fi=file_item: fi.update_progress(0.0))
-                
-                # Create Queue and Process
-                q = Queue()
-                p = Process(target=repair_worker, args=(input_path, out_path, q))
-                p.start()
-                
-                # Watchdog State
-                start_time = time.time()
-                last_heartbeat = time.time()
-                current_status_text = "Initializing..."
-                file_done = False
-                
-                while p.is_alive() and not file_done:
-                    # 1. READ QUEUE
-                    while not q.empty():
-                        try:
-                            msg_type, content = q.get_nowait()
-                            last_heartbeat = time.time() # Reset Watchdog
-                            
-                            if msg_type == 'status':
-                                current_status_text = content
-                                self.after(0, lambda fi=file_item, c=content: fi.update_status(c, "#64C8FF"))
-                            elif msg_type == 'progress':
-                                text, val = content
-                                current_status_text = text
-                                file_item._last_progress = val  # Store for ETA calc
-                                self.after(0, lambda fi=file_item, t=text: fi.update_status(t, "#64C8FF"))
-                                self.after(0, lambda fi=file_item, v=val: fi.update_progress(v))
-                                # Global bar
-                                global_base = file_index / total_files
-                                global_val = global_base + (val / total_files)
-                                self.after(0, lambda g=global_val: self.progress_bar.set(g))
-                            elif msg_type == 'done':
-                                self.after(0, lambda fi=file_item: fi.update_status("Fixed! (Sharper) ✓", "#00E676"))
-                                self.after(0, lambda fi=file_item: fi.update_progress(1.0))
-                                file_done = True
-                            elif msg_type == 'error':
-                                self.after(0, lambda fi=file_item, c=content: fi.update_status("Error ❌", "#FF5252", c)) # Red
-                                print(f"Subprocess Error: {content}")
-                                file_done = True
-                        except:
-                            break
-                    
-                    # 2. WATCHDOG & LIVE TIMER WITH ETA
-                    elapsed_total = time.time() - start_time
-                    hang_time = time.time() - last_heartbeat
-                    
-                    if not file_done:
-                        # Calculate ETA based on progress
-                        # Get current progress from file_item's progress bar
-                        # We track it via the last 'progress' message val
-                        current_prog = getattr(file_item, '_last_progress', 0.1) or 0.1
-                        
-                        if current_prog > 0.01:
-                            estimated_total = elapsed_total / current_prog
-                            remaining = max(0, estimated_total - elapsed_total)
-                            eta_str = f"~{remaining:.0f}s left"
-                        else:
-                            eta_str = "calculating..."
-                        
-                        timer_msg = f"{current_status_text} ({elapsed_total:.0f}s / {eta_str})"
-                        self.after(0, lambda fi=file_item, t=timer_msg: fi.update_status(t, "#64C8FF"))
-                    
-                    if hang_time > 300: # 5 Minute Timeout (max)
-                         print(f"Watchdog detecting hang on {base_name}...")
-                         self.after(0, lambda fi=file_item: fi.update_status("HUNG - KILLING...", "#FF5252"))
-                         p.terminate()
-                         p.join()
-                         self.after(0, lambda fi=file_item: fi.update_status("Failed (Hang) ❌", "#FF5252"))
-                         file_done = True
-                    
-                    time.sleep(0.1)
-                
-                p.join()
-                
-                # Ensure 100% on global if not done
-                self.after(0, lambda p=(file_index+1)/total_files: self.progress_bar.set(p))
+        self.jobs = {}
+        self.repair_started = time.time()
+        self.repair_queue = RepairQueue(int(self.workers_var.get()),
+                                        on_event=lambda *event: self.after(0, lambda: self.on_repair_event(*event)),
+                                        on_finished=lambda: self.after(0, self.on_repair_finished))
+        for index, (file_data, file_item) in enumerate(zip(list(self.file_manager.files), list(self.file_items))):
+            output_path = self.output_path_for(file_data['path'])
+            self.jobs[index] = {'data': file_data, 'item': file_item, 'output_path': output_path, 'started': None,
+                                'progress': 0.0, 'status': "Queued", 'finished': False, 'failed': False}
+            file_item.update_status("Queued", "gray")
+            file_item.update_progress(0.0)
+            self.repair_queue.submit(index, file_data['path'], output_path)
+        self.repair_queue.start()
+        self.after(500, self.refresh_repair_progress)
+
+    def on_repair_event(self, index, msg_type, content):
+        job = self.jobs.get(index)
+        if job is None:
+            return
+        item = job['item']
+        if msg_type == 'started':
+            job['started'] = time.time()
+            job['status'] = "Starting Subprocess..."
+            item.update_status(job['status'], "orange")
+        elif msg_type == 'status':
+            job['status'] = content
+            item.update_status(content, "#64C8FF")
+        elif msg_type == 'progress':
+            text, val = content
+            job['status'], job['progress'] = text, val
+            item.update_status(text, "#64C8FF")
+            item.update_progress(val)
+        elif msg_type == 'done':
+            job['finished'], job['progress'] = True, 1.0
+            job['data']['output_path'] = job['output_path']
+            item.update_status("Fixed! (Sharper) ✓", "#00E676")
+            item.update_progress(1.0)
+        elif msg_type == 'error':
+            job['finished'], job['failed'], job['progress'] = True, True, 1.0
+            item.update_status("Error ❌", "#FF5252", content) # Red
+            print(f"Subprocess Error: {content}")
+
+    def refresh_repair_progress(self):
+        """Per-file live timers and the global bar/ETA across all parallel jobs."""
+        if not self.jobs:
+            return
+        now = time.time()
+        for job in self.jobs.values():
+            if job['started'] is None or job['finished']:
+                continue
+            elapsed = now - job['started']
+            if job['progress'] > 0.01:
+                eta_str = f"~{max(0, elapsed / job['progress'] - elapsed):.0f}s left"
+            else:
+                eta_str = "calculating..."
+            job['item'].update_status(f"{job['status']} ({elapsed:.0f}s / {eta_str})", "#64C8FF")
 
-            # All Done
-            self.after(0, lambda: self.btn_repair.configure(state="normal"))
+        total = len(self.jobs)
+        overall = sum(job['progress'] for job in self.jobs.values()) / total
+        finished = sum(1 for job in self.jobs.values() if job['finished'])
+        running = sum(1 for job in self.jobs.values() if job['started'] and not job['finished'])
+        self.progress_bar.set(overall)
+        elapsed = now - self.repair_started
+        eta = f"~{elapsed / overall - elapsed:.0f}s left" if overall > 0.02 else "calculating..."
+        self.progress_label.configure(text=f"{finished}/{total} done, {running} running - {elapsed:.0f}s elapsed, {eta}")
+        if self.repair_queue is not None:
+            self.after(500, self.refresh_repair_progress)
 
-        # Run the manager in a thread so GUI doesn't freeze
-        import threading
-        threading.Thread(target=manager_thread).start()
+    def on_repair_finished(self):
+        self.repair_queue = None
+        self.refresh_repair_progress()
+        elapsed = time.time() - self.repair_started
+        failed = sum(1 for job in self.jobs.values() if job['failed'])
+        self.progress_bar.set(1.0)
+        self.progress_label.configure(text=f"All done in {elapsed:.0f}s" + (f" ({failed} failed)" if failed else ""))
+        self.btn_repair.configure(state="normal")
 
 if __name__ == "__main__":
     # Windows Multiprocessing Support
@@ -0,0 +1,153 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+
+from mesh_repair import repair_worker
+from large_mesh import memory_budget_mb
+import memory_guard
+
+HANG_TIMEOUT = 300  # 5 Minute Timeout (max) without any message from a repair
+TICK = 0.5          # Reader wakes at least this often to check for dead or hung processes
+
+
+def default_workers():
+    return max(1, min(4, (os.cpu_count() or 2) // 2))
+
+
+class TaggedQueue:
+    """Result queue handed to repair_worker: tags every message with its job id on the shared queue."""
+
+    def __init__(self, events, job_id):
+        self.events = events
+        self.job_id = job_id
+
+    def put(self, msg):
+        self.events.put((self.job_id, msg))
+
+
+class RepairQueue:
+    """
+    Repairs queued files in up to `workers` simultaneous processes.
+
+    Every process reports on one shared multiprocessing queue, read by a single thread that
+    forwards on_event(job_id, msg_type, content) for 'started', 'status', 'progress', 'done'
+    and 'error'. It also restarts memory failures one rung down memory_guard's ladder and
+    kills processes that stay silent for HANG_TIMEOUT. on_finished() runs when the queue drains.
+    """
+
+    def __init__(self, workers, on_event, on_finished=None, hang_timeout=HANG_TIMEOUT):
+        self.workers = max(1, workers)
+        self.on_event = on_event
+        self.on_finished = on_finished
+        self.hang_timeout = hang_timeout
+        self.events = multiprocessing.Queue()
+        self.pending = []   # [(job_id, input_path, output_path, options)]
+        self.running = {}   # job_id -> {'process', 'input_path', 'output_path', 'options', 'last_message'}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, job_id, input_path, output_path, options=None):
+        options = dict(options or {})
+        if 'memory_limit_mb' not in options and not os.environ.get('NAOSHI_WORKER_MEMORY_MB'):
+            # Parallel repairs share the memory budget
+            options['memory_limit_mb'] = round(memory_budget_mb() / self.workers, 1)
+        self.pending.append((job_id, input_path, output_path, options))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._stop.set()
+
+    def _launch(self, job_id, input_path, output_path, options):
+        process = multiprocessing.Process(target=repair_worker, daemon=True,
+                                          args=(input_path, output_path, TaggedQueue(self.events, job_id), options))
+        process.start()
+        self.running[job_id] = {'process': process, 'input_path': input_path, 'output_path': output_path,
+                                'options': options, 'last_message': time.time()}
+
+    def _finish(self, job_id, msg_type, content):
+        job = self.running.pop(job_id, None)
+        if job is None:
+            return
+        job['process'].join(1)
+        self.on_event(job_id, msg_type, content)
+
+    def _dispatch(self, job_id, msg_type, content):
+        job = self.running.get(job_id)
+        if job is None:
+            return  # Late message from a process we already gave up on
+        job['last_message'] = time.time()
+        if msg_type in ('done', 'error'):
+            self._finish(job_id, msg_type, content)
+        else:
+            self.on_event(job_id, msg_type, content)
+
+    def _check_processes(self):
+        """Restarts or fails processes that died without reporting, and kills hung ones."""
+        # Read everything already sent first, so a 'done' still in the pipe isn't taken for a crash
+        while True:
+            try:
+                job_id, (msg_type, content) = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(job_id, msg_type, content)
+
+        now = time.time()
+        for job_id, job in list(self.running.items()):
+            process = job['process']
+            if not process.is_alive():
+                options = None
+                if memory_guard.is_memory_failure(process.exitcode):
+                    options = memory_guard.downgrade_options(job['options'], job['input_path'])
+                if options is not None:
+                    self.on_event(job_id, 'status', f"Out of memory; retrying at memory level {options['memory_level']}")
+                    self._launch(job_id, job['input_path'], job['output_path'], options)
+                else:
+                    self._finish(job_id, 'error', 'Out of memory even at the lowest settings'
+                                 if memory_guard.is_memory_failure(process.exitcode) else 'Process terminated unexpectedly')
+            elif now - job['last_message'] > self.hang_timeout:
+                print(f"Watchdog detecting hang on {os.path.basename(job['input_path'])}...")
+                stop_process(process)
+                self._finish(job_id, 'error', 'Failed (Hang)')
+
+    def _run(self):
+        last_check = time.time()
+        try:
+            while not self._stop.is_set() and (self.pending or self.running):
+                while self.pending and len(self.running) < self.workers:
+                    job_id, input_path, output_path, options = self.pending.pop(0)
+                    self._launch(job_id, input_path, output_path, options)
+                    self.on_event(job_id, 'started', None)
+
+                # One blocking read serves every running process
+                try:
+                    job_id, (msg_type, content) = self.events.get(timeout=TICK)
+                    self._dispatch(job_id, msg_type, content)
+                except queue.Empty:
+                    pass
+
+                if time.time() - last_check >= TICK:
+                    last_check = time.time()
+                    self._check_processes()
+        finally:
+            for job in self.running.values():
+                stop_process(job['process'])
+            for job_id in list(self.running):
+                self.on_event(job_id, 'error', 'Cancelled')
+            self.running.clear()
+            self.pending.clear()
+            if self.on_finished:
+                self.on_finished()
+
+
+def stop_process(process):
+    if process.is_alive():
+        process.terminate()
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import threading
+
+from large_mesh import memory_budget_mb
+from mesh_storage import stl_face_count
+
+# A repair process that crosses its ceiling exits with this code; the owner (API scheduler
+# or worker agent) then restarts it one rung further down the downgrade ladder.
+MEMORY_EXIT_CODE = 86
+WATCHDOG_INTERVAL = 0.2
+
+# Projected peak (MB above the process baseline). Poisson from the depth-9 Tier 4 and the
+# large-mesh sampler (~1.3 GB at depth 9); the rest are conservative guesses to be tuned
+# from bench_repair.py's peak_memory_mb.
+POISSON_MB_BY_DEPTH = {5: 60, 6: 120, 7: 250, 8: 550, 9: 1300, 10: 3500, 11: 9000}
+ALPHA_WRAP_MB_PER_FACE = 0.004
+MIN_POISSON_DEPTH = 6
+
+# Downgrade ladder: settings merged into the repair options at each memory_level
+DOWNGRADE_LEVELS = [
+    {},
+    {'poisson_depth': 8, 'skip_alpha_wrap': True},
+    {'large_mode': True, 'poisson_depth': 8, 'sample_points': 500_000},
+    {'large_mode': True, 'poisson_depth': 7, 'sample_points': 250_000},
+]
+
+
+def worker_memory_limit_mb(options=None):
+    """Per-repair ceiling: options['memory_limit_mb'], else NAOSHI_WORKER_MEMORY_MB, else the memory budget."""
+    if options and options.get('memory_limit_mb'):
+        return float(options['memory_limit_mb'])
+    env = os.environ.get('NAOSHI_WORKER_MEMORY_MB')
+    return float(env) if env else memory_budget_mb()
+
+
+def current_rss_mb():
+    """Current resident set size in MB (None if unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def apply_address_limit(limit_mb):
+    """Hard RLIMIT_AS ceiling (NAOSHI_WORKER_ADDRESS_LIMIT_MB). Allocations past it raise MemoryError."""
+    try:
+        import resource
+    except ImportError:
+        return False
+    limit = int(limit_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return True
+
+
+class MemoryWatchdog:
+    """
+    Samples this process's RSS on a daemon thread and records the peak. Past `limit_mb`
+    it calls on_exceed(rss, limit) and exits the process with MEMORY_EXIT_CODE, since a
+    native filter can't be interrupted any other way.
+    """
+
+    def __init__(self, limit_mb, on_exceed=None, interval=WATCHDOG_INTERVAL):
+        self.limit_mb = limit_mb
+        self.on_exceed = on_exceed
+        self.interval = interval
+        self.peak_mb = current_rss_mb() or 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if current_rss_mb() is not None:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def headroom_mb(self):
+        return self.limit_mb - (current_rss_mb() or 0.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_mb()
+            self.peak_mb = max(self.peak_mb, rss)
+            if rss > self.limit_mb:
+                try:
+                    if self.on_exceed:
+                        self.on_exceed(rss, self.limit_mb)
+                        time.sleep(0.2)  # let queue feeder threads deliver the message
+                finally:
+                    sys.stdout.flush()
+                    os._exit(MEMORY_EXIT_CODE)
+
+
+def poisson_depth_within(headroom_mb, depth):
+    """Largest Poisson depth <= depth whose projected peak fits the headroom (MIN_POISSON_DEPTH at worst)."""
+    while depth > MIN_POISSON_DEPTH and POISSON_MB_BY_DEPTH.get(depth, float('inf')) > headroom_mb:
+        depth -= 1
+    return depth
+
+
+def alpha_wrap_fits(headroom_mb, faces):
+    return faces * ALPHA_WRAP_MB_PER_FACE <= headroom_mb
+
+
+def is_memory_failure(exitcode):
+    """Exit codes of a repair process killed by its own watchdog or by the kernel OOM killer (SIGKILL)."""
+    return exitcode in (MEMORY_EXIT_CODE, -9)
+
+
+def downgrade_options(options, input_path):
+    """
+    Options for the next rung of the ladder after a memory failure, or None when exhausted.
+    Large-mesh rungs need a binary STL and are skipped for other inputs.
+    """
+    options = dict(options or {})
+    level = options.get('memory_level', 0) + 1
+    binary_stl = stl_face_count(input_path) is not None
+    while level < len(DOWNGRADE_LEVELS):
+        settings = DOWNGRADE_LEVELS[level]
+        if binary_stl or not settings.get('large_mode'):
+            options.update(settings)
+            options['memory_level'] = level
+            return options
+        level += 1
+    return None
@@ -0,0 +1,118 @@
+"""
+Compact indexed mesh encoding for viewer downloads (binary STL stays the print file).
+
+Layout, little-endian:
+    header   magic 'NMSH', u16 version, u16 codec (1 gzip, 2 zstd), u32 vertices, u32 faces,
+             f32[3] origin, f32[3] step
+    body     compressed with the header's codec:
+             u16[vertices] x, then y, then z: positions quantized to 16 bits over the
+                           bounding box (origin + q * step), each plane delta-coded mod 2^16
+             u32[3 * faces] flattened face indices, delta-coded and zigzag-encoded
+
+Vertices are renumbered in order of first use, so index deltas stay small; face order is
+kept (face i is STL face i, as the editor and the deviation map assume).
+"""
+import os
+import gzip
+import struct
+import zlib
+
+import numpy as np
+
+import mesh_storage
+from compact_mesh import CompactMesh
+
+MEDIA_TYPE = 'application/vnd.naoshi.mesh'
+MAGIC = b'NMSH'
+VERSION = 1
+CODECS = {'gzip': 1, 'zstd': 2}
+HEADER = struct.Struct('<4sHHII3f3f')
+CHUNK = 4 * 1024 * 1024
+
+
+def zstd_available():
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def encoded_path(output_path, codec='gzip'):
+    return os.path.splitext(output_path)[0] + f'.{codec}.nmsh'
+
+
+def quantize(vertices):
+    """(origin, step, (N, 3) uint16) covering the bounding box in 65535 steps per axis."""
+    origin = vertices.min(axis=0) if len(vertices) else np.zeros(3, dtype=np.float32)
+    extent = (vertices.max(axis=0) - origin) if len(vertices) else np.zeros(3, dtype=np.float32)
+    step = np.where(extent > 0, extent / 65535.0, 1.0).astype(np.float32)
+    q = np.rint((vertices - origin) / step).clip(0, 65535).astype(np.uint16)
+    return origin.astype(np.float32), step, q
+
+
+def encode_file(mesh, path, codec='gzip', level=6):
+    """Writes `mesh` (a CompactMesh) to path in this encoding. Returns the encoded size."""
+    if codec == 'zstd':
+        import zstandard
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # gzip container
+
+    # Renumber vertices by first use (unreferenced ones are dropped)
+    flat = mesh.faces.reshape(-1)
+    used, first = np.unique(flat, return_index=True)
+    order = used[np.argsort(first)]
+    remap = np.zeros(len(mesh.vertices), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    origin, step, q = quantize(mesh.vertices[order])
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec], len(order), len(mesh.faces), *origin, *step))
+        for axis in range(3):
+            plane = np.diff(q[:, axis], prepend=np.uint16(0))  # uint16 arithmetic wraps
+            f.write(compressor.compress(plane.astype('<u2').tobytes()))
+        del q
+
+        previous = 0
+        per_chunk = CHUNK // 4
+        for start in range(0, len(flat), per_chunk):
+            indices = remap[flat[start:start + per_chunk]]
+            delta = np.diff(indices, prepend=previous)
+            previous = indices[-1]
+            f.write(compressor.compress(((delta << 1) ^ (delta >> 63)).astype('<u4').tobytes()))
+        f.write(compressor.flush())
+    os.replace(temp_path, path)  # Concurrent encoders of one file each write whole files
+    return os.path.getsize(path)
+
+
+def ensure_encoded(output_path, codec='gzip'):
+    """Path of the encoded copy of a mesh file, (re)built if missing or older than the file."""
+    path = encoded_path(output_path, codec)
+    if not os.path.exists(path) or os.path.getmtime(path) < mesh_storage.getmtime(output_path):
+        with mesh_storage.local_copy(output_path) as local:
+            encode_file(CompactMesh.load(local), path, codec)
+    return path
+
+
+def decode(data):
+    """(vertices float32 (N, 3), faces int32 (M, 3)) from encoded bytes (the reference decoder)."""
+    magic, version, codec, vertex_count, face_count, *rest = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a Naoshi mesh encoding")
+    origin, step = np.array(rest[:3], dtype=np.float32), np.array(rest[3:], dtype=np.float32)
+    body = data[HEADER.size:]
+    if codec == CODECS['zstd']:
+        import zstandard
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    else:
+        body = gzip.decompress(body)
+
+    planes = np.frombuffer(body, dtype='<u2', count=3 * vertex_count).reshape(3, -1)
+    q = np.cumsum(planes, axis=1, dtype=np.uint16).T  # Wraps mod 2^16 like the encoder
+    vertices = (origin + q.astype(np.float32) * step).astype(np.float32)
+    zigzag = np.frombuffer(body, dtype='<u4', offset=6 * vertex_count, count=3 * face_count).astype(np.int64)
+    delta = (zigzag >> 1) ^ -(zigzag & 1)
+    faces = np.cumsum(delta).astype(np.int32).reshape(-1, 3)
+    return vertices, faces
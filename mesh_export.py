@@ -0,0 +1,116 @@
+"""
+Indexed download formats for repair results: binary PLY and 3MF (zipped XML), plus binary
+STL for results that were saved in another format.
+
+The writers encode straight from vertex and face arrays in fixed-size chunks, so only one
+chunk of output exists at a time; a np.memmap works as well as an in-memory array. Files are
+written aside and moved into place, like the compact encoding (mesh_codec).
+"""
+import os
+import zipfile
+
+import numpy as np
+
+import mesh_storage
+from compact_mesh import CompactMesh
+from large_mesh import STL_DTYPE, face_normals
+
+FORMATS = {
+    'stl': 'model/stl',
+    'ply': 'application/x-ply',
+    '3mf': 'model/3mf',
+}
+CHUNK = 65536  # Vertices or faces encoded per write
+
+PLY_FACE = np.dtype([('count', 'u1'), ('indices', '<i4', (3,))])
+
+MODEL_3MF = '3D/3dmodel.model'
+CONTENT_TYPES_3MF = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    '</Types>\n')
+RELS_3MF = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    f'<Relationship Target="/{MODEL_3MF}" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    '</Relationships>\n')
+
+
+def format_path(output_path, fmt):
+    """Path of a result in format `fmt`: the output itself if it already is one."""
+    root, ext = os.path.splitext(output_path)
+    return output_path if ext.lower() == f'.{fmt}' else f'{root}.{fmt}'
+
+
+def write_ply(path, vertices, faces):
+    with open(path, 'wb') as f:
+        f.write((f"ply\nformat binary_little_endian 1.0\ncomment Naoshi\n"
+                 f"element vertex {len(vertices)}\nproperty float x\nproperty float y\nproperty float z\n"
+                 f"element face {len(faces)}\nproperty list uchar int vertex_indices\nend_header\n").encode('ascii'))
+        for start in range(0, len(vertices), CHUNK):
+            f.write(np.asarray(vertices[start:start + CHUNK], dtype='<f4').tobytes())
+        records = np.empty(CHUNK, dtype=PLY_FACE)
+        records['count'] = 3
+        for start in range(0, len(faces), CHUNK):
+            chunk = faces[start:start + CHUNK]
+            records['indices'][:len(chunk)] = chunk
+            f.write(records[:len(chunk)].tobytes())
+
+
+def write_3mf(path, vertices, faces, compresslevel=6):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES_3MF)
+        archive.writestr('_rels/.rels', RELS_3MF)
+        with archive.open(MODEL_3MF, 'w', force_zip64=True) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                    b'<model unit="millimeter" xml:lang="en-US" '
+                    b'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+                    b'<resources>\n<object id="1" type="model">\n<mesh>\n<vertices>\n')
+            # One %-format per chunk; 9 significant digits round-trip float32
+            for start in range(0, len(vertices), CHUNK):
+                chunk = np.asarray(vertices[start:start + CHUNK], dtype=np.float32)
+                f.write((('<vertex x="%.9g" y="%.9g" z="%.9g"/>\n' * len(chunk))
+                         % tuple(chunk.ravel().tolist())).encode('ascii'))
+            f.write(b'</vertices>\n<triangles>\n')
+            for start in range(0, len(faces), CHUNK):
+                chunk = np.asarray(faces[start:start + CHUNK])
+                f.write((('<triangle v1="%d" v2="%d" v3="%d"/>\n' * len(chunk))
+                         % tuple(chunk.ravel().tolist())).encode('ascii'))
+            f.write(b'</triangles>\n</mesh>\n</object>\n</resources>\n'
+                    b'<build>\n<item objectid="1"/>\n</build>\n</model>\n')
+
+
+def write_stl(path, vertices, faces):
+    with open(path, 'wb') as f:
+        f.write(b'Naoshi export'.ljust(80, b' '))
+        f.write(len(faces).to_bytes(4, 'little'))
+        for start in range(0, len(faces), CHUNK):
+            tri = np.asarray(vertices[np.asarray(faces[start:start + CHUNK])], dtype=np.float32)
+            records = np.zeros(len(tri), dtype=STL_DTYPE)
+            records['normal'] = face_normals(tri)[0]
+            records['verts'] = tri
+            f.write(records.tobytes())
+
+
+WRITERS = {'stl': write_stl, 'ply': write_ply, '3mf': write_3mf}
+
+
+def write(path, fmt, vertices, faces):
+    """Writes an indexed mesh to path in format `fmt` (a FORMATS key). Returns the size."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    WRITERS[fmt](temp_path, vertices, faces)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def ensure_format(output_path, fmt):
+    """Path of a result in format `fmt`, converted from the output if missing or older than it."""
+    path = format_path(output_path, fmt)
+    if path != output_path and (not os.path.exists(path) or os.path.getmtime(path) < mesh_storage.getmtime(output_path)):
+        with mesh_storage.local_copy(output_path) as local:
+            mesh = CompactMesh.load(local)
+        write(path, fmt, mesh.vertices, mesh.faces)
+    return path
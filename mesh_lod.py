@@ -0,0 +1,146 @@
+"""
+Level-of-detail previews of a repair result: simplified copies at a few face budgets,
+stored next to the output in the compact encoding (mesh_codec), so the viewer can show the
+result at once and load the full mesh behind it.
+
+Each level simplifies the next finer one with quadric edge collapse. Its cost grows with
+the faces removed, so meshes far above a budget are first brought near it by vertex
+clustering, which is linear and vectorized.
+
+Progress frames (FramePublisher) are coarser snapshots of the mesh while it is being
+repaired, streamed to the viewer over the progress WebSocket.
+"""
+import glob
+import os
+import time
+
+import numpy as np
+
+import mesh_codec
+from compact_mesh import CompactMesh
+
+LEVELS = (50_000, 200_000)  # Face budgets below the full mesh
+MIN_REDUCTION = 0.5  # A level is only built if it keeps at most this share of the next finer one
+CLUSTER_ABOVE = 3  # Cluster first when a mesh has more than this many times the budget
+CLUSTER_TO = 1.5  # ...down to about this many times the budget
+
+FRAME_FACES = 20_000  # Face budget of a progress frame
+FRAME_BYTES = 256 * 1024  # ...and its encoded size
+FRAME_INTERVAL = 1.0  # Min seconds between progress frames
+
+
+def lod_path(output_path, lod):
+    return os.path.splitext(output_path)[0] + f'.lod{lod}.nmsh'
+
+
+def clear_previews(output_path):
+    for path in glob.glob(glob.escape(os.path.splitext(output_path)[0]) + '.lod*.nmsh'):
+        os.remove(path)
+
+
+def cluster(mesh, target_faces):
+    """Vertex-clustered copy of `mesh` with roughly target_faces faces (cells sized from the surface area)."""
+    v = mesh.vertices
+    a, b, c = v[mesh.faces[:, 0]], v[mesh.faces[:, 1]], v[mesh.faces[:, 2]]
+    area = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1).sum(dtype=np.float64)
+    del a, b, c
+    cell = np.sqrt(2.0 * area / target_faces) or 1.0
+
+    grid = np.floor((v - v.min(axis=0)) / cell).astype(np.int64)
+    dims = grid.max(axis=0) + 1
+    keys = (grid[:, 0] * dims[1] + grid[:, 1]) * dims[2] + grid[:, 2]
+    del grid
+    _, cell_of, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    cell_of = cell_of.reshape(-1)
+    vertices = np.stack([np.bincount(cell_of, weights=v[:, axis]) for axis in range(3)], axis=1) / counts[:, None]
+
+    faces = cell_of[mesh.faces]
+    faces = faces[(faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])]
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    return CompactMesh(vertices, faces[np.sort(first)])
+
+
+def simplify(mesh, target_faces):
+    """`mesh` (CompactMesh) reduced to about target_faces by quadric edge collapse."""
+    import pymeshlab
+    if len(mesh.faces) > CLUSTER_ABOVE * target_faces:
+        mesh = cluster(mesh, CLUSTER_TO * target_faces)
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(mesh.to_meshlab())
+    ms.meshing_decimation_quadric_edge_collapse(targetfacenum=int(target_faces), preservenormal=True)
+    return CompactMesh.from_meshlab(ms.current_mesh())
+
+
+def write_previews(mesh, output_path, log_msg=None):
+    """
+    Writes the LOD previews of `mesh` (the saved result, a CompactMesh) for output_path,
+    replacing any earlier ones. Returns [{'lod': budget, 'faces': count}], coarsest first.
+    Failures are logged and leave no previews: they are an optimization only.
+    """
+    clear_previews(output_path)
+    previews = []
+    try:
+        for budget in sorted(LEVELS, reverse=True):
+            if budget > MIN_REDUCTION * len(mesh.faces):
+                continue
+            if log_msg:
+                log_msg(f"Building {budget // 1000}k-face preview...")
+            mesh = simplify(mesh, budget)
+            mesh_codec.encode_file(mesh, lod_path(output_path, budget))
+            previews.insert(0, {'lod': budget, 'faces': len(mesh.faces)})
+    except Exception as e:
+        print(f"Preview generation failed: {e}")
+        clear_previews(output_path)
+        return []
+    return previews
+
+
+def frame_path(output_path, seq):
+    return os.path.splitext(output_path)[0] + f'.frame{seq}.nmsh'
+
+
+class FramePublisher:
+    """
+    Publishes clustered snapshots of a mesh under repair: each is written to its own file
+    next to the output and announced by send({'stage', 'seq', 'faces', 'bytes'}). Only the
+    two newest files are kept, so a reader that falls behind finds stale frames gone.
+    """
+
+    def __init__(self, output_path, send):
+        self.output_path = output_path
+        self.send = send
+        self.seq = 0
+        self.last = 0.0
+        self.clear()
+
+    def __call__(self, stage, mesh):
+        """Publishes `mesh` (a CompactMesh) for `stage`, unless the last frame was under FRAME_INTERVAL ago."""
+        if time.time() - self.last < FRAME_INTERVAL:
+            return
+        budget = FRAME_FACES
+        path = frame_path(self.output_path, self.seq + 1)
+        while True:
+            frame = cluster(mesh, budget) if len(mesh.faces) > budget else mesh
+            size = mesh_codec.encode_file(frame, path, level=1)
+            if size <= FRAME_BYTES or budget < 1000:
+                break
+            budget //= 2
+        if size > FRAME_BYTES:
+            os.remove(path)
+            return
+
+        self.seq += 1
+        self._remove(frame_path(self.output_path, self.seq - 2))
+        self.last = time.time()
+        self.send({'stage': stage, 'seq': self.seq, 'faces': len(frame.faces), 'bytes': size})
+
+    def clear(self):
+        for path in glob.glob(glob.escape(os.path.splitext(self.output_path)[0]) + '.frame*.nmsh'):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Missing, or open in a reader (Windows)
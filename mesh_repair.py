@@ -1,293 +1,1104 @@
 import os
+import sys
 import time
-import trimesh
+import queue
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 import pymeshlab
+import numpy as np
+from mesh_fidelity import surface_deviation, sample_reference, corner_values, deviation_map_path
+import large_mesh
+import memory_guard
+from compact_mesh import CompactMesh
+from shapes import shape_mesh, concatenate, bounds_overlap, parse_matrix
+import incremental
+import mesh_lod
+import mesh_export
+import mesh_storage
+
+# Draft settings of a progressive repair (options['progressive']): a quick, coarser
+# reconstruction the user can check before the full-quality one
+DRAFT_POISSON_DEPTH = 7
+DRAFT_ALPHA_WRAP = (0.6, 0.2)  # alpha, offset (% of the bbox diagonal); full quality is 0.15, 0.05
+
+# Output face budget (options['target_faces'] / options['target_ratio'])
+SIMPLIFY_TOLERANCE = 0.005  # Default deviation simplification may add (fraction of the bbox diagonal)
+SIMPLIFY_STEP = 0.5  # Each quadric pass keeps at least this share of the faces, then is checked
+
+
+class StageTimer:
+    """
+    Lap-style wall clock per pipeline stage: lap(name) closes the previous stage. Also records
+    the process's peak RSS as each stage closes, so the stage that raised the peak is visible.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.memory = {}
+        self._name = None
+        self._t0 = time.perf_counter()
+
+    def lap(self, name=None):
+        now = time.perf_counter()
+        if self._name is not None:
+            self.times[self._name] = round(self.times.get(self._name, 0.0) + (now - self._t0), 4)
+            self.memory[self._name] = peak_rss_mb()
+        self._name, self._t0 = name, now
+        return self.times
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (None if unavailable)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS reports bytes
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except Exception:
+        return None
 
 def analyze_stl(filepath):
     """Load STL and detect issues."""
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"File not found: {filepath}")
     try:
-        # Use process=True to merge vertices (STL is non-indexed)
-        mesh = trimesh.load(filepath, process=True)
+        mesh = CompactMesh.load(filepath)
         return {'is_watertight': mesh.is_watertight, 'faces': len(mesh.faces)}
     except Exception as e:
         return {'error': str(e)}
 
-def repair_worker(filepath, output_path, result_queue):
+def solidify(ms, log_msg):
+    """Final solidification pass on the current MeshSet mesh (merge, fix non-manifold, close, orient)."""
+    try:
+        # 1. Merge vertices
+        ms.apply_filter('meshing_merge_close_vertices', threshold=pymeshlab.PercentageValue(0.001))
+        
+        # 2. Repair non-manifold edges/vertices
+        try:
+            ms.apply_filter('meshing_repair_non_manifold_edges')
+            ms.apply_filter('meshing_repair_non_manifold_vertices')
+        except: pass
+        
+        # 3. Close ALL remaining holes
+        try:
+            ms.apply_filter('meshing_close_holes', maxholesize=100000)
+        except: pass
+        
+        # 4. Re-orient all faces consistently outward (Fixed Typo)
+        ms.apply_filter('meshing_re_orient_faces_coherently')
+        
+        # 5. Invert if volume is negative (inside-out mesh)
+        try:
+            measures = ms.get_geometric_measures()
+            if 'mesh_volume' in measures and measures['mesh_volume'] < 0:
+                log_msg("Flipping inverted normals...", 0.92)
+                ms.apply_filter('meshing_invert_face_orientation')
+        except: 
+            pass
+        
+        # 6. Final cleanup
+        ms.apply_filter('meshing_remove_unreferenced_vertices')
+        
+        log_msg("Mesh solidified", 0.94)
+    
+    except Exception as e:
+        log_msg(f"Solidification warning: {e}", 0.93)
+
+def fitted_poisson_depth(options, headroom_mb, default, log_msg):
+    """options['poisson_depth'] (else default), lowered until its projected peak fits headroom_mb()."""
+    requested = options.get('poisson_depth', default)
+    if headroom_mb is None:
+        return requested
+    depth = memory_guard.poisson_depth_within(headroom_mb(), requested)
+    if depth < requested:
+        log_msg(f"Lowering Poisson depth to {depth} to stay under the memory ceiling")
+    return depth
+
+def store_output(output_path, options):
+    """Compresses the output at rest with options['compress_output'] (see mesh_storage); it stays plain on failure."""
+    if options.get('compress_output'):
+        try:
+            mesh_storage.compress(output_path)
+        except OSError as e:
+            print(f"Output left uncompressed: {e}")
+
+def export_format(output_path, options, vertices, faces, log_msg):
+    """Also writes the result in options['output_format'] (see mesh_export), if one was asked for."""
+    fmt = options.get('output_format')
+    if fmt not in mesh_export.FORMATS or mesh_export.format_path(output_path, fmt) == output_path:
+        return
+    try:
+        log_msg(f"Writing {fmt.upper()}...")
+        mesh_export.write(mesh_export.format_path(output_path, fmt), fmt, vertices, faces)
+    except Exception as e:
+        log_msg(f"{fmt.upper()} export failed: {e}")  # Converted on download instead
+
+def face_target(options, original_faces):
+    """Output face budget from options['target_faces'] or options['target_ratio'] (of the input's faces), or None."""
+    if options.get('target_faces'):
+        return max(int(options['target_faces']), 4)
+    if options.get('target_ratio'):
+        return max(int(round(float(options['target_ratio']) * original_faces)), 4)
+    return None
+
+def simplify_to_budget(ms, reference, target, tolerance, log_msg, sampled=None):
+    """
+    Reduces the current MeshSet mesh toward `target` faces by feature-preserving quadric edge
+    collapse, in passes that each at most halve it. Every pass is measured against `reference`
+    (the input) and re-verified watertight (if the mesh was). The first pass whose deviation
+    exceeds the unsimplified mesh's by more than `tolerance` (fraction of the bbox diagonal),
+    or that opens the mesh, is undone and the simplification stops there. A reconstruction
+    already deviates from a broken input, so the tolerance bounds what simplifying adds.
+    `sampled` is the reference's sample_reference(), if already taken. Returns a summary for
+    the result payload.
+    """
+    sampled = sampled or sample_reference(reference.vertices, reference.faces)
+    kept = CompactMesh.from_meshlab(ms.current_mesh())
+    faces = len(kept.faces)
+    baseline = surface_deviation(reference.vertices, reference.faces, kept.vertices, kept.faces,
+                                 reference=sampled)[0]['hausdorff_rel']
+    summary = {'target': target, 'from_faces': faces, 'faces': faces, 'hausdorff_rel': baseline, 'stopped': None}
+    watertight = kept.welded().is_watertight
+
+    while faces > target:
+        step = max(target, int(faces * SIMPLIFY_STEP))
+        try:
+            ms.apply_filter('meshing_decimation_quadric_edge_collapse', targetfacenum=step, qualitythr=0.3,
+                            preserveboundary=True, preservenormal=True, preservetopology=True,
+                            optimalplacement=True, planarquadric=True, autoclean=True)
+            candidate = CompactMesh.from_meshlab(ms.current_mesh())
+            stats = surface_deviation(reference.vertices, reference.faces, candidate.vertices, candidate.faces,
+                                      reference=sampled)[0]
+        except Exception as e:
+            summary['stopped'] = f"failed: {e}"
+        else:
+            if stats['hausdorff_rel'] > baseline + tolerance:
+                summary['stopped'] = 'deviation'
+            elif watertight and not candidate.welded().is_watertight:
+                summary['stopped'] = 'watertight'
+        if summary['stopped']:
+            ms.add_mesh(kept.to_meshlab())  # Back to the last accepted pass
+            break
+        kept, faces = candidate, len(candidate.faces)
+        summary.update(faces=faces, hausdorff_rel=stats['hausdorff_rel'])
+        log_msg(f"Simplified to {faces:,} faces (deviation {stats['hausdorff_rel']:.2%})", 0.95)
+
+    if summary['stopped'] == 'deviation':
+        log_msg(f"Simplification stopped at {faces:,} faces: next pass adds more than {tolerance:.2%} deviation")
+    elif summary['stopped']:
+        log_msg(f"Simplification stopped at {faces:,} faces ({summary['stopped']})")
+    return summary
+
+def repair_meshset(ms, reference, log_msg, options=None, stages=None, headroom_mb=None, publish=None):
     """
     SMART REPAIR PIPELINE - 4 TIERS
-    
+
     Tier 1: Validation (Pass if good)
     Tier 2: Surgical Repair (Fix only bad faces, preserve original geometry)
     Tier 3: Alpha Wrap (High Detail Reconstruction - Fallback 1)
     Tier 4: Poisson Reconstruction (Guaranteed Solid - Fallback 2)
+
+    `ms` holds the input as its current mesh and `reference` is the same input as a welded
+    CompactMesh (Tier 1 check, fidelity reference, Tier 3/4 reloads). The repaired mesh is
+    left current in `ms`. headroom_mb() -> MB left under the memory ceiling, if there is one.
+    publish(stage, mesh) receives the intermediate mesh (a CompactMesh) after each stage.
+    With a face budget (options['target_faces'] or 'target_ratio'), the result is then simplified
+    toward it within options['simplify_tolerance'] (see simplify_to_budget), and again after
+    merging editor shapes if they take it back over (reported in shapes['simplification']).
+    Returns method, tier, face counts, fidelity, tier_fidelity, vertex_deviation and simplification.
     """
-    def log_msg(msg, progress=None):
-        if progress is not None:
-             result_queue.put(('progress', (msg, progress)))
-        else:
-             result_queue.put(('status', msg))
+    options = options or {}
+    stages = stages or StageTimer()
+    max_deviation = options.get('max_deviation')
+    draft = bool(options.get('progressive'))
+    tier_fidelity = {}
 
-    start_time = time.time()
-    
-    try:
-        log_msg("Loading mesh...", 0.05)
-        
-        # 1. Analyze first (Is it already good?)
-        try:
-            initial_check = trimesh.load(filepath, process=False)
-            is_already_watertight = initial_check.is_watertight
-            log_msg(f"Initial status: {'Watertight' if is_already_watertight else 'Needs Repair'}", 0.08)
-        except:
-             is_already_watertight = False
+    def poisson_depth(default):
+        return fitted_poisson_depth(options, headroom_mb, default, log_msg)
 
-        ms = pymeshlab.MeshSet()
-        ms.load_new_mesh(filepath)
-        
-        original_faces = ms.current_mesh().face_number()
-        log_msg(f"Loaded: {original_faces:,} faces", 0.1)
+    sampled = None  # The input's deviation samples, taken on the first measurement
 
-        if is_already_watertight:
-            log_msg("Mesh is already valid. Skipping reconstruction to preserve detail.", 0.2)
-            try:
-                ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=50)
-                ms.apply_filter('meshing_remove_unreferenced_vertices')
-            except: pass
-            
-            final_faces = ms.current_mesh().face_number()
-            repair_method = 'Passthrough (Valid)'
-            success_tier = 1
+    def reference_samples():
+        nonlocal sampled
+        if sampled is None:
+            sampled = sample_reference(reference.vertices, reference.faces)
+        return sampled
 
-        else:
-            # ============================================
-            # TIER 2: SURGICAL REPAIR (Smart Local Fix)
-            # ============================================
-            log_msg("Tier 2: Attempting Smart Local Repair...", 0.2)
-            repair_method = 'Smart Local Repair'
-            success_tier = 0
-            
-            try:
-                # 1. Cleaning
-                ms.apply_filter('meshing_remove_unreferenced_vertices')
-                ms.apply_filter('meshing_remove_duplicate_faces')
-                ms.apply_filter('meshing_remove_duplicate_vertices')
-                
-                # 2. Select and Remove BAD Geometry Only
-                log_msg("Removing non-manifold geometry...", 0.25)
-                ms.apply_filter('meshing_repair_non_manifold_edges')
-                ms.apply_filter('meshing_repair_non_manifold_vertices')
-                
-                # Select self-intersecting faces (if any)
-                try:
-                    ms.apply_filter('compute_selection_by_self_intersections_per_face')
-                    ms.apply_filter('meshing_remove_selected_faces')
-                except: pass 
+    def measure(tier, per_vertex=False):
+        """Deviation of the current MeshSet mesh from the input. Returns (stats, per_vertex) or (None, None)."""
+        try:
+            m = ms.current_mesh()
+            stats, vertex_dev = surface_deviation(reference.vertices, reference.faces, m.vertex_matrix(),
+                                                  m.face_matrix(), per_vertex=per_vertex,
+                                                  reference=reference_samples())
+        except Exception as e:
+            log_msg(f"Deviation check skipped: {e}")
+            return None, None
+        if tier is not None:
+            tier_fidelity[tier] = stats
+        return stats, vertex_dev
 
-                # 3. Patch Holes (Iterative with Robust Fallback)
-                log_msg("Patching holes...", 0.3)
-                try:
-                    ms.apply_filter('meshing_close_holes', maxholesize=1000) 
-                    ms.apply_filter('meshing_close_holes', maxholesize=5000)
-                except Exception as e:
-                    # Fallback: Force clean non-manifold edges if close_holes fails
-                    log_msg("Complex holes detected, force cleaning...", 0.32)
-                    ms.apply_filter('meshing_repair_non_manifold_edges')
-                    ms.apply_filter('meshing_repair_non_manifold_vertices')
-                    # Aggressive cleanup if standard repair fails
-                    try:
-                        ms.apply_filter('compute_selection_by_non_manifold_per_vertex')
-                        ms.apply_filter('meshing_remove_selected_vertices')
-                    except: pass
-                    ms.apply_filter('meshing_close_holes', maxholesize=5000)
+    def within_tolerance(stats):
+        return max_deviation is None or stats is None or stats['hausdorff_rel'] <= max_deviation
 
-                ms.apply_filter('meshing_re_orient_faces_coherently')
-                
-                # 4. VALIDATE TIER 2 (STRICT MODE)
-                # Must be watertight AND free of self-intersections to pass surgical repair
-                ms.save_current_mesh(output_path)
-                check_tm = trimesh.load(output_path, process=True)
-                
-                # Check for self-intersections using PyMeshLab
-                try:
-                    ms.apply_filter('compute_selection_by_self_intersections_per_face')
-                    selection_stats = ms.get_geometric_measures() # Hack to check selection?
-                    # Actually, we can just check if any faces are selected.
-                    # count_selected = ... (hard to get directly in simple API without parsing)
-                    # Alternative: Try to remove them. If faces count changes, it had intersections.
-                    f_before = ms.current_mesh().face_number()
-                    ms.apply_filter('meshing_remove_selected_faces')
-                    f_after = ms.current_mesh().face_number()
-                    has_intersections = (f_before != f_after)
-                except: 
-                    has_intersections = False # safely assume none if filter fails or not supported
-
-                if check_tm.is_watertight and not has_intersections:
-                    success_tier = 2
-                    log_msg("Local repair successful! Solid & Clean.", 1.0)
-                else:
-                    reason = "Contains self-intersections" if has_intersections else "Not watertight"
-                    log_msg(f"Local repair failed ({reason}). Fallback to Reconstruction...", 0.4)
+    def snapshot(stage):
+        if publish is not None:
+            try:
+                publish(stage, CompactMesh.from_meshlab(ms.current_mesh()))
             except Exception as e:
-                log_msg(f"Tier 2 error: {e}", 0.4)
-
+                print(f"Progress frame skipped: {e}")
 
-            # ============================================
-            # TIER 3: ALPHA WRAP (Detail Preservation)
-            # ============================================
-            if success_tier == 0:
-                log_msg("Tier 3: Initiating Sharp Alpha Wrap...", 0.45)
-                repair_method = 'Alpha Wrap (Sharp)'
-                
-                ms.load_new_mesh(filepath) 
-                
-                # Heartbeat
-                import threading
-                def heartbeat_loop(q, stop_event):
-                     secs = 0
-                     while not stop_event.is_set():
-                         time.sleep(1.0)
-                         secs += 1
-                         if secs % 2 == 0:
-                             q.put(('status', f"Reconstructing... {secs}s"))
-                
-                stop_heartbeat = threading.Event()
-                hb_thread = threading.Thread(target=heartbeat_loop, args=(result_queue, stop_heartbeat))
-                hb_thread.daemon = True
-                hb_thread.start()
-                
-                try:
-                    # Tuned Settings: Alpha 0.15% (Very Sharp), Offset 0.05%
-                    ms.apply_filter('generate_alpha_wrap', 
-                                    alpha=pymeshlab.PercentageValue(0.15),
-                                    offset=pymeshlab.PercentageValue(0.05))
-                                    
-                    # Post-Process Alpha Wrap
-                    ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=200)
-                    ms.apply_filter('meshing_remove_unreferenced_vertices')
-                    ms.apply_filter('meshing_close_holes', maxholesize=5000)
-                    ms.apply_filter('meshing_re_orient_faces_coherently')
-
-                    # 4. VALIDATE TIER 3
-                    ms.save_current_mesh(output_path)
-                    check_tm = trimesh.load(output_path, process=True)
-                    if check_tm.is_watertight:
-                        success_tier = 3
-                        log_msg("Alpha Wrap successful!", 1.0)
-                    else:
-                        log_msg("Alpha Wrap failed to seal. Trying last resort...", 0.6)
-
-                except Exception as e:
-                    log_msg(f"Alpha Wrap failed: {e}", 0.6)
-                finally:
-                    stop_heartbeat.set()
-                    hb_thread.join()
-
-            # ============================================
-            # TIER 4: SCREENED POISSON (Solid & Sharp)
-            # ============================================
-            if success_tier == 0:
-                log_msg("Tier 4: Poisson Reconstruction (High Quality)...", 0.7)
-                repair_method = 'Poisson Reconstruction (HQ)'
-                
-                ms.load_new_mesh(filepath) # Reload
-                
-                try:
-                    ms.apply_filter('compute_normal_per_vertex')
-                except: pass
+    # 1. Analyze first (Is it already good?)
+    stages.lap('tier1_validate')
+    is_already_watertight = reference.is_watertight
+    reference.drop()
+    log_msg(f"Initial status: {'Watertight' if is_already_watertight else 'Needs Repair'}", 0.08)
+    
+    original_faces = ms.current_mesh().face_number()
+    log_msg(f"Loaded: {original_faces:,} faces", 0.1)
 
-                try:
-                    # Bump Depth to 9 for sharper details (was 8)
-                    ms.apply_filter('generate_surface_reconstruction_screened_poisson', 
-                                    depth=9, 
-                                    preclean=True)
-                    
-                    ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=500)
-                    ms.apply_filter('meshing_remove_unreferenced_vertices')
-                    ms.apply_filter('meshing_re_orient_faces_coherently')
-                    
-                    success_tier = 4
-                    log_msg("Poisson Reconstruction complete.", 0.9)
-                except Exception as e:
-                     log_msg(f"Poisson failed: {e}", 0.9)
-
-                     
-        # Final cleanup for all methods
+    if is_already_watertight:
+        log_msg("Mesh is already valid. Skipping reconstruction to preserve detail.", 0.2)
+        stages.lap('passthrough_cleanup')
         try:
-             ms.apply_filter('meshing_remove_unreferenced_vertices')
+            ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=50)
+            ms.apply_filter('meshing_remove_unreferenced_vertices')
         except: pass
+        
+        final_faces = ms.current_mesh().face_number()
+        repair_method = 'Passthrough (Valid)'
+        success_tier = 1
 
+    else:
         # ============================================
-        # FINAL SOLIDIFICATION CHECK (Double Verify)
+        # TIER 2: SURGICAL REPAIR (Smart Local Fix)
         # ============================================
-        log_msg("Ensuring solid volume...", 0.90)
+        log_msg("Tier 2: Attempting Smart Local Repair...", 0.2)
+        stages.lap('tier2_surgical')
+        repair_method = 'Smart Local Repair'
+        success_tier = 0
         
         try:
-            # 1. Merge vertices
-            ms.apply_filter('meshing_merge_close_vertices', threshold=pymeshlab.PercentageValue(0.001))
+            # 1. Cleaning
+            ms.apply_filter('meshing_remove_unreferenced_vertices')
+            ms.apply_filter('meshing_remove_duplicate_faces')
+            ms.apply_filter('meshing_remove_duplicate_vertices')
             
-            # 2. Repair non-manifold edges/vertices
+            # 2. Select and Remove BAD Geometry Only
+            log_msg("Removing non-manifold geometry...", 0.25)
+            ms.apply_filter('meshing_repair_non_manifold_edges')
+            ms.apply_filter('meshing_repair_non_manifold_vertices')
+            
+            # Select self-intersecting faces (if any)
+            try:
+                ms.apply_filter('compute_selection_by_self_intersections_per_face')
+                ms.apply_filter('meshing_remove_selected_faces')
+            except: pass 
+
+            # 3. Patch Holes (Iterative with Robust Fallback)
+            log_msg("Patching holes...", 0.3)
             try:
+                ms.apply_filter('meshing_close_holes', maxholesize=1000) 
+                ms.apply_filter('meshing_close_holes', maxholesize=5000)
+            except Exception as e:
+                # Fallback: Force clean non-manifold edges if close_holes fails
+                log_msg("Complex holes detected, force cleaning...", 0.32)
                 ms.apply_filter('meshing_repair_non_manifold_edges')
                 ms.apply_filter('meshing_repair_non_manifold_vertices')
-            except: pass
+                # Aggressive cleanup if standard repair fails
+                try:
+                    ms.apply_filter('compute_selection_by_non_manifold_per_vertex')
+                    ms.apply_filter('meshing_remove_selected_vertices')
+                except: pass
+                ms.apply_filter('meshing_close_holes', maxholesize=5000)
+
+            ms.apply_filter('meshing_re_orient_faces_coherently')
+            snapshot('cleanup')
+            
+            # 4. VALIDATE TIER 2 (STRICT MODE)
+            # Must be watertight AND free of self-intersections to pass surgical repair
+            tier2_watertight = CompactMesh.from_meshlab(ms.current_mesh()).welded().is_watertight
             
-            # 3. Close ALL remaining holes
+            # Check for self-intersections using PyMeshLab
             try:
-                ms.apply_filter('meshing_close_holes', maxholesize=100000)
-            except: pass
+                ms.apply_filter('compute_selection_by_self_intersections_per_face')
+                selection_stats = ms.get_geometric_measures() # Hack to check selection?
+                # Actually, we can just check if any faces are selected.
+                # count_selected = ... (hard to get directly in simple API without parsing)
+                # Alternative: Try to remove them. If faces count changes, it had intersections.
+                f_before = ms.current_mesh().face_number()
+                ms.apply_filter('meshing_remove_selected_faces')
+                f_after = ms.current_mesh().face_number()
+                has_intersections = (f_before != f_after)
+            except: 
+                has_intersections = False # safely assume none if filter fails or not supported
+
+            fidelity = measure(2)[0] if tier2_watertight and not has_intersections else None
+            if tier2_watertight and not has_intersections and within_tolerance(fidelity):
+                success_tier = 2
+                log_msg("Local repair successful! Solid & Clean.", 1.0)
+            else:
+                if has_intersections:
+                    reason = "Contains self-intersections"
+                elif not tier2_watertight:
+                    reason = "Not watertight"
+                else:
+                    reason = f"Deviation {fidelity['hausdorff_rel']:.2%} exceeds tolerance"
+                log_msg(f"Local repair failed ({reason}). Fallback to Reconstruction...", 0.4)
+        except Exception as e:
+            log_msg(f"Tier 2 error: {e}", 0.4)
+
+
+        # ============================================
+        # TIER 3: ALPHA WRAP (Detail Preservation)
+        # ============================================
+        if success_tier == 0 and (options.get('skip_alpha_wrap')
+                                  or (headroom_mb is not None and not memory_guard.alpha_wrap_fits(headroom_mb(), original_faces))):
+            log_msg("Skipping Alpha Wrap (memory ceiling)...", 0.45)
+        elif success_tier == 0:
+            log_msg(f"Tier 3: Initiating {'Draft' if draft else 'Sharp'} Alpha Wrap...", 0.45)
+            stages.lap('tier3_alpha_wrap')
+            repair_method = 'Alpha Wrap (Draft)' if draft else 'Alpha Wrap (Sharp)'
             
-            # 4. Re-orient all faces consistently outward (Fixed Typo)
-            ms.apply_filter('meshing_re_orient_faces_coherently')
+            ms.add_mesh(reference.to_meshlab())
+            
+            # Heartbeat
+            import threading
+            def heartbeat_loop(stop_event):
+                 secs = 0
+                 while not stop_event.is_set():
+                     time.sleep(1.0)
+                     secs += 1
+                     if secs % 2 == 0:
+                         log_msg(f"Reconstructing... {secs}s")
+            
+            stop_heartbeat = threading.Event()
+            hb_thread = threading.Thread(target=heartbeat_loop, args=(stop_heartbeat,))
+            hb_thread.daemon = True
+            hb_thread.start()
             
-            # 5. Invert if volume is negative (inside-out mesh)
             try:
-                measures = ms.get_geometric_measures()
-                if 'mesh_volume' in measures and measures['mesh_volume'] < 0:
-                    log_msg("Flipping inverted normals...", 0.92)
-                    ms.apply_filter('meshing_invert_face_orientation')
-            except: 
-                pass
+                # Tuned Settings: Alpha 0.15% (Very Sharp), Offset 0.05%
+                alpha, offset = DRAFT_ALPHA_WRAP if draft else (0.15, 0.05)
+                ms.apply_filter('generate_alpha_wrap', 
+                                alpha=pymeshlab.PercentageValue(alpha),
+                                offset=pymeshlab.PercentageValue(offset))
+                                
+                # Post-Process Alpha Wrap
+                ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=200)
+                ms.apply_filter('meshing_remove_unreferenced_vertices')
+                ms.apply_filter('meshing_close_holes', maxholesize=5000)
+                ms.apply_filter('meshing_re_orient_faces_coherently')
+                snapshot('alpha_wrap')
+
+                # 4. VALIDATE TIER 3
+                tier3_watertight = CompactMesh.from_meshlab(ms.current_mesh()).welded().is_watertight
+                fidelity = measure(3)[0] if tier3_watertight else None
+                if tier3_watertight and within_tolerance(fidelity):
+                    success_tier = 3
+                    log_msg("Alpha Wrap successful!", 1.0)
+                elif tier3_watertight:
+                    log_msg(f"Alpha Wrap deviates {fidelity['hausdorff_rel']:.2%} from input. Trying last resort...", 0.6)
+                else:
+                    log_msg("Alpha Wrap failed to seal. Trying last resort...", 0.6)
+
+            except Exception as e:
+                log_msg(f"Alpha Wrap failed: {e}", 0.6)
+            finally:
+                stop_heartbeat.set()
+                hb_thread.join()
+
+        # ============================================
+        # TIER 4: SCREENED POISSON (Solid & Sharp)
+        # ============================================
+        if success_tier == 0:
+            log_msg(f"Tier 4: Poisson Reconstruction ({'Draft' if draft else 'High Quality'})...", 0.7)
+            stages.lap('tier4_poisson')
+            repair_method = 'Poisson Reconstruction (Draft)' if draft else 'Poisson Reconstruction (HQ)'
             
-            # 6. Final cleanup
-            ms.apply_filter('meshing_remove_unreferenced_vertices')
+            ms.add_mesh(reference.to_meshlab()) # Reload
             
-            log_msg("Mesh solidified", 0.94)
-        
+            try:
+                ms.apply_filter('compute_normal_per_vertex')
+            except: pass
+
+            try:
+                # Bump Depth to 9 for sharper details (was 8); lowered if it would not fit in memory
+                depth = poisson_depth(9)
+                ms.apply_filter('generate_surface_reconstruction_screened_poisson', 
+                                depth=min(depth, DRAFT_POISSON_DEPTH) if draft else depth, 
+                                preclean=True)
+                
+                ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=500)
+                ms.apply_filter('meshing_remove_unreferenced_vertices')
+                ms.apply_filter('meshing_re_orient_faces_coherently')
+                snapshot('poisson')
+                
+                success_tier = 4
+                measure(4)
+                log_msg("Poisson Reconstruction complete.", 0.9)
+            except Exception as e:
+                 log_msg(f"Poisson failed: {e}", 0.9)
+
+                 
+    # Final cleanup for all methods
+    try:
+         ms.apply_filter('meshing_remove_unreferenced_vertices')
+    except: pass
+
+    # ============================================
+    # FINAL SOLIDIFICATION CHECK (Double Verify)
+    # ============================================
+    log_msg("Ensuring solid volume...", 0.90)
+    stages.lap('solidify')
+    
+    solidify(ms, log_msg)
+    snapshot('solidify')
+
+    # Output face budget: reconstruction (Poisson especially) can return several times the input's faces
+    simplification = None
+    target = face_target(options, original_faces)
+    tolerance = options.get('simplify_tolerance') or SIMPLIFY_TOLERANCE
+    if target is not None and ms.current_mesh().face_number() > target:
+        log_msg(f"Simplifying to {target:,} faces...", 0.95)
+        stages.lap('simplify')
+        try:
+            simplification = simplify_to_budget(ms, reference, target, tolerance, log_msg,
+                                                sampled=reference_samples())
         except Exception as e:
-            log_msg(f"Solidification warning: {e}", 0.93)
+            log_msg(f"Simplification skipped: {e}")
+        snapshot('simplify')
+
+    # Fidelity of the result (optionally per output vertex, for the viewer's deviation map)
+    stages.lap('fidelity')
+    shapes = options.get('shapes')
+    fidelity, vertex_dev = measure(None, per_vertex=bool(options.get('deviation_map')) and not shapes)
+
+    # Editor shapes are merged into the repaired model (fidelity above is the model's alone;
+    # the deviation map then shows the added shapes as well)
+    shapes_summary = None
+    if shapes:
+        stages.lap('union')
+        shapes_summary = merge_shapes(ms, shapes, log_msg, options, stages, headroom_mb)
+        snapshot('union')
+        # The budget covers the whole result, and the shapes (or a rebuild with them) add faces.
+        # Measured against the merged mesh: the shapes are not in the input
+        if target is not None and ms.current_mesh().face_number() > target:
+            log_msg(f"Simplifying the merged result to {target:,} faces...", 0.95)
+            stages.lap('simplify')
+            try:
+                shapes_summary['simplification'] = simplify_to_budget(
+                    ms, CompactMesh.from_meshlab(ms.current_mesh()), target, tolerance, log_msg)
+            except Exception as e:
+                log_msg(f"Simplification skipped: {e}")
+            snapshot('simplify')
+        if options.get('deviation_map'):
+            vertex_dev = measure(None, per_vertex=True)[1]
+
+    return {
+        'method': repair_method,
+        'tier': success_tier,
+        'original_faces': original_faces,
+        'final_faces': ms.current_mesh().face_number(),
+        'fidelity': fidelity,
+        'tier_fidelity': tier_fidelity,
+        'vertex_deviation': vertex_dev,
+        'shapes': shapes_summary,
+        'simplification': simplification,
+    }
+
+def merge_shapes(ms, shapes, log_msg, options, stages, headroom_mb=None):
+    """
+    Unions editor shapes (see shapes.py) into the repaired mesh current in `ms`, by pymeshlab's
+    exact boolean union. Shapes that don't touch each other share one boolean (the cost is
+    mostly the model's size), and a group clear of the model is simply appended. If a union
+    fails or leaves gaps, model and shapes are rebuilt together by the repair tiers instead
+    (the old triangle-soup path). Returns a summary for the result.
+    """
+    log_msg(f"Merging {len(shapes)} shape(s) into the model...", 0.92)
+    model = CompactMesh.from_meshlab(ms.current_mesh())
+    meshes = [shape_mesh(shape) for shape in shapes]
+    summary = {'count': len(shapes), 'unions': 0, 'appended': 0, 'method': 'Boolean Union'}
+
+    # Groups of shapes whose bounding boxes are pairwise disjoint
+    groups = []
+    for mesh in meshes:
+        for group in groups:
+            if not any(bounds_overlap(mesh.bounds, other.bounds) for other in group):
+                group.append(mesh)
+                break
+        else:
+            groups.append([mesh])
+
+    try:
+        merged = model
+        for group in groups:
+            operand = concatenate(group)
+            if bounds_overlap(merged.bounds, operand.bounds):
+                union = pymeshlab.MeshSet()
+                union.add_mesh(merged.to_meshlab())
+                union.add_mesh(operand.to_meshlab())
+                union.generate_boolean_union(first_mesh=0, second_mesh=1)
+                merged = CompactMesh.from_meshlab(union.current_mesh())
+                summary['unions'] += 1
+            else:
+                merged = concatenate([merged, operand])
+                summary['appended'] += 1
+        ms.add_mesh(merged.to_meshlab())
+        if summary['unions']:
+            # Exact intersections rounded to float leave slivers along the seams: collapse them
+            ms.apply_filter('meshing_merge_close_vertices', threshold=pymeshlab.PercentageValue(0.001))
+            ms.apply_filter('meshing_remove_null_faces')
+            ms.apply_filter('meshing_remove_duplicate_faces')
+            ms.apply_filter('meshing_remove_unreferenced_vertices')
+        if not CompactMesh.from_meshlab(ms.current_mesh()).welded().is_watertight:
+            raise ValueError("result is not watertight")
+        log_msg(f"Merged shapes ({summary['unions']} union(s), {summary['appended']} appended)", 0.94)
+    except Exception as e:
+        log_msg(f"Shape union failed ({str(e).splitlines()[0]}). Rebuilding model and shapes together...", 0.92)
+        soup = concatenate([model] + meshes).welded()
+        ms.add_mesh(soup.to_meshlab())
+        # The face budget is applied to the rebuilt result by the caller
+        rebuild = {k: v for k, v in options.items()
+                   if k not in ('shapes', 'max_deviation', 'deviation_map', 'target_faces', 'target_ratio')}
+        outcome = repair_meshset(ms, soup, log_msg, rebuild, stages, headroom_mb)
+        summary.update(method=outcome['method'], tier=outcome['tier'], unions=0, appended=0)
+    return summary
+
+def repair_worker(filepath, output_path, result_queue, options=None):
+    """
+    Runs the repair pipeline (repair_meshset) on a mesh file in a worker process, reporting
+    ('progress', (msg, value)), ('status', msg) and finally ('done', result) or ('error', msg)
+    on result_queue.
+
+    options:
+      max_deviation  - reject Tier 2/3 results whose Hausdorff distance to the input
+                       exceeds this fraction of the bbox diagonal (Tier 4 always accepted)
+      deviation_map  - also write per-corner deviation values for the viewer
+      large_mode     - True/False forces large-mesh mode on/off (default: by memory budget)
+      transform      - 4x4 row-major matrix applied on load (large-mesh mode only)
+      shapes         - editor shapes to union into the repaired model (see shapes.py;
+                       not merged in large-mesh mode)
+      delta          - edits to apply to a previous result at filepath instead of a full
+                       repair (see incremental.py)
+      previews       - also write simplified LOD previews next to the output for the
+                       viewer (see mesh_lod.py; not in large-mesh mode)
+      progressive    - reconstruct at draft settings (DRAFT_POISSON_DEPTH, DRAFT_ALPHA_WRAP)
+                       and report a reconstructed result as ('preview', result); the
+                       caller then runs the job again without it to refine
+      frames         - publish clustered snapshots after each stage as ('frame', info)
+                       messages, the geometry in files next to the output (see
+                       mesh_lod.FramePublisher; full pipeline only)
+      target_faces, target_ratio
+                     - output face budget, as a count or a share of the input's faces: the
+                       result is simplified toward it by quadric collapse (not in large-mesh
+                       mode)
+      simplify_tolerance
+                     - stop simplifying before it adds more than this fraction of the bbox
+                       diagonal to the deviation from the input (default SIMPLIFY_TOLERANCE)
+      output_format  - also write the result as 'ply' or '3mf' (or 'stl' for OBJ inputs)
+                       next to the output (see mesh_export.format_path)
+      compress_output
+                     - store the output compressed at rest once written (see mesh_storage);
+                       filepath may be stored compressed either way
+      memory_limit_mb, poisson_depth, skip_alpha_wrap, sample_points, memory_level
+                     - memory ceiling and the downgrade settings (see memory_guard)
+    """
+    options = options or {}
+    if mesh_storage.is_compressed(filepath):
+        # Stored compressed (mesh_storage): the pipeline reads a plain copy
+        with mesh_storage.local_copy(filepath) as local:
+            return repair_worker(local, output_path, result_queue, options)
+
+    def log_msg(msg, progress=None):
+        if progress is not None:
+             result_queue.put(('progress', (msg, progress)))
+        else:
+             result_queue.put(('status', msg))
+
+    # Memory ceiling: the watchdog exits the process past it and the owner retries one rung lower
+    memory_limit = memory_guard.worker_memory_limit_mb(options)
+    if os.environ.get('NAOSHI_WORKER_ADDRESS_LIMIT_MB'):
+        memory_guard.apply_address_limit(float(os.environ['NAOSHI_WORKER_ADDRESS_LIMIT_MB']))
+    watchdog = memory_guard.MemoryWatchdog(memory_limit, on_exceed=lambda rss, limit: log_msg(
+        f"Memory limit exceeded ({rss:.0f} MB > {limit:.0f} MB). Retrying with lower settings...")).start()
+
+    def memory_stats():
+        return {'peak_memory_mb': peak_rss_mb() or round(watchdog.peak_mb, 1), 'memory_limit_mb': round(memory_limit, 1),
+                'memory_level': options.get('memory_level', 0)}
+
+    def poisson_depth(default):
+        return fitted_poisson_depth(options, watchdog.headroom_mb, default, log_msg)
+
+    if options.get('delta'):
+        try:
+            result = incremental_repair_worker(filepath, output_path, log_msg, options, watchdog.headroom_mb)
+            result.update(memory_stats())
+            store_output(output_path, options)
+            result_queue.put(('done', result))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            result_queue.put(('error', str(e)))
+        finally:
+            watchdog.stop()
+        return
+
+    large = options.get('large_mode')
+    if large or (large is None and large_mesh.needs_large_mode(filepath, memory_limit)):
+        try:
+            result = large_repair_worker(filepath, output_path, log_msg, options, poisson_depth)
+            result.update(memory_stats())
+            store_output(output_path, options)
+            result_queue.put(('done', result))
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            result_queue.put(('error', str(e)))
+        finally:
+            watchdog.stop()
+        return
+
+    start_time = time.time()
+    stages = StageTimer()
+    publish = None
+    if options.get('frames'):
+        publish = mesh_lod.FramePublisher(output_path, lambda info: result_queue.put(('frame', info)))
+    
+    try:
+        log_msg("Loading mesh...", 0.05)
+        
+        # The input is parsed once into a compact float32/int32 mesh: it answers the Tier 1
+        # check, is the fidelity reference, and seeds the MeshSet (and the Tier 3/4 reloads)
+        stages.lap('load')
+        ms = pymeshlab.MeshSet()
+        try:
+            reference = CompactMesh.load(filepath)
+            ms.add_mesh(reference.to_meshlab())
+        except Exception:
+            # Formats only pymeshlab reads
+            ms.load_new_mesh(filepath)
+            reference = CompactMesh.from_meshlab(ms.current_mesh()).welded()
+
+        outcome = repair_meshset(ms, reference, log_msg, options, stages, watchdog.headroom_mb, publish)
         
         # ============================================
         # EXPORT
         # ============================================
-        final_faces = ms.current_mesh().face_number()
+        final_faces = outcome['final_faces']
         log_msg(f"Exporting ({final_faces:,} faces)...", 0.95)
-        ms.save_current_mesh(output_path)
+        stages.lap('export')
+        # Written aside and moved into place: a progressive job's draft is downloadable meanwhile
+        root, ext = os.path.splitext(output_path)
+        ms.save_current_mesh(f"{root}.partial{ext}")
+        os.replace(f"{root}.partial{ext}", output_path)
+        deviation_map = None
+        if outcome['vertex_deviation'] is not None:
+            deviation_map = deviation_map_path(output_path)
+            corner_values(outcome['vertex_deviation'], ms.current_mesh().face_matrix()).tofile(deviation_map)
         
         # Final Validate
+        stages.lap('final_validate')
         try:
-            val = trimesh.load(output_path, process=True)
-            is_watertight = val.is_watertight
+            final = CompactMesh.load(output_path)
+            is_watertight = final.is_watertight
+            # Kept for incremental re-repairs of this result
+            incremental.write_defect_map(final, output_path)
+            del final
         except:
             is_watertight = True # Optimistic fallback
+        m = ms.current_mesh()
+        export_format(output_path, options, m.vertex_matrix(), m.face_matrix(), log_msg)
+        del m
+
+        # Simplified copies the viewer shows while the full result downloads
+        previews = []
+        if options.get('previews'):
+            stages.lap('previews')
+            previews = mesh_lod.write_previews(CompactMesh.from_meshlab(ms.current_mesh()), output_path, log_msg)
         
+        stages.lap()
         elapsed = time.time() - start_time
         status = "Fixed" if is_watertight else "With Gaps"
-        log_msg(f"Done in {elapsed:.1f}s - {status}", 1.0)
+        # A reconstructed draft is published as a preview and refined later at full quality;
+        # Tier 1/2 results don't depend on the draft settings, so they are final
+        draft = bool(options.get('progressive')) and outcome['tier'] > 2
+        store_output(output_path, options)
+        log_msg(f"{'Draft ready' if draft else 'Done'} in {elapsed:.1f}s - {status}", 1.0)
         
-        result_queue.put(('done', {
+        result_queue.put(('preview' if draft else 'done', {
             'success': True,
-            'method': repair_method,
-            'original_faces': original_faces,
+            'method': outcome['method'],
+            'original_faces': outcome['original_faces'],
             'final_faces': final_faces,
             'is_watertight': is_watertight,
-            'time': elapsed
+            'time': elapsed,
+            'tier': outcome['tier'],
+            'stage_times': stages.times,
+            'stage_memory_mb': stages.memory,
+            'fidelity': outcome['fidelity'],
+            'tier_fidelity': outcome['tier_fidelity'],
+            'deviation_map': deviation_map,
+            'shapes': outcome['shapes'],
+            'simplification': outcome['simplification'],
+            'previews': previews,
+            'quality': 'draft' if draft else 'full',
+            **memory_stats()
         }))
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         result_queue.put(('error', str(e)))
+    finally:
+        watchdog.stop()
+        if publish is not None:
+            publish.clear()  # Frames are stale once the result exists
+
+def repair_region(ms, log_msg):
+    """
+    Tier 2 limited to the current mesh's flagged faces (face quality > 0): cleanup, then only
+    holes bordered by flagged faces are closed.
+    """
+    log_msg("Repairing edited region...", 0.4)
+    ms.apply_filter('meshing_remove_duplicate_faces')
+    ms.apply_filter('meshing_repair_non_manifold_edges')
+    ms.apply_filter('meshing_repair_non_manifold_vertices')
+    ms.apply_filter('compute_selection_by_condition_per_face', condselect='fq > 0')
+    ms.apply_filter('meshing_close_holes', maxholesize=5000, selected=True)
+    ms.apply_filter('meshing_remove_unreferenced_vertices')
+    ms.apply_filter('meshing_re_orient_faces_coherently')
+
+def incremental_repair_worker(filepath, output_path, log_msg, options, headroom_mb=None):
+    """
+    Applies options['delta'] (see incremental.py) to a previous repair result at filepath:
+    replaced faces are spliced in and only the region around them and the result's known
+    defects is repaired again; then the transform and shapes are applied. If the local repair
+    can't seal the region, the spliced mesh goes through the full pipeline.
+    """
+    start_time = time.time()
+    stages = StageTimer()
+    delta = options['delta']
+    stages.lap('load')
+    log_msg("Loading previous result...", 0.05)
+    mesh = CompactMesh.load(filepath)
+    original_faces = len(mesh.faces)
+    defects = incremental.load_defect_map(filepath, mesh)
+
+    if delta.get('faces'):
+        stages.lap('splice')
+        mesh, region = incremental.splice(mesh, defects, delta['faces'])
+        log_msg(f"Spliced edit: {len(mesh.faces):,} faces, {int(region.sum()):,} in the edited region", 0.2)
+    else:
+        region = np.zeros(len(mesh.faces), dtype=bool)
+        region[defects] = True
+        region = incremental.grow_region(mesh, region)
+
+    method, tier, fidelity = 'Incremental Update', 1, None
+    if region.any() and not mesh.is_watertight:
+        stages.lap('region_repair')
+        ms = pymeshlab.MeshSet()
+        ms.add_mesh(pymeshlab.Mesh(vertex_matrix=mesh.vertices.astype(np.float64), face_matrix=mesh.faces,
+                                   f_scalar_array=region.astype(np.float64)))
+        repair_region(ms, log_msg)
+        repaired = CompactMesh.from_meshlab(ms.current_mesh())
+        if repaired.welded().is_watertight:
+            method, tier = 'Incremental (Region Repair)', 2
+            log_msg(f"Region repaired ({int(region.sum()):,} faces)", 0.6)
+        else:
+            log_msg("Region repair left gaps. Repairing the whole mesh...", 0.4)
+            ms = pymeshlab.MeshSet()
+            ms.add_mesh(mesh.to_meshlab())
+            rebuild = {k: v for k, v in options.items() if k not in ('delta', 'shapes', 'deviation_map')}
+            outcome = repair_meshset(ms, mesh, log_msg, rebuild, stages, headroom_mb)
+            method, tier, fidelity = outcome['method'], outcome['tier'], outcome['fidelity']
+            repaired = CompactMesh.from_meshlab(ms.current_mesh())
+        mesh = repaired
+    elif delta.get('faces'):
+        method = 'Incremental (Spliced)'
+
+    if delta.get('transform') is not None:
+        mesh = incremental.transformed(mesh, parse_matrix(delta['transform']))
+
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(mesh.to_meshlab())
+    del mesh
+    shapes_summary = None
+    if delta.get('shapes'):
+        stages.lap('union')
+        shapes_summary = merge_shapes(ms, delta['shapes'], log_msg, options, stages, headroom_mb)
+
+    stages.lap('export')
+    final_faces = ms.current_mesh().face_number()
+    log_msg(f"Exporting ({final_faces:,} faces)...", 0.95)
+    ms.save_current_mesh(output_path)
+    stages.lap('final_validate')
+    final = CompactMesh.load(output_path)
+    is_watertight = final.is_watertight
+    incremental.write_defect_map(final, output_path)
+    export_format(output_path, options, final.vertices, final.faces, log_msg)
+    previews = []
+    if options.get('previews'):
+        stages.lap('previews')
+        previews = mesh_lod.write_previews(final, output_path, log_msg)
+
+    stages.lap()
+    elapsed = time.time() - start_time
+    log_msg(f"Done in {elapsed:.1f}s - {'Fixed' if is_watertight else 'With Gaps'}", 1.0)
+    return {
+        'success': True,
+        'method': method,
+        'original_faces': original_faces,
+        'final_faces': final_faces,
+        'is_watertight': is_watertight,
+        'time': elapsed,
+        'tier': tier,
+        'stage_times': stages.times,
+        'stage_memory_mb': stages.memory,
+        'fidelity': fidelity,
+        'tier_fidelity': {},
+        'deviation_map': None,
+        'shapes': shapes_summary,
+        'previews': previews,
+        'incremental': {'delta': sorted(k for k in ('faces', 'transform', 'shapes') if delta.get(k)),
+                        'region_faces': int(region.sum()), 'known_defects': int(len(defects))},
+    }
+
+def large_repair_worker(filepath, output_path, log_msg, options, poisson_depth=None):
+    """
+    Bounded-memory pipeline for binary STLs too large for the MeshSet tiers (see large_mesh):
+    slab welding, chunked cleanup and edge validation, streamed export. Meshes that are not
+    watertight after cleanup are rebuilt by Poisson from sampled oriented points.
+    """
+    start_time = time.time()
+    stages = StageTimer()
+    count = large_mesh.stl_face_count(filepath)
+    if count is None:
+        raise ValueError("Large-mesh mode needs a binary STL")
+    transform = np.asarray(options['transform'], dtype=np.float32) if options.get('transform') else None
+    scratch = large_mesh.Scratch(os.path.dirname(os.path.abspath(output_path)))
+
+    try:
+        log_msg(f"Large-mesh mode: {count:,} faces", 0.05)
+        if options.get('shapes'):
+            log_msg(f"Large-mesh mode can't merge shapes; {len(options['shapes'])} shape(s) left out")
+        if face_target(options, count) is not None:
+            log_msg("Large-mesh mode doesn't simplify to a face budget; output left at full size")
+        stages.lap('weld')
+        vertex_count = large_mesh.weld(filepath, count, scratch, transform, log=log_msg)
+        log_msg(f"Welded {vertex_count:,} vertices", 0.3)
+
+        stages.lap('cleanup')
+        kept, degenerate, duplicates = large_mesh.clean_faces(scratch, count, vertex_count)
+        log_msg(f"Removed {degenerate:,} degenerate and {duplicates:,} duplicate faces", 0.4)
+
+        stages.lap('validate')
+        edges = large_mesh.edge_stats(scratch, kept, vertex_count)
+        log_msg(f"Open edges: {edges['boundary_edges']:,}, non-manifold: {edges['non_manifold_edges']:,}", 0.5)
+        vertices = large_mesh.window(scratch.path('vertices.f32'), np.float32, 0, vertex_count, (3,))
+
+        if edges['watertight']:
+            stages.lap('export')
+            log_msg(f"Mesh is valid. Exporting ({kept:,} faces)...", 0.8)
+            large_mesh.write_stl(output_path, vertices, scratch.path('clean.i32'), kept)
+            export_format(output_path, options, vertices,
+                          large_mesh.window(scratch.path('clean.i32'), np.int32, 0, kept, (3,)), log_msg)
+            repair_method, tier, final_faces, is_watertight = 'Passthrough (Large Mesh)', 1, kept, True
+        else:
+            stages.lap('sample')
+            log_msg("Sampling surface for reconstruction...", 0.55)
+            points, normals = large_mesh.sample_oriented_points(
+                vertices, scratch.path('clean.i32'), kept, options.get('sample_points', large_mesh.SAMPLE_POINTS))
+            del vertices
+
+            stages.lap('tier4_poisson')
+            log_msg(f"Poisson Reconstruction from {len(points):,} points...", 0.65)
+            ms = pymeshlab.MeshSet()
+            ms.add_mesh(pymeshlab.Mesh(vertex_matrix=points, v_normals_matrix=normals))
+            del points, normals
+            depth = poisson_depth(large_mesh.POISSON_DEPTH) if poisson_depth else large_mesh.POISSON_DEPTH
+            ms.apply_filter('generate_surface_reconstruction_screened_poisson', depth=depth, preclean=True)
+            ms.apply_filter('meshing_remove_connected_component_by_face_number', mincomponentsize=500)
+            ms.apply_filter('meshing_remove_unreferenced_vertices')
+
+            stages.lap('solidify')
+            solidify(ms, log_msg)
+
+            stages.lap('export')
+            final_faces = ms.current_mesh().face_number()
+            log_msg(f"Exporting ({final_faces:,} faces)...", 0.95)
+            ms.save_current_mesh(output_path)
+            m = ms.current_mesh()
+            export_format(output_path, options, m.vertex_matrix(), m.face_matrix(), log_msg)
+            del m
+            stages.lap('final_validate')
+            try:
+                is_watertight = CompactMesh.load(output_path).is_watertight
+            except:
+                is_watertight = True # Optimistic fallback
+            repair_method, tier = 'Poisson Reconstruction (Large Mesh)', 4
+
+        stages.lap()
+        elapsed = time.time() - start_time
+        log_msg(f"Done in {elapsed:.1f}s - {'Fixed' if is_watertight else 'With Gaps'}", 1.0)
+        # Deviation needs the full input in memory, so it is not measured in this mode; nor
+        # are previews built (the viewer falls back to the full compact download)
+        mesh_lod.clear_previews(output_path)
+        return {
+            'success': True,
+            'method': repair_method,
+            'original_faces': count,
+            'final_faces': final_faces,
+            'is_watertight': is_watertight,
+            'time': elapsed,
+            'tier': tier,
+            'stage_times': stages.times,
+            'stage_memory_mb': stages.memory,
+            'fidelity': None,
+            'tier_fidelity': {},
+            'deviation_map': None,
+            'large_mode': True,
+            'previews': [],
+            'shapes': {'count': len(options['shapes']), 'method': None} if options.get('shapes') else None,
+            'input_edges': edges,
+            'peak_memory_mb': peak_rss_mb()
+        }
+    finally:
+        scratch.close()
+
+@dataclass
+class RepairResult:
+    """Output of repair(): the repaired mesh as arrays plus the metrics repair_worker reports."""
+    vertices: np.ndarray          # (N, 3) float32
+    faces: np.ndarray             # (M, 3) int32
+    method: str
+    tier: int
+    is_watertight: bool
+    original_faces: int
+    final_faces: int
+    time: float
+    stage_times: dict = field(default_factory=dict)
+    stage_memory_mb: dict = field(default_factory=dict)
+    fidelity: dict = None
+    tier_fidelity: dict = field(default_factory=dict)
+    vertex_deviation: np.ndarray = None  # per output vertex, with options['deviation_map']
+    shapes: dict = None                  # merge summary, with options['shapes']
+    simplification: dict = None          # face budget summary, with options['target_faces'/'target_ratio']
+
+    @property
+    def success(self):
+        return self.tier > 0
+
+    def metrics(self):
+        """Everything but the arrays (the shape of repair_worker's 'done' payload)."""
+        return {k: v for k, v in self.__dict__.items() if not isinstance(v, np.ndarray)}
+
+def repair(vertices, faces, options=None, progress=None):
+    """
+    In-process repair of a mesh given as arrays: no files, queue or subprocess.
+
+    vertices (N, 3) and faces (M, 3) may be indexed or triangle soup (exactly coincident
+    vertices are welded). progress(message, value) receives the pipeline's messages, with
+    value in 0..1 or None for plain status lines. options are repair_worker's, except the
+    file/large-mesh ones; memory_limit_mb only steers Poisson depth and Alpha Wrap here
+    (nothing is killed in-process). Runs in the calling thread; see repair_async.
+    """
+    options = options or {}
+    def log_msg(msg, value=None):
+        if progress is not None:
+            progress(msg, value)
+    vertices, faces = np.asarray(vertices), np.asarray(faces)
+    if vertices.ndim != 2 or vertices.shape[1] != 3 or faces.ndim != 2 or faces.shape[1] != 3:
+        raise ValueError("Expected vertices (N, 3) and faces (M, 3)")
+    if len(faces) and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise ValueError("Face indices out of range")
+
+    start_time = time.time()
+    stages = StageTimer()
+    stages.lap('load')
+    reference = CompactMesh(vertices, faces).welded()
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(reference.to_meshlab())
+
+    headroom_mb = None
+    if options.get('memory_limit_mb'):
+        limit = float(options['memory_limit_mb'])
+        headroom_mb = lambda: limit - (memory_guard.current_rss_mb() or 0.0)
+
+    outcome = repair_meshset(ms, reference, log_msg, options, stages, headroom_mb)
+
+    stages.lap('final_validate')
+    result = CompactMesh.from_meshlab(ms.current_mesh())
+    is_watertight = result.welded().is_watertight
+    stages.lap()
+    elapsed = time.time() - start_time
+    log_msg(f"Done in {elapsed:.1f}s - {'Fixed' if is_watertight else 'With Gaps'}", 1.0)
+
+    return RepairResult(
+        vertices=result.vertices,
+        faces=result.faces,
+        method=outcome['method'],
+        tier=outcome['tier'],
+        is_watertight=is_watertight,
+        original_faces=outcome['original_faces'],
+        final_faces=outcome['final_faces'],
+        time=elapsed,
+        stage_times=stages.times,
+        stage_memory_mb=stages.memory,
+        fidelity=outcome['fidelity'],
+        tier_fidelity=outcome['tier_fidelity'],
+        vertex_deviation=outcome['vertex_deviation'],
+        shapes=outcome['shapes'],
+        simplification=outcome['simplification'],
+    )
+
+def _repair_relayed(vertices, faces, options, messages):
+    """repair() in a pool process, forwarding progress over a manager queue."""
+    return repair(vertices, faces, options, lambda msg, value=None: messages.put((msg, value)))
+
+async def repair_async(vertices, faces, options=None, progress=None, executor=None):
+    """
+    asyncio wrapper for repair(): runs it in `executor` (default: the loop's thread pool)
+    and calls progress on the event loop thread. A ProcessPoolExecutor isolates the native
+    filters from the caller's process; progress is then relayed through a manager queue.
+    """
+    loop = asyncio.get_running_loop()
+    if not isinstance(executor, ProcessPoolExecutor):
+        relay = None
+        if progress is not None:
+            relay = lambda msg, value=None: loop.call_soon_threadsafe(progress, msg, value)
+        return await loop.run_in_executor(executor, functools.partial(repair, vertices, faces, options, relay))
+
+    if progress is None:
+        return await loop.run_in_executor(executor, repair, vertices, faces, options)
+    with multiprocessing.Manager() as manager:
+        messages = manager.Queue()
+        future = loop.run_in_executor(executor, _repair_relayed, vertices, faces, options, messages)
+        while True:
+            finished = future.done()
+            while True:
+                try:
+                    progress(*messages.get_nowait())
+                except queue.Empty:
+                    break
+            if finished:
+                return future.result()
+            await asyncio.sleep(0.1)
 
-def repair_mesh(*args, **kwargs):
-    raise NotImplementedError("Use repair_worker via Multiprocessing")
+def repair_mesh(input_path, output_path, options=None, progress=None):
+    """File-to-file convenience over repair(): loads input_path, repairs in-process, saves output_path."""
+    mesh = CompactMesh.load(input_path)
+    result = repair(mesh.vertices, mesh.faces, options, progress)
+    ms = pymeshlab.MeshSet()
+    ms.add_mesh(CompactMesh(result.vertices, result.faces).to_meshlab())
+    ms.save_current_mesh(output_path)
+    return result
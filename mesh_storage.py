@@ -0,0 +1,176 @@
+"""
+Compressed storage for uploads (temp_uploads) and repair outputs (fixed_meshes).
+
+Files are written as usual and then compress()ed at rest: the bytes move to `<path>.gz`
+(gzip level 1: fast, and every HTTP client accepts it, so downloads can pass the stored
+bytes through). Callers keep naming the file by its plain path; the helpers here find where
+its bytes are. A plain file at the path wins over a compressed copy, so a writer replaces a
+stored file simply by writing it again.
+
+Streaming readers (downloads, ZIPs) use chunks(). Code that needs a real file (mesh loaders,
+memory maps) uses local_copy(), which decompresses to a temporary file beside it for the
+duration. NAOSHI_COMPRESS_STORAGE=0 leaves new files uncompressed.
+"""
+import os
+import shutil
+import tempfile
+import zlib
+from contextlib import contextmanager
+
+import large_mesh
+
+SUFFIX = '.gz'
+ENCODING = 'gzip'
+LEVEL = 1
+CHUNK = 1024 * 1024
+MAX_RATIO = 0.9  # Files that don't compress below this share of their size stay plain
+ENABLED = os.environ.get('NAOSHI_COMPRESS_STORAGE', '1') != '0'
+
+
+def stored(path):
+    """Path holding the bytes of `path`: the plain file, else its compressed copy, else None."""
+    if os.path.exists(path):
+        return path
+    if os.path.exists(path + SUFFIX):
+        return path + SUFFIX
+    return None
+
+
+def exists(path):
+    return stored(path) is not None
+
+
+def is_compressed(path):
+    return stored(path) == path + SUFFIX
+
+
+def getmtime(path):
+    """Modification time of the content (compress() keeps the plain file's)."""
+    return os.path.getmtime(stored(path) or path)
+
+
+def remove(path):
+    for candidate in (path, path + SUFFIX):
+        try:
+            os.remove(candidate)
+        except FileNotFoundError:
+            pass
+
+
+def compress(path, level=LEVEL):
+    """Moves a plain file into its compressed form (unless disabled or incompressible). Returns the stored path."""
+    if not ENABLED or not os.path.exists(path):
+        return stored(path)
+    stat = os.stat(path)
+    temp_path = f"{path}{SUFFIX}.{os.getpid()}.tmp"
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # gzip container
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        while data := src.read(CHUNK):
+            dst.write(compressor.compress(data))
+        dst.write(compressor.flush())
+    if os.path.getsize(temp_path) > MAX_RATIO * stat.st_size:
+        os.remove(temp_path)
+        return path
+    os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp_path, path + SUFFIX)
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # Open in a reader (Windows): the plain file keeps winning until next time
+    return path + SUFFIX
+
+
+def store(data_path, path, compressed=False):
+    """Moves data_path (plain, or gzip data if `compressed`) into place as `path`, replacing any stored form."""
+    target = path + SUFFIX if compressed else path
+    os.replace(data_path, target)
+    for other in (path, path + SUFFIX):
+        if other != target and os.path.exists(other):
+            os.remove(other)
+
+
+def chunks(path, size=CHUNK):
+    """Yields the content of `path` (decompressed) in chunks of about `size` bytes."""
+    source = stored(path)
+    if source is None:
+        raise FileNotFoundError(path)
+    decompressor = zlib.decompressobj(31) if source != path else None
+    with open(source, 'rb') as f:
+        while data := f.read(size):
+            yield decompressor.decompress(data) if decompressor else data
+    if decompressor:
+        yield decompressor.flush()
+
+
+def extract(path, dest):
+    """Writes the content of `path` as a plain file at dest (with its modification time, like copy2)."""
+    source = stored(path)
+    if source == path:
+        shutil.copy2(path, dest)
+        return
+    with open(dest, 'wb') as f:
+        for data in chunks(path):
+            f.write(data)
+    shutil.copystat(source, dest)
+
+
+@contextmanager
+def local_copy(path):
+    """Plain file with the content of `path` for the block: the file itself, or a temporary decompressed copy."""
+    if stored(path) in (path, None):
+        yield path
+        return
+    ext = os.path.splitext(path)[1]
+    fd, temp_path = tempfile.mkstemp(prefix='.local_', suffix=ext, dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        extract(path, temp_path)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def on_local_copy(func, path, *args):
+    """func(plain_path, *args) on a local_copy of `path` (picklable, for executors)."""
+    with local_copy(path) as local:
+        return func(local, *args)
+
+
+def copy(src, dst):
+    """Copies the stored form of src to dst (no decompression), replacing any stored form of dst."""
+    source = stored(src)
+    if source is None:
+        raise FileNotFoundError(src)
+    target = dst + SUFFIX if source != src else dst
+    shutil.copyfile(source, target)
+    for other in (dst, dst + SUFFIX):
+        if other != target and os.path.exists(other):
+            os.remove(other)
+
+
+def stl_face_count(path):
+    """large_mesh.stl_face_count for a stored file, reading only the head of a compressed one."""
+    if not is_compressed(path):
+        return large_mesh.stl_face_count(path)
+    try:
+        with open(path + SUFFIX, 'rb') as f:
+            head = zlib.decompressobj(31).decompress(f.read(4096), 84)
+            f.seek(-4, os.SEEK_END)
+            size = int.from_bytes(f.read(4), 'little')  # gzip trailer: content size mod 2^32
+    except OSError:
+        return None
+    if len(head) < 84:
+        return None
+    count = int.from_bytes(head[80:84], 'little')
+    return count if (84 + 50 * count) % 2 ** 32 == size else None
+
+
+def needs_large_mode(path, budget_mb=None):
+    """large_mesh.needs_large_mode for a stored file, without decompressing a compressed one."""
+    if not is_compressed(path):
+        return large_mesh.needs_large_mode(path, budget_mb)
+    count = stl_face_count(path)
+    return count is not None and large_mesh.exceeds_budget(84 + 50 * count, budget_mb)
@@ -0,0 +1,4 @@
+@echo off
+REM Headless batch repair: naoshi-batch <folders or globs> [options]
+if exist "%~dp0venv" call "%~dp0venv\Scripts\activate.bat"
+python "%~dp0naoshi_batch.py" %*
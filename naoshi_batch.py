@@ -0,0 +1,306 @@
+"""
+Headless batch repair.
+
+Repairs every mesh in the given directories/globs across a pool of repair processes and
+appends one JSON line per finished file to a manifest. Re-running with the same manifest
+skips files already repaired (same content hash, output still present), so an interrupted
+run picks up where it stopped.
+
+    python naoshi_batch.py models/ "scans/**/*.stl" --workers 4
+
+Outputs follow the desktop app: <name>_fixed<ext> next to the input, or in a fixed_meshes
+folder beside it with --output-folder (or in --output-dir).
+"""
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import signal
+import argparse
+import multiprocessing
+
+from mesh_repair import repair_worker
+from chunked_upload import ContentHasher
+from large_mesh import memory_budget_mb
+import memory_guard
+
+MESH_EXTENSIONS = ('.stl', '.obj', '.ply', '.off')
+SUFFIX = '_fixed'
+OUTPUT_FOLDER = 'fixed_meshes'
+MANIFEST_NAME = 'naoshi_manifest.jsonl'
+HANG_TIMEOUT = 300.0   # seconds without a message before a repair is killed (as the desktop app)
+POLL_INTERVAL = 0.1
+
+
+def find_inputs(patterns, recursive=False):
+    """Mesh files from files, directories and glob patterns (our own outputs are skipped)."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, '**' if recursive else '', '*'), recursive=recursive)
+        else:
+            matches = glob.glob(pattern, recursive=True) or ([pattern] if os.path.isfile(pattern) else [])
+        for path in matches:
+            name, ext = os.path.splitext(os.path.basename(path))
+            if (os.path.isfile(path) and ext.lower() in MESH_EXTENSIONS and not name.endswith(SUFFIX)
+                    and os.path.basename(os.path.dirname(path)) != OUTPUT_FOLDER):
+                found.append(os.path.abspath(path))
+    return sorted(set(found))
+
+
+def output_path_for(input_path, suffix=True, output_folder=False, output_dir=None):
+    """<name>_fixed<ext> next to the input, in <input dir>/fixed_meshes, or in output_dir."""
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    if output_dir:
+        folder = output_dir
+    elif output_folder:
+        folder = os.path.join(os.path.dirname(input_path), OUTPUT_FOLDER)
+    else:
+        folder = os.path.dirname(input_path)
+    return os.path.join(folder, f"{name}{SUFFIX if suffix else ''}{ext}")
+
+
+def file_hash(path):
+    """Same content hash as the server's upload dedupe (chunked_upload.content_hash)."""
+    hasher = ContentHasher()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def load_manifest(path):
+    """Latest record per input hash + output path from an existing manifest."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line of an interrupted run
+            records[(record.get('input_hash'), record.get('output'))] = record
+    return records
+
+
+def append_manifest(path, record):
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class BatchJob:
+    """One input file and its current repair process."""
+
+    def __init__(self, input_path, output_path, input_hash, options):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.input_hash = input_hash
+        self.options = dict(options)
+        self.queue = None
+        self.process = None
+        self.started = None
+        self.last_message = None
+        self.result = None
+        self.error = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=repair_worker, daemon=True,
+                                               args=(self.input_path, self.output_path, self.queue, self.options))
+        self.started = self.started or time.time()
+        self.last_message = time.time()
+        self.process.start()
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+            if self.process.is_alive():
+                # Forked children inherit our SIGTERM handler, which can't run inside a native filter
+                self.process.kill()
+                self.process.join()
+
+    def record(self):
+        result = self.result or {}
+        return {
+            'input': self.input_path,
+            'input_hash': self.input_hash,
+            'output': self.output_path,
+            'status': 'done' if self.result else 'error',
+            'error': self.error,
+            'method': result.get('method'),
+            'tier': result.get('tier'),
+            'is_watertight': result.get('is_watertight'),
+            'original_faces': result.get('original_faces'),
+            'final_faces': result.get('final_faces'),
+            'time': round(time.time() - self.started, 3),
+            'repair_time': result.get('time'),
+            'stage_times': result.get('stage_times'),
+            'peak_memory_mb': result.get('peak_memory_mb'),
+            'memory_level': self.options.get('memory_level', 0),
+            'options': self.options,
+            'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+
+def service(job, hang_timeout, verbose=False):
+    """Drains a job's messages; returns True once it has finished (result or error set)."""
+    while True:
+        try:
+            msg_type, content = job.queue.get_nowait()
+        except queue.Empty:
+            break
+        job.last_message = time.time()
+        if msg_type == 'done':
+            job.result = content
+            return True
+        if msg_type == 'error':
+            job.error = content
+            return True
+        if verbose:
+            text = content[0] if msg_type == 'progress' else content
+            print(f"  {os.path.basename(job.input_path)}: {text}", flush=True)
+
+    if not job.process.is_alive() and job.queue.empty():
+        options = None
+        if memory_guard.is_memory_failure(job.process.exitcode):
+            options = memory_guard.downgrade_options(job.options, job.input_path)
+        if options is not None:
+            print(f"  {os.path.basename(job.input_path)}: out of memory, retrying at memory level "
+                  f"{options['memory_level']}", flush=True)
+            job.options = options
+            job.start()
+            return False
+        job.error = ('Out of memory even at the lowest settings' if memory_guard.is_memory_failure(job.process.exitcode)
+                     else 'Process terminated unexpectedly')
+        return True
+
+    if time.time() - job.last_message > hang_timeout:
+        job.stop()
+        job.error = f"No progress for {hang_timeout:.0f}s (hang)"
+        return True
+    return False
+
+
+def run_batch(inputs, manifest_path, workers, options, suffix=True, output_folder=False, output_dir=None,
+              retry_failed=False, hang_timeout=HANG_TIMEOUT, verbose=False):
+    """Repairs `inputs` with up to `workers` concurrent processes. Returns the new manifest records."""
+    previous = load_manifest(manifest_path)
+    pending = []
+    skipped = 0
+    for path in inputs:
+        output = output_path_for(path, suffix, output_folder, output_dir)
+        digest = file_hash(path)
+        record = previous.get((digest, output))
+        if record and (record['status'] == 'done' and os.path.exists(output)
+                       or record['status'] == 'error' and not retry_failed):
+            skipped += 1
+            continue
+        pending.append(BatchJob(path, output, digest, options))
+
+    # Largest first: the long repairs start early instead of trailing at the end
+    pending.sort(key=lambda job: os.path.getsize(job.input_path), reverse=True)
+    total = len(pending)
+    print(f"{total} file(s) to repair, {skipped} already in {manifest_path}; {workers} worker(s)", flush=True)
+
+    running, records = [], []
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                job = pending.pop(0)
+                print(f"[{len(records) + len(running) + 1}/{total}] {job.input_path}", flush=True)
+                job.start()
+                running.append(job)
+
+            for job in list(running):
+                if not service(job, hang_timeout, verbose):
+                    continue
+                running.remove(job)
+                job.stop()
+                record = job.record()
+                append_manifest(manifest_path, record)
+                records.append(record)
+                if record['status'] == 'done':
+                    print(f"  done {os.path.basename(job.input_path)}: tier {record['tier']} ({record['method']}), "
+                          f"{'watertight' if record['is_watertight'] else 'with gaps'}, {record['time']:.1f}s", flush=True)
+                else:
+                    print(f"  FAILED {os.path.basename(job.input_path)}: {record['error']}", flush=True)
+            time.sleep(POLL_INTERVAL)
+    finally:
+        for job in running:
+            job.stop()
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='naoshi-batch', description="Repair many meshes with a pool of repair processes.")
+    parser.add_argument('inputs', nargs='+', help="Files, directories or glob patterns (quote globs)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Search directories recursively")
+    parser.add_argument('-j', '--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Concurrent repairs (default: half the CPU cores)")
+    parser.add_argument('--manifest', help=f"JSONL manifest (default: {MANIFEST_NAME} in the current directory)")
+    parser.add_argument('--no-suffix', action='store_true', help=f"Don't add '{SUFFIX}' to output names")
+    parser.add_argument('--output-folder', action='store_true', help=f"Write to a {OUTPUT_FOLDER} folder beside each input")
+    parser.add_argument('--output-dir', help="Write all outputs to this directory")
+    parser.add_argument('--retry-failed', action='store_true', help="Re-run files whose last attempt failed")
+    parser.add_argument('--max-deviation', type=float, help="Reject Tier 2/3 results deviating more (fraction of bbox diagonal)")
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument('--target-faces', type=int, help="Simplify each result toward this many faces")
+    budget.add_argument('--target-ratio', type=float, help="...or toward this share of its input's faces")
+    parser.add_argument('--simplify-tolerance', type=float,
+                        help="Max deviation simplifying may add (fraction of bbox diagonal, default 0.005)")
+    parser.add_argument('--memory-limit-mb', type=float,
+                        help="Per-repair memory ceiling (default: the memory budget shared across workers)")
+    parser.add_argument('--hang-timeout', type=float, default=HANG_TIMEOUT, help="Kill a repair silent for this long")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Print every progress message")
+    args = parser.parse_args()
+
+    if args.no_suffix and not (args.output_folder or args.output_dir):
+        parser.error("--no-suffix would overwrite the inputs; combine it with --output-folder or --output-dir")
+
+    inputs = find_inputs(args.inputs, args.recursive)
+    if not inputs:
+        print("No mesh files found.")
+        return 1
+
+    workers = max(1, args.workers)
+    options = {}
+    if args.max_deviation is not None:
+        options['max_deviation'] = args.max_deviation
+    if args.target_faces or args.target_ratio:
+        options.update(target_faces=args.target_faces, target_ratio=args.target_ratio,
+                       simplify_tolerance=args.simplify_tolerance)
+    if args.memory_limit_mb:
+        options['memory_limit_mb'] = args.memory_limit_mb
+    elif not os.environ.get('NAOSHI_WORKER_MEMORY_MB'):
+        # Parallel repairs share the budget; larger inputs then switch to large-mesh mode
+        options['memory_limit_mb'] = round(memory_budget_mb() / workers, 1)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    started = time.time()
+    try:
+        records = run_batch(inputs, args.manifest or MANIFEST_NAME, workers, options, not args.no_suffix,
+                            args.output_folder, args.output_dir, args.retry_failed, args.hang_timeout, args.verbose)
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume.")
+        return 130
+
+    failed = sum(1 for r in records if r['status'] != 'done')
+    gaps = sum(1 for r in records if r['status'] == 'done' and not r['is_watertight'])
+    print(f"Repaired {len(records) - failed}/{len(records)} in {time.time() - started:.1f}s"
+          f" ({gaps} with gaps, {failed} failed)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,238 @@
+
+import os
+import sys
+import json
+import zlib
+import argparse
+import numpy as np
+import trimesh
+
+# Size tiers: name -> target face count (before defects are injected)
+TIERS = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '500k': 500_000,
+    '1m': 1_000_000,
+    '5m': 5_000_000,
+}
+
+# Defect profiles: name -> defect settings. Radii are fractions of the bbox diagonal.
+PROFILES = {
+    'mixed': {
+        'holes': [0.004, 0.015, 0.05],
+        'fans': 12,
+        'flipped': [0.03, 0.06],
+        'intersections': [0.02, 0.04],
+        'shells': [(0.08, 0.0), (0.06, 0.002)],
+        'degenerate': 50,
+    },
+    'holes': {'holes': [0.002, 0.004, 0.008, 0.015, 0.03, 0.05, 0.08]},
+    'nonmanifold': {'fans': 40},
+    'flipped': {'flipped': [0.02, 0.04, 0.08]},
+    'intersections': {'intersections': [0.02, 0.03, 0.05]},
+    'shells': {'shells': [(0.3, 0.0), (0.1, 0.001), (0.1, 0.004)]},
+    'degenerate': {'degenerate': 500},
+    'clean': {},
+}
+
+
+def make_torus(target_faces, major=40.0, minor=12.0, bumps=0.08):
+    """Watertight bumpy torus with ~target_faces faces (2 * nu * nv)."""
+    nv = max(8, int(round(np.sqrt(target_faces / 2 / 3))))
+    nu = max(8, int(round(target_faces / 2 / nv)))
+
+    u = np.linspace(0, 2 * np.pi, nu, endpoint=False)
+    v = np.linspace(0, 2 * np.pi, nv, endpoint=False)
+    uu, vv = np.meshgrid(u, v, indexing='ij')
+    # Low-frequency surface detail so reconstruction smearing is measurable
+    r = minor * (1.0 + bumps * np.sin(5 * uu) * np.cos(3 * vv))
+    verts = np.stack([
+        (major + r * np.cos(vv)) * np.cos(uu),
+        (major + r * np.cos(vv)) * np.sin(uu),
+        r * np.sin(vv),
+    ], axis=-1).reshape(-1, 3)
+
+    i = np.arange(nu)[:, None]
+    j = np.arange(nv)[None, :]
+    a = i * nv + j
+    b = ((i + 1) % nu) * nv + j
+    c = ((i + 1) % nu) * nv + (j + 1) % nv
+    d = i * nv + (j + 1) % nv
+    faces = np.concatenate([
+        np.stack([a, b, c], axis=-1).reshape(-1, 3),
+        np.stack([a, c, d], axis=-1).reshape(-1, 3),
+    ])
+
+    # Outward winding (positive volume)
+    if trimesh.Trimesh(verts, faces, process=False).volume < 0:
+        faces = faces[:, ::-1]
+    return verts, faces
+
+
+def _centroids(verts, faces):
+    return verts[faces].mean(axis=1)
+
+
+def _region(verts, faces, rng, radius):
+    """Face mask of a random spherical region around a random face centroid."""
+    cent = _centroids(verts, faces)
+    center = cent[rng.integers(len(faces))]
+    return np.linalg.norm(cent - center, axis=1) < radius
+
+
+def _append(verts, faces, new_verts, new_faces):
+    """Append geometry whose face indices are relative to new_verts."""
+    return (np.concatenate([verts, new_verts]),
+            np.concatenate([faces, new_faces + len(verts)]))
+
+
+def punch_holes(verts, faces, rng, radii, diag):
+    for rad in radii:
+        faces = faces[~_region(verts, faces, rng, rad * diag)]
+    return verts, faces
+
+
+def flip_patches(verts, faces, rng, radii, diag):
+    faces = faces.copy()
+    for rad in radii:
+        mask = _region(verts, faces, rng, rad * diag)
+        faces[mask] = faces[mask][:, ::-1]
+    return verts, faces
+
+
+def add_fans(verts, faces, rng, count, fins=2):
+    """Extra fins on existing edges: each chosen edge ends up shared by 2 + fins faces."""
+    picks = faces[rng.choice(len(faces), size=min(count, len(faces)), replace=False)]
+    a, b = picks[:, 0], picks[:, 1]
+    mid = (verts[a] + verts[b]) / 2
+    length = np.linalg.norm(verts[a] - verts[b], axis=1)[:, None]
+    new_verts, new_faces = [], []
+    for k in range(fins):
+        direction = rng.normal(size=mid.shape)
+        direction /= np.linalg.norm(direction, axis=1)[:, None]
+        apex_idx = len(verts) + k * len(picks) + np.arange(len(picks))
+        new_verts.append(mid + direction * length * 2.0)
+        new_faces.append(np.stack([a, b, apex_idx], axis=-1))
+    # Fan faces reference existing vertices directly, so append without offset
+    return np.concatenate([verts] + new_verts), np.concatenate([faces] + new_faces)
+
+
+def add_intersections(verts, faces, rng, radii, diag):
+    """Copies of surface patches rotated 90 degrees about their centroid (piercing fins)."""
+    for rad in radii:
+        patch = faces[_region(verts, faces, rng, rad * diag)]
+        used, local = np.unique(patch, return_inverse=True)
+        pts = verts[used]
+        center = pts.mean(axis=0)
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        rot = trimesh.transformations.rotation_matrix(np.pi / 2, axis, center)
+        moved = trimesh.transform_points(pts, rot)
+        verts, faces = _append(verts, faces, moved, local.reshape(-1, 3))
+    return verts, faces
+
+
+def add_shells(verts, faces, rng, shells, diag):
+    """Duplicated (optionally offset) shells over surface regions."""
+    for rad, offset in shells:
+        patch = faces[_region(verts, faces, rng, rad * diag)]
+        used, local = np.unique(patch, return_inverse=True)
+        shift = rng.normal(size=3)
+        shift *= offset * diag / np.linalg.norm(shift)
+        verts, faces = _append(verts, faces, verts[used] + shift, local.reshape(-1, 3))
+    return verts, faces
+
+
+def add_degenerate(verts, faces, rng, count):
+    """Zero-area faces: repeated indices and collinear triples."""
+    half = count // 2
+    picks = faces[rng.choice(len(faces), size=count - half)]
+    repeated = np.stack([picks[:, 0], picks[:, 0], picks[:, 1]], axis=-1)
+
+    picks = faces[rng.choice(len(faces), size=half)]
+    mid = (verts[picks[:, 0]] + verts[picks[:, 1]]) / 2
+    mid_idx = len(verts) + np.arange(half)
+    collinear = np.stack([picks[:, 0], picks[:, 1], mid_idx], axis=-1)
+    return np.concatenate([verts, mid]), np.concatenate([faces, repeated, collinear])
+
+
+def make_broken_mesh(target_faces, defects, seed):
+    """Returns (vertices, faces) of a synthetic broken mesh. Deterministic for a given seed."""
+    rng = np.random.default_rng(seed)
+    verts, faces = make_torus(target_faces)
+    diag = float(np.linalg.norm(verts.max(axis=0) - verts.min(axis=0)))
+
+    # Removals first, then in-place edits, then appended geometry
+    if defects.get('holes'):
+        verts, faces = punch_holes(verts, faces, rng, defects['holes'], diag)
+    if defects.get('flipped'):
+        verts, faces = flip_patches(verts, faces, rng, defects['flipped'], diag)
+    if defects.get('intersections'):
+        verts, faces = add_intersections(verts, faces, rng, defects['intersections'], diag)
+    if defects.get('shells'):
+        verts, faces = add_shells(verts, faces, rng, defects['shells'], diag)
+    if defects.get('fans'):
+        verts, faces = add_fans(verts, faces, rng, defects['fans'])
+    if defects.get('degenerate'):
+        verts, faces = add_degenerate(verts, faces, rng, defects['degenerate'])
+    return verts, faces
+
+
+def entry_seed(seed, name):
+    # Stable across runs and platforms (unlike hash())
+    return (seed * 1_000_003 + zlib.crc32(name.encode())) % (2 ** 32)
+
+
+def build_corpus(out_dir, tiers, profiles, seed=0, force=False):
+    """Generate (or reuse) corpus files and write manifest.json. Returns the manifest entries."""
+    os.makedirs(out_dir, exist_ok=True)
+    entries = []
+    for tier in tiers:
+        for profile in profiles:
+            name = f"{tier}_{profile}_s{seed}"
+            path = os.path.join(out_dir, f"{name}.stl")
+            if force or not os.path.exists(path):
+                print(f"Generating {name}...")
+                verts, faces = make_broken_mesh(TIERS[tier], PROFILES[profile], entry_seed(seed, name))
+                trimesh.Trimesh(verts, faces, process=False).export(path)
+            entries.append({
+                'name': name,
+                'tier': tier,
+                'profile': profile,
+                'seed': seed,
+                'target_faces': TIERS[tier],
+                'defects': PROFILES[profile],
+                'path': os.path.abspath(path),
+                'size_mb': round(os.path.getsize(path) / 1024 / 1024, 2),
+            })
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(entries, f, indent=2)
+    return entries
+
+
+def parse_list(value, choices):
+    items = [v.strip() for v in value.split(',') if v.strip()]
+    for item in items:
+        if item not in choices:
+            raise argparse.ArgumentTypeError(f"Unknown '{item}' (choose from {', '.join(choices)})")
+    return items
+
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Generate the synthetic broken-mesh benchmark corpus.")
+    parser.add_argument('--out', default=os.path.join(base_dir, 'bench_corpus'))
+    parser.add_argument('--tiers', default='10k,100k,1m', type=lambda v: parse_list(v, TIERS))
+    parser.add_argument('--profiles', default='mixed', type=lambda v: parse_list(v, PROFILES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help="Regenerate files that already exist")
+    args = parser.parse_args()
+
+    entries = build_corpus(args.out, args.tiers, args.profiles, args.seed, args.force)
+    for e in entries:
+        print(f"{e['name']:<32} {e['size_mb']:>8.2f} MB  {e['path']}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+
+import os
+import sys
+import json
+import time
+import queue
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import trimesh
+from mesh_repair import repair_worker
+from mesh_fidelity import surface_deviation
+from bench_corpus import TIERS, PROFILES, build_corpus, parse_list
+
+REPORT_SCHEMA = 1
+
+# Default regression tolerances (relative to baseline)
+THROUGHPUT_TOL = 0.25
+MEMORY_TOL = 0.25
+DEVIATION_TOL = 0.10
+DEVIATION_FLOOR = 1e-4  # relative-to-diagonal deviations below this are noise
+
+
+def file_deviation(input_path, output_path, samples):
+    """Two-sided sampled surface deviation between two mesh files (see mesh_fidelity)."""
+    src = trimesh.load(input_path, process=False)
+    dst = trimesh.load(output_path, process=False)
+    stats, _ = surface_deviation(src.vertices, src.faces, dst.vertices, dst.faces, samples=samples)
+    return stats
+
+
+def run_one(entry, out_dir, timeout, samples):
+    """Repair one corpus entry in a fresh process and collect timing/memory/quality."""
+    output_path = os.path.join(out_dir, f"{entry['name']}_fixed.stl")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+
+    ctx = multiprocessing.get_context('spawn')
+    q = ctx.Queue()
+    start = time.perf_counter()
+    p = ctx.Process(target=repair_worker, args=(entry['path'], output_path, q))
+    p.start()
+
+    record = {k: entry[k] for k in ('name', 'tier', 'profile', 'seed', 'target_faces', 'size_mb')}
+    payload = None
+    status = 'crash'
+
+    def drain(wait):
+        nonlocal payload, status
+        try:
+            while True:
+                msg_type, content = q.get(timeout=wait) if wait else q.get_nowait()
+                if msg_type == 'done':
+                    payload, status = content, 'ok'
+                elif msg_type == 'error':
+                    record['error'], status = content, 'error'
+        except queue.Empty:
+            pass
+
+    while True:
+        drain(0)
+        if status != 'crash':
+            break
+        if not p.is_alive():
+            # It may have sent its result and exited since the drain above
+            p.join()
+            drain(1.0)
+            break
+        if time.perf_counter() - start > timeout:
+            p.terminate()
+            status = 'timeout'
+            break
+        time.sleep(0.05)
+    p.join()
+    wall = time.perf_counter() - start
+
+    record['status'] = status
+    record['wall_time'] = round(wall, 3)
+    if payload is None:
+        return record
+
+    record['repair'] = {
+        'method': payload['method'],
+        'tier': payload.get('tier'),
+        'original_faces': payload['original_faces'],
+        'final_faces': payload['final_faces'],
+        'is_watertight': bool(payload['is_watertight']),
+        'time': round(payload['time'], 3),
+        'stage_times': payload.get('stage_times', {}),
+        'peak_memory_mb': payload.get('peak_memory_mb'),
+        'stage_memory_mb': payload.get('stage_memory_mb', {}),
+    }
+    record['throughput_faces_per_s'] = round(payload['original_faces'] / max(wall, 1e-6), 1)
+    try:
+        record['quality'] = file_deviation(entry['path'], output_path, samples)
+    except Exception as e:
+        record['quality'] = {'error': str(e)}
+    return record
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(entries, out_dir, timeout, samples):
+    os.makedirs(out_dir, exist_ok=True)
+    results = []
+    for entry in entries:
+        print(f"[{entry['name']}] repairing ({entry['size_mb']:.1f} MB)...")
+        rec = run_one(entry, out_dir, timeout, samples)
+        rep = rec.get('repair', {})
+        q = rec.get('quality', {})
+        print(f"[{entry['name']}] {rec['status']} in {rec['wall_time']:.2f}s"
+              f" tier={rep.get('tier')} watertight={rep.get('is_watertight')}"
+              f" peak={rep.get('peak_memory_mb')}MB hausdorff_rel={q.get('hausdorff_rel')}")
+        results.append(rec)
+
+    return {
+        'schema': REPORT_SCHEMA,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'machine': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {'timeout': timeout, 'samples': samples},
+        'results': results,
+    }
+
+
+def compare_reports(current, baseline, throughput_tol=THROUGHPUT_TOL,
+                    memory_tol=MEMORY_TOL, deviation_tol=DEVIATION_TOL):
+    """Returns a list of regression dicts (empty when current is at least as good as baseline)."""
+    base_by_name = {r['name']: r for r in baseline.get('results', [])}
+    regressions = []
+
+    def flag(name, metric, base, cur, message):
+        regressions.append({'name': name, 'metric': metric, 'baseline': base,
+                            'current': cur, 'message': message})
+
+    for cur in current.get('results', []):
+        name = cur['name']
+        base = base_by_name.get(name)
+        if base is None:
+            continue
+        if base['status'] == 'ok' and cur['status'] != 'ok':
+            flag(name, 'status', base['status'], cur['status'], "Repair no longer completes")
+            continue
+        if cur['status'] != 'ok' or base['status'] != 'ok':
+            continue
+
+        b_rep, c_rep = base['repair'], cur['repair']
+        if b_rep['is_watertight'] and not c_rep['is_watertight']:
+            flag(name, 'is_watertight', True, False, "Output is no longer watertight")
+        if (b_rep.get('tier') or 0) and (c_rep.get('tier') or 0) > b_rep['tier']:
+            flag(name, 'tier', b_rep['tier'], c_rep['tier'], "Escalated to a more destructive tier")
+
+        b_tp, c_tp = base['throughput_faces_per_s'], cur['throughput_faces_per_s']
+        if c_tp < b_tp * (1 - throughput_tol):
+            flag(name, 'throughput_faces_per_s', b_tp, c_tp,
+                 f"Throughput dropped {100 * (1 - c_tp / b_tp):.0f}%")
+
+        b_mem, c_mem = b_rep.get('peak_memory_mb'), c_rep.get('peak_memory_mb')
+        if b_mem and c_mem and c_mem > b_mem * (1 + memory_tol):
+            flag(name, 'peak_memory_mb', b_mem, c_mem,
+                 f"Peak memory grew {100 * (c_mem / b_mem - 1):.0f}%")
+
+        b_q, c_q = base.get('quality', {}), cur.get('quality', {})
+        for metric in ('hausdorff_rel', 'mean_rel'):
+            if metric not in b_q or metric not in c_q:
+                continue
+            limit = max(b_q[metric] * (1 + deviation_tol), b_q[metric] + DEVIATION_FLOOR)
+            if c_q[metric] > limit:
+                flag(name, metric, b_q[metric], c_q[metric], "Deviation from input increased")
+
+    return regressions
+
+
+def print_regressions(regressions):
+    if not regressions:
+        print("No regressions against baseline.")
+        return
+    print(f"{len(regressions)} regression(s):")
+    for r in regressions:
+        print(f"  {r['name']:<28} {r['metric']:<24} {r['baseline']} -> {r['current']}  ({r['message']})")
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    print(f"Report written: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repair pipeline benchmark and regression suite.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help="Generate the corpus (if needed) and benchmark it")
+    run.add_argument('--corpus', default=os.path.join(BASE_DIR, 'bench_corpus'))
+    run.add_argument('--tiers', default='10k,100k,1m', type=lambda v: parse_list(v, TIERS))
+    run.add_argument('--profiles', default='mixed', type=lambda v: parse_list(v, PROFILES))
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--timeout', type=float, default=600.0, help="Per-mesh limit in seconds")
+    run.add_argument('--samples', type=int, default=100_000, help="Surface samples for deviation")
+    run.add_argument('--report', default=os.path.join(BASE_DIR, 'bench_results', 'report.json'))
+    run.add_argument('--baseline', help="Compare against this report and exit 1 on regressions")
+
+    cmp_ = sub.add_parser('compare', help="Compare two existing reports")
+    cmp_.add_argument('current')
+    cmp_.add_argument('baseline')
+
+    for p in (run, cmp_):
+        p.add_argument('--throughput-tol', type=float, default=THROUGHPUT_TOL)
+        p.add_argument('--memory-tol', type=float, default=MEMORY_TOL)
+        p.add_argument('--deviation-tol', type=float, default=DEVIATION_TOL)
+
+    args = parser.parse_args()
+    tols = dict(throughput_tol=args.throughput_tol, memory_tol=args.memory_tol,
+                deviation_tol=args.deviation_tol)
+
+    if args.command == 'run':
+        entries = build_corpus(args.corpus, args.tiers, args.profiles, args.seed)
+        out_dir = os.path.join(os.path.dirname(os.path.abspath(args.report)), 'outputs')
+        report = run_suite(entries, out_dir, args.timeout, args.samples)
+        save_json(report, args.report)
+        if not args.baseline:
+            return 0
+        regressions = compare_reports(report, load_json(args.baseline), **tols)
+    else:
+        regressions = compare_reports(load_json(args.current), load_json(args.baseline), **tols)
+
+    print_regressions(regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
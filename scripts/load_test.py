@@ -0,0 +1,273 @@
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import threading
+import multiprocessing
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+try:
+    import httpx
+    import websockets
+except ImportError as e:
+    print(f"Load test needs httpx and websockets: {e}")
+    sys.exit(1)
+
+ENDPOINTS = ['upload', 'auto_orient', 'repair', 'ws_connect', 'ws_first_event', 'repair_total', 'download', 'flow']
+
+
+def make_test_mesh():
+    """Small broken torus that Tier 2 repairs in about a second (binary STL bytes)."""
+    import io
+    import trimesh
+    from bench_corpus import make_broken_mesh
+    verts, faces = make_broken_mesh(5000, {'holes': [0.004, 0.006]}, seed=7)
+    buf = io.BytesIO()
+    trimesh.Trimesh(verts, faces, process=False).export(buf, file_type='stl')
+    return buf.getvalue()
+
+
+def unique_bytes(mesh_bytes):
+    """
+    Same geometry, different content hash, so the server's upload/repair dedupe doesn't
+    short-circuit the flow: rewrites a binary STL header, or appends an OBJ comment.
+    """
+    tag = uuid.uuid4().hex.encode()
+    count = int.from_bytes(mesh_bytes[80:84], 'little') if len(mesh_bytes) >= 84 else -1
+    if len(mesh_bytes) == 84 + 50 * count:
+        return tag.ljust(80, b' ') + mesh_bytes[80:]
+    if mesh_bytes.lstrip().startswith(b'solid'):
+        return mesh_bytes  # ASCII STL has no comment syntax
+    return mesh_bytes + b"\n# " + tag + b"\n"
+
+
+def start_in_process_server():
+    """Runs api_server on a free localhost port in a background thread. Returns the base URL."""
+    import uvicorn
+    import api_server
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(api_server.app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def percentiles(values):
+    if not values:
+        return None
+    arr = np.asarray(values) * 1000
+    return {
+        'count': len(values),
+        'p50_ms': round(float(np.percentile(arr, 50)), 1),
+        'p95_ms': round(float(np.percentile(arr, 95)), 1),
+        'p99_ms': round(float(np.percentile(arr, 99)), 1),
+        'max_ms': round(float(arr.max()), 1),
+    }
+
+
+async def run_flow(client, base_url, mesh_bytes, timings, errors, reuse=False):
+    """One simulated user: upload -> auto_orient -> repair -> /ws/progress -> download."""
+    ws_url = base_url.replace('http', 'ws', 1)
+    if not reuse:
+        mesh_bytes = unique_bytes(mesh_bytes)
+    flow_start = time.perf_counter()
+    stage = 'upload'
+    try:
+        t = time.perf_counter()
+        r = await client.post('/api/upload', files={'file': ('load.stl', mesh_bytes, 'application/octet-stream')})
+        r.raise_for_status()
+        timings['upload'].append(time.perf_counter() - t)
+        file_id = r.json()['id']
+
+        stage = 'auto_orient'
+        t = time.perf_counter()
+        r = await client.post(f'/api/auto_orient/{file_id}')
+        r.raise_for_status()
+        timings['auto_orient'].append(time.perf_counter() - t)
+        transform = r.json()['transform']
+
+        stage = 'repair'
+        t = time.perf_counter()
+        r = await client.post(f'/api/repair/{file_id}', json={'transform': transform})
+        r.raise_for_status()
+        timings['repair'].append(time.perf_counter() - t)
+        repair_start = t
+
+        stage = 'ws'
+        t = time.perf_counter()
+        async with websockets.connect(f"{ws_url}/ws/progress/{file_id}", max_size=None) as ws:
+            timings['ws_connect'].append(time.perf_counter() - t)
+            first = True
+            async for raw in ws:
+                if isinstance(raw, bytes):
+                    continue
+                if first:
+                    timings['ws_first_event'].append(time.perf_counter() - t)
+                    first = False
+                msg = json.loads(raw)
+                if msg['type'] == 'error':
+                    raise RuntimeError(msg['message'])
+                if msg['type'] == 'done':
+                    break
+        timings['repair_total'].append(time.perf_counter() - repair_start)
+
+        stage = 'download'
+        t = time.perf_counter()
+        r = await client.get(f'/api/download/{file_id}')
+        r.raise_for_status()
+        timings['download'].append(time.perf_counter() - t)
+
+        timings['flow'].append(time.perf_counter() - flow_start)
+    except Exception as e:
+        errors.append({'stage': stage, 'error': f"{type(e).__name__}: {e}"})
+
+
+async def sample_stats(client, samples, stop, t0, interval):
+    while not stop.is_set():
+        try:
+            r = await client.get('/api/stats')
+            stats = r.json()
+            samples.append({
+                't': round(time.perf_counter() - t0, 2),
+                'loop_lag_ms': stats['loop_lag_ms']['max'],
+                'running_workers': stats['jobs']['running'],
+                'cpu_count': stats['cpu_count'],
+            })
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(base_url, clients, flows_per_client, mesh_bytes, sample_interval, reuse=False):
+    """Runs `clients` concurrent users, each doing `flows_per_client` full flows back to back."""
+    timings = {name: [] for name in ENDPOINTS}
+    errors = []
+    samples = []
+    stop = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=clients * 2 + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0, limits=limits) as client:
+        t0 = time.perf_counter()
+        sampler = asyncio.create_task(sample_stats(client, samples, stop, t0, sample_interval))
+
+        async def user():
+            for _ in range(flows_per_client):
+                await run_flow(client, base_url, mesh_bytes, timings, errors, reuse)
+
+        await asyncio.gather(*(user() for _ in range(clients)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await sampler
+
+    completed = len(timings['flow'])
+    lags = [s['loop_lag_ms'] for s in samples]
+    workers = [s['running_workers'] for s in samples]
+    return {
+        'clients': clients,
+        'flows': clients * flows_per_client,
+        'completed': completed,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_flows_per_s': round(completed / elapsed, 3) if elapsed else 0.0,
+        'latency': {name: percentiles(vals) for name, vals in timings.items()},
+        'loop_lag_ms': {
+            'mean': round(float(np.mean(lags)), 2) if lags else None,
+            'max': round(float(np.max(lags)), 2) if lags else None,
+        },
+        'workers': {
+            'peak_running': max(workers) if workers else None,
+            'mean_running': round(float(np.mean(workers)), 2) if workers else None,
+            'cpu_count': samples[-1]['cpu_count'] if samples else None,
+        },
+        'timeline': samples,
+    }
+
+
+def print_level(level):
+    print(f"\n=== {level['clients']} clients: {level['completed']}/{level['flows']} flows in "
+          f"{level['elapsed_s']}s ({level['throughput_flows_per_s']} flows/s), "
+          f"{len(level['errors'])} errors")
+    print(f"    loop lag mean/max: {level['loop_lag_ms']['mean']}/{level['loop_lag_ms']['max']} ms, "
+          f"workers peak/mean: {level['workers']['peak_running']}/{level['workers']['mean_running']} "
+          f"(cpus {level['workers']['cpu_count']})")
+    print(f"    {'endpoint':<16}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name in ENDPOINTS:
+        p = level['latency'][name]
+        if p:
+            print(f"    {name:<16}{p['count']:>6}{p['p50_ms']:>10}{p['p95_ms']:>10}{p['p99_ms']:>10}")
+    for err in level['errors'][:5]:
+        print(f"    error at {err['stage']}: {err['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end HTTP/WebSocket load test for api_server.")
+    parser.add_argument('--url', help="Target a running server (default: start one in-process)")
+    parser.add_argument('--clients', default='1,2,4,8', help="Comma-separated concurrency levels")
+    parser.add_argument('--flows', type=int, default=2, help="Full flows per client per level")
+    parser.add_argument('--mesh', help="STL/OBJ to upload (default: generated broken torus)")
+    parser.add_argument('--reuse', action='store_true',
+                        help="Upload identical bytes every flow (exercises upload/repair dedupe)")
+    parser.add_argument('--sample-interval', type=float, default=0.25, help="/api/stats polling interval (s)")
+    parser.add_argument('--report', default=os.path.join(BASE_DIR, 'bench_results', 'load_test.json'))
+    args = parser.parse_args()
+
+    if args.mesh:
+        with open(args.mesh, 'rb') as f:
+            mesh_bytes = f.read()
+    else:
+        mesh_bytes = make_test_mesh()
+
+    base_url = args.url.rstrip('/') if args.url else start_in_process_server()
+    print(f"Target: {base_url} ({len(mesh_bytes) / 1024:.0f} KB mesh)")
+
+    levels = []
+    for clients in [int(c) for c in args.clients.split(',') if c.strip()]:
+        level = asyncio.run(run_level(base_url, clients, args.flows, mesh_bytes, args.sample_interval, args.reuse))
+        print_level(level)
+        levels.append(level)
+
+    report = {
+        'target': base_url,
+        'in_process': not args.url,
+        'mesh_bytes': len(mesh_bytes),
+        'flows_per_client': args.flows,
+        # Saturation curve: one point per concurrency level
+        'curve': [{
+            'clients': lv['clients'],
+            'throughput_flows_per_s': lv['throughput_flows_per_s'],
+            'flow_p95_ms': (lv['latency']['flow'] or {}).get('p95_ms'),
+            'upload_p95_ms': (lv['latency']['upload'] or {}).get('p95_ms'),
+            'loop_lag_max_ms': lv['loop_lag_ms']['max'],
+            'peak_running_workers': lv['workers']['peak_running'],
+            'errors': len(lv['errors']),
+        } for lv in levels],
+        'levels': levels,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written: {args.report}")
+    return 1 if any(lv['errors'] for lv in levels) else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,102 @@
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from worker_entry import HEAVY_MODULES
+
+TOP_COUNT = 15  # Slowest imports listed in the report
+IMPORT_BUDGET_MS = 1500.0  # Default --max-ms
+
+
+def parse_importtime(output):
+    """Entries of `python -X importtime` stderr: [{'module', 'self_ms', 'cumulative_ms', 'depth'}], in import order."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append({
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return entries
+
+
+def profile_import(module='api_server', top=TOP_COUNT):
+    """
+    Imports `module` in a fresh interpreter under -X importtime (with a scratch job database)
+    and reports its import time, the slowest imports and which HEAVY_MODULES it loaded.
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    with tempfile.TemporaryDirectory() as scratch:
+        env['NAOSHI_JOB_DB'] = os.path.join(scratch, 'jobs.db')
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=BASE_DIR, env=env, capture_output=True, text=True)
+        wall_ms = (time.perf_counter() - t0) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    entries = parse_importtime(proc.stderr)
+    own = next((e for e in entries if e['module'] == module and e['depth'] == 0), None)
+    loaded = {e['module'].split('.')[0] for e in entries}
+    return {
+        'module': module,
+        'python': sys.version.split()[0],
+        'import_ms': round(own['cumulative_ms'], 1) if own else None,
+        'wall_ms': round(wall_ms, 1),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in loaded],
+        'slowest': [{'module': e['module'], 'cumulative_ms': round(e['cumulative_ms'], 1)}
+                    for e in sorted((e for e in entries if e['depth'] == 1),
+                                    key=lambda e: -e['cumulative_ms'])[:top]],
+        'modules': len(entries),
+    }
+
+
+def check(report, max_ms):
+    """Problems with a profile: geometry stacks loaded, or the import over budget."""
+    problems = []
+    if report['heavy_modules']:
+        problems.append(f"{report['module']} imports {', '.join(report['heavy_modules'])}")
+    if report['import_ms'] is not None and report['import_ms'] > max_ms:
+        problems.append(f"import took {report['import_ms']:.0f} ms (budget {max_ms:.0f} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile of the API server (-X importtime).")
+    parser.add_argument('--module', default='api_server')
+    parser.add_argument('--runs', type=int, default=3, help="Imports to time; the fastest is reported (warm caches)")
+    parser.add_argument('--max-ms', type=float, default=IMPORT_BUDGET_MS, help="Exit 1 above this import time")
+    parser.add_argument('--report', help="Also write the JSON report here")
+    args = parser.parse_args()
+
+    report = min((profile_import(args.module) for _ in range(max(1, args.runs))),
+                 key=lambda r: r['import_ms'] if r['import_ms'] is not None else float('inf'))
+    print(f"import {report['module']}: {report['import_ms']} ms ({report['modules']} modules, "
+          f"process {report['wall_ms']} ms)")
+    for entry in report['slowest']:
+        print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    problems = check(report, args.max_ms)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Editor shapes sent with a repair request, merged into the repaired model by boolean union.
+
+Shapes arrive as compact parameters (the editor's primitives, built here the way three.js
+builds them) or as indexed geometry (extruded sketches), each with a placement matrix in
+the model's coordinates:
+
+    {'type': 'cylinder', 'params': {'radius': 10, 'height': 20}, 'matrix': [16 floats]}
+    {'type': 'mesh', 'vertices': [x, y, z, ...], 'faces': [a, b, c, ...], 'matrix': [...]}
+
+Matrices are three.js Matrix4.elements (column-major) or 4x4 row-major lists, as for the
+model transform. A mesh without faces is triangle soup and is welded.
+"""
+import numpy as np
+
+from compact_mesh import CompactMesh
+
+SHAPE_TYPES = ('cube', 'cylinder', 'sphere', 'cone', 'mesh')
+MAX_SHAPES = 64
+MAX_SHAPE_VERTICES = 500_000
+DEFAULT_SIZE = 20.0  # mm, the editor's default primitive size
+DEFAULT_SEGMENTS = 32
+MAX_SEGMENTS = 512
+MAX_PARAM = 100_000.0  # mm, for sizes
+
+
+def parse_matrix(values):
+    """4x4 row-major array from a flat column-major (three.js) or nested row-major matrix."""
+    if values is None:
+        return np.eye(4)
+    matrix = np.asarray(values, dtype=np.float64)
+    if matrix.shape == (16,):
+        matrix = matrix.reshape((4, 4)).T
+    if matrix.shape != (4, 4):
+        raise ValueError(f"Invalid shape matrix (shape {matrix.shape})")
+    if not np.all(np.isfinite(matrix)):
+        raise ValueError("Invalid shape matrix (non-finite values)")
+    return matrix
+
+
+def validate_shapes(shapes):
+    """Checks request shapes (dicts) before a job is queued. Raises ValueError."""
+    if len(shapes) > MAX_SHAPES:
+        raise ValueError(f"Too many shapes (max {MAX_SHAPES})")
+    for i, shape in enumerate(shapes):
+        kind = shape.get('type')
+        if kind not in SHAPE_TYPES:
+            raise ValueError(f"Shape {i}: unknown type {kind!r} (expected one of {', '.join(SHAPE_TYPES)})")
+        parse_matrix(shape.get('matrix'))
+        if kind == 'mesh':
+            vertices = shape.get('vertices') or []
+            faces = shape.get('faces')
+            if not vertices or len(vertices) % 3:
+                raise ValueError(f"Shape {i}: vertices must be flat xyz triples")
+            if faces is None and len(vertices) % 9:
+                raise ValueError(f"Shape {i}: without faces, vertices must be whole triangles")
+            if len(vertices) // 3 > MAX_SHAPE_VERTICES:
+                raise ValueError(f"Shape {i}: too many vertices (max {MAX_SHAPE_VERTICES:,})")
+            if not np.all(np.isfinite(np.asarray(vertices, dtype=np.float64))):
+                raise ValueError(f"Shape {i}: vertices must be finite")
+            if faces is not None and (len(faces) % 3 or min(faces, default=0) < 0
+                                      or max(faces, default=0) >= len(vertices) // 3):
+                raise ValueError(f"Shape {i}: faces must be index triples into vertices")
+        else:
+            for name, value in (shape.get('params') or {}).items():
+                limit = MAX_SEGMENTS if name == 'segments' else MAX_PARAM
+                if not isinstance(value, (int, float)) or not 0 < value <= limit:
+                    raise ValueError(f"Shape {i}: params must be positive numbers ({name} at most {limit:g})")
+            if (shape.get('params') or {}).get('segments', DEFAULT_SEGMENTS) < 3:
+                raise ValueError(f"Shape {i}: segments must be at least 3")
+
+
+def transform_shapes(shapes, matrix):
+    """Shapes placed by `matrix` (row-major 4x4) on top of their own placement, e.g. the model transform."""
+    return [{**shape, 'matrix': (np.asarray(matrix) @ parse_matrix(shape.get('matrix'))).tolist()}
+            for shape in shapes]
+
+
+def _y_up(mesh):
+    """trimesh builds round primitives along +Z; three.js along +Y."""
+    import trimesh
+    mesh.apply_transform(trimesh.transformations.rotation_matrix(-np.pi / 2, [1, 0, 0]))
+    return mesh
+
+
+def shape_mesh(shape):
+    """CompactMesh of a request shape, placed by its matrix (centered like three.js geometry)."""
+    import trimesh
+    kind = shape['type']
+    params = shape.get('params') or {}
+    size = float(params.get('size', DEFAULT_SIZE))
+    segments = int(params.get('segments', DEFAULT_SEGMENTS))
+
+    if kind == 'mesh':
+        vertices = np.asarray(shape['vertices'], dtype=np.float32).reshape(-1, 3)
+        faces = shape.get('faces')
+        faces = np.arange(len(vertices)) if faces is None else np.asarray(faces)
+        mesh = CompactMesh(vertices, faces).welded()
+    else:
+        if kind == 'cube':
+            built = trimesh.creation.box(extents=[params.get('width', size), params.get('height', size),
+                                                  params.get('depth', size)])
+        elif kind == 'sphere':
+            built = trimesh.creation.icosphere(subdivisions=3, radius=params.get('radius', size / 2))
+        elif kind == 'cylinder':
+            built = _y_up(trimesh.creation.cylinder(radius=params.get('radius', size / 2),
+                                                    height=params.get('height', size), sections=segments))
+        else:  # cone: base at -height/2, apex at +height/2 (three.js ConeGeometry)
+            height = params.get('height', size)
+            built = trimesh.creation.cone(radius=params.get('radius', size / 2), height=height, sections=segments)
+            built.apply_translation([0, 0, -height / 2])
+            built = _y_up(built)
+        mesh = CompactMesh(built.vertices, built.faces)
+
+    matrix = parse_matrix(shape.get('matrix'))
+    vertices = mesh.vertices.astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+    faces = mesh.faces if np.linalg.det(matrix[:3, :3]) > 0 else mesh.faces[:, ::-1]  # Mirrors flip winding
+    return CompactMesh(vertices, faces)
+
+
+def concatenate(meshes):
+    """One CompactMesh holding all of `meshes` (no welding or booleans)."""
+    offsets = np.cumsum([0] + [len(m.vertices) for m in meshes[:-1]])
+    return CompactMesh(np.concatenate([m.vertices for m in meshes]),
+                       np.concatenate([m.faces + offset for m, offset in zip(meshes, offsets)]))
+
+
+def bounds_overlap(a, b):
+    """True if the (2, 3) bounds a and b intersect."""
+    return bool(np.all(a[0] <= b[1]) and np.all(b[0] <= a[1]))
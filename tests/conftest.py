@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+# Before api_server/job_store are imported: a scratch job database, and no orientation pool
+os.environ.setdefault('NAOSHI_JOB_DB', os.path.join(tempfile.mkdtemp(prefix='naoshi_test_'), 'jobs.db'))
+os.environ.setdefault('NAOSHI_PREWARM', '0')
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    """The API app (lifespan included) with its upload and output folders in a scratch directory."""
+    import api_server
+    from fastapi.testclient import TestClient
+
+    scratch = tmp_path_factory.mktemp('server')
+    with pytest.MonkeyPatch.context() as patch:
+        for name in ('UPLOAD_DIR', 'OUTPUT_DIR'):
+            path = scratch / name.lower()
+            path.mkdir()
+            patch.setattr(api_server, name, str(path))
+        with TestClient(api_server.app) as c:
+            yield c
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+import mesh_storage
+from chunked_upload import (HASH_BLOCK, MAX_CHUNK, ContentHasher, block_digests, check_chunk, content_hash,
+                            missing_ranges)
+
+SIZE = 2 * HASH_BLOCK + HASH_BLOCK // 2  # Two full blocks and a short last one
+
+
+@pytest.fixture(scope='module')
+def data():
+    return os.urandom(SIZE)
+
+
+def chunk(data, block, blocks=1):
+    return data[block * HASH_BLOCK:(block + blocks) * HASH_BLOCK]
+
+
+def test_hash_independent_of_chunking_and_order(data):
+    whole = content_hash([d for _, d in block_digests(data, 0)], SIZE)
+
+    hasher = ContentHasher()
+    for start in range(0, SIZE, 1_000_003):  # Pieces that straddle block boundaries
+        hasher.update(data[start:start + 1_000_003])
+    assert hasher.hexdigest() == whole
+
+    received = dict(block_digests(chunk(data, 2), 2) + block_digests(chunk(data, 0, 2), 0))
+    assert content_hash([received[b] for b in range(3)], SIZE) == whole
+    assert content_hash([received[b] for b in range(3)], SIZE + 1) != whole
+
+
+def test_missing_ranges():
+    assert missing_ranges(SIZE, set()) == [[0, SIZE]]
+    assert missing_ranges(SIZE, {1}) == [[0, HASH_BLOCK], [2 * HASH_BLOCK, SIZE]]
+    assert missing_ranges(SIZE, {0, 2}) == [[HASH_BLOCK, 2 * HASH_BLOCK]]
+    assert missing_ranges(SIZE, {0, 1, 2}) == []
+
+
+@pytest.mark.parametrize('offset, length, size', [
+    (1, HASH_BLOCK, SIZE),                            # Misaligned offset
+    (-HASH_BLOCK, HASH_BLOCK, SIZE),                  # Negative offset
+    (0, 0, SIZE),                                     # Empty
+    (0, MAX_CHUNK + HASH_BLOCK, 2 * MAX_CHUNK),       # Over the chunk limit
+    (2 * HASH_BLOCK, HASH_BLOCK, SIZE),               # Past the declared size
+    (0, HASH_BLOCK + 1, SIZE),                        # Not whole blocks, and not the last chunk
+])
+def test_check_chunk_rejects(offset, length, size):
+    assert check_chunk(offset, length, size) is not None
+
+
+def test_check_chunk_accepts():
+    assert check_chunk(0, 2 * HASH_BLOCK, SIZE) is None
+    assert check_chunk(2 * HASH_BLOCK, HASH_BLOCK // 2, SIZE) is None  # Short last chunk
+
+
+def create(client):
+    response = client.post('/api/uploads', json={'filename': 'part.stl', 'size': SIZE})
+    assert response.status_code == 200
+    return response.json()['upload_id']
+
+
+def test_out_of_order_and_repeated_chunks(client, data):
+    upload_id = create(client)
+    for block in (2, 0, 0):  # Last chunk first, then a retried one
+        response = client.put(f'/api/uploads/{upload_id}', params={'offset': block * HASH_BLOCK},
+                              content=chunk(data, block))
+        assert response.status_code == 200
+
+    status = client.get(f'/api/uploads/{upload_id}').json()
+    assert status['missing'] == [[HASH_BLOCK, 2 * HASH_BLOCK]]
+    assert status['received_bytes'] == SIZE - HASH_BLOCK
+    assert client.post(f'/api/uploads/{upload_id}/finalize').status_code == 409
+
+    client.put(f'/api/uploads/{upload_id}', params={'offset': HASH_BLOCK}, content=chunk(data, 1))
+    done = client.post(f'/api/uploads/{upload_id}/finalize').json()
+    hasher = ContentHasher()
+    hasher.update(data)
+    assert done['hash'] == hasher.hexdigest()
+    assert b''.join(mesh_storage.chunks(done['path'])) == data
+
+    # Finalizing again returns the same file; identical content uploads again deduplicate
+    assert client.post(f'/api/uploads/{upload_id}/finalize').json()['id'] == done['id']
+    again = create(client)
+    client.put(f'/api/uploads/{again}', params={'offset': 0}, content=data)
+    second = client.post(f'/api/uploads/{again}/finalize').json()
+    assert second['hash'] == done['hash'] and second['deduplicated'] is True
+
+
+def test_rejects_misaligned_and_oversized_chunks(client, data):
+    upload_id = create(client)
+    misaligned = client.put(f'/api/uploads/{upload_id}', params={'offset': 1000}, content=chunk(data, 0))
+    assert misaligned.status_code == 400
+    past_end = client.put(f'/api/uploads/{upload_id}', params={'offset': 2 * HASH_BLOCK}, content=chunk(data, 0))
+    assert past_end.status_code == 400
+    assert client.get(f'/api/uploads/{upload_id}').json()['received_bytes'] == 0
@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+import memory_guard
+from job_scheduler import JobScheduler
+from job_store import JobStore
+
+
+class FakeProcess:
+    """Stands in for a repair Process: alive until the test ends it."""
+
+    def __init__(self, job):
+        self.job = job
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def terminate(self):
+        if self.exitcode is None:
+            self.exitcode = -15
+
+    def exit(self, code):
+        self.exitcode = code
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+@pytest.fixture
+def launched():
+    return []
+
+
+def make_scheduler(store, launched, workers=1, **kwargs):
+    def launch(job):
+        process = FakeProcess(job)
+        launched.append(process)
+        return process
+    return JobScheduler(store, launch, workers, owner='test:1', **kwargs)
+
+
+def finish(scheduler, process):
+    """Reports the running job done and lets its process exit, as repair_worker would."""
+    scheduler.store.record(process.job['job_id'], 'done', {'success': True}, process.job['attempt'])
+    process.exit(0)
+    return scheduler.poll()
+
+
+def binary_stl(path, faces=1):
+    path.write_bytes(b'\0' * 80 + faces.to_bytes(4, 'little') + b'\0' * 50 * faces)
+    return str(path)
+
+
+def test_shortest_job_first(store, launched):
+    scheduler = make_scheduler(store, launched)
+    now = time.time()
+    scheduler.submit('blocker', cost=1.0, submitted=now)
+    for job_id, cost in (('slow', 50.0), ('fast', 10.0), ('medium', 30.0)):
+        scheduler.submit(job_id, cost=cost, submitted=now)
+
+    assert [p.job['job_id'] for p in launched] == ['blocker']
+    assert [scheduler.position(job_id) for job_id in ('fast', 'medium', 'slow')] == [1, 2, 3]
+    order = []
+    while len(order) < 3:
+        order += finish(scheduler, launched[-1])
+    assert order == ['fast', 'medium', 'slow']
+
+
+def test_aging_lets_a_waiting_job_overtake(store, launched):
+    scheduler = make_scheduler(store, launched, aging_rate=0.5)
+    now = time.time()
+    scheduler.submit('blocker', cost=1.0, submitted=now - 1000)
+    # Waited 200 s longer: 100 - 0.5 * 200 = 0 beats a fresh job of cost 10
+    scheduler.submit('old_large', cost=100.0, submitted=now - 200)
+    scheduler.submit('new_small', cost=10.0, submitted=now)
+    assert scheduler.position('old_large') == 1
+    assert finish(scheduler, launched[0]) == ['old_large']
+
+    # Without enough waiting, cost decides
+    scheduler.submit('older_large', cost=100.0, submitted=now - 100)
+    assert finish(scheduler, launched[1]) == ['new_small']
+
+
+def test_large_lane_slot_limit(store, launched):
+    scheduler = make_scheduler(store, launched, workers=3, large_cost=100.0, large_workers=1)
+    now = time.time()
+    for i in range(3):
+        scheduler.submit(f'large{i}', cost=200.0, submitted=now + i)
+    scheduler.submit('small', cost=5.0, submitted=now + 10)
+
+    running = [p.job['job_id'] for p in launched]
+    assert running == ['large0', 'small']  # A slot is free, but only one may be large
+    assert store.get_job('large1')['status'] == 'queued'
+
+    # A finished small job frees a slot that large jobs still can't use
+    assert finish(scheduler, launched[1]) == []
+    # The large slot passes to the next large job
+    assert finish(scheduler, launched[0]) == ['large1']
+
+
+def test_retry_lower_memory(store, launched, tmp_path):
+    scheduler = make_scheduler(store, launched)
+    scheduler.submit('job', cost=1.0, input_path=binary_stl(tmp_path / 'in.stl'), options={'memory_limit_mb': 512})
+    first = launched[0]
+    first.exit(memory_guard.MEMORY_EXIT_CODE)
+    assert scheduler.poll() == []
+
+    # Restarted in the same slot and attempt, one rung down the ladder
+    assert len(launched) == 2
+    job = store.get_job('job')
+    assert job['status'] == 'running' and job['attempt'] == 1
+    assert job['options']['memory_level'] == 1
+    assert job['options']['skip_alpha_wrap'] is True
+    assert launched[1].job['options'] == job['options']
+    assert job['peak_memory_mb'] == 512
+    assert [e[1] for e in store.events_after('job')] == ['status']
+
+    # Out of rungs: the job fails instead of restarting
+    while launched[-1].is_alive():
+        launched[-1].exit(memory_guard.MEMORY_EXIT_CODE)
+        scheduler.poll()
+    assert store.get_job('job')['status'] == 'error'
+    assert len(launched) == len(memory_guard.DOWNGRADE_LEVELS)
+
+
+def test_retry_skips_large_mode_for_non_stl(store, launched, tmp_path):
+    scheduler = make_scheduler(store, launched)
+    obj = tmp_path / 'in.obj'
+    obj.write_text('v 0 0 0\n')
+    scheduler.submit('job', cost=1.0, input_path=str(obj), options={'memory_level': 1})
+    launched[0].exit(-9)  # OOM killer
+    scheduler.poll()
+    assert len(launched) == 1
+    assert 'lowest settings' in store.get_job('job')['error']
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import mesh_codec
+import mesh_export
+import mesh_storage
+from compact_mesh import CompactMesh
+
+
+def random_mesh(seed=0, vertices=5000, faces=20000):
+    """Faces in random order over scattered indices, so index deltas jump both ways, plus unused vertices."""
+    rng = np.random.default_rng(seed)
+    v = (rng.random((vertices, 3)) * [200.0, 50.0, 3.0] - [100.0, 0.0, 1.5]).astype(np.float32)
+    f = rng.integers(0, vertices - 100, size=(faces, 3)).astype(np.int32)
+    return CompactMesh(v, f)
+
+
+def assert_round_trip(mesh, path, codec='gzip'):
+    mesh_codec.encode_file(mesh, str(path), codec)
+    data = path.read_bytes()
+    vertices, faces = mesh_codec.decode(data)
+    step = np.array(mesh_codec.HEADER.unpack_from(data)[-3:], dtype=np.float32)
+
+    # Same faces in the same order, over the referenced vertices only
+    assert faces.shape == mesh.faces.shape
+    assert len(vertices) == len(np.unique(mesh.faces))
+    pairs = np.unique(np.stack([mesh.faces.reshape(-1), faces.reshape(-1)]), axis=1)
+    assert pairs.shape[1] == len(vertices)  # Each input vertex maps to exactly one output vertex
+    # Every corner within half a quantization step (plus float32 rounding)
+    slack = step * 0.5 + np.abs(mesh.vertices).max(axis=0) * 1e-6
+    assert np.all(np.abs(vertices[faces] - mesh.vertices[mesh.faces]) <= slack)
+    return step
+
+
+def test_gzip_round_trip(tmp_path):
+    assert_round_trip(random_mesh(), tmp_path / 'm.nmsh')
+
+
+def test_round_trip_across_index_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(mesh_codec, 'CHUNK', 4 * 1000)  # Index deltas continue across chunk boundaries
+    assert_round_trip(random_mesh(seed=1), tmp_path / 'm.nmsh')
+
+
+def test_flat_mesh_round_trip(tmp_path):
+    mesh = random_mesh(seed=2)
+    mesh.vertices[:, 2] = 7.0  # Zero extent on one axis
+    assert assert_round_trip(mesh, tmp_path / 'm.nmsh')[2] == 1.0
+
+
+def test_zstd_round_trip(tmp_path):
+    pytest.importorskip('zstandard')
+    assert_round_trip(random_mesh(seed=3), tmp_path / 'm.nmsh', codec='zstd')
+
+
+def test_ensure_encoded_reads_compressed_storage(tmp_path):
+    mesh = random_mesh(seed=4, faces=3000)
+    output = str(tmp_path / 'fixed.stl')
+    mesh_export.write(output, 'stl', mesh.vertices, mesh.faces)
+    mesh_storage.compress(output)
+    assert mesh_storage.is_compressed(output)
+
+    data = open(mesh_codec.ensure_encoded(output), 'rb').read()
+    vertices, faces = mesh_codec.decode(data)
+    step = np.array(mesh_codec.HEADER.unpack_from(data)[-3:], dtype=np.float32)
+    assert faces.shape == mesh.faces.shape
+    assert np.all(np.abs(vertices[faces] - mesh.vertices[mesh.faces]) <= step * 0.5 + 1e-4)
@@ -0,0 +1,30 @@
+import uuid
+
+import pytest
+
+import api_server
+
+
+@pytest.fixture
+def job_id(client, monkeypatch):
+    monkeypatch.setattr(api_server.scheduler, 'workers', 0)  # Nothing is claimed: jobs stay queued
+    job_id = str(uuid.uuid4())
+    api_server.store.create_job(job_id, status='running', filename='part.stl')
+    return job_id
+
+
+def test_preview_delivered_while_queued_for_refinement(client, job_id):
+    store = api_server.store
+    with client.websocket_connect(f'/ws/progress/{job_id}') as ws:
+        store.record(job_id, 'progress', ('Alpha wrap (draft)...', 0.5))
+        assert ws.receive_json()['type'] == 'progress'
+
+        draft = {'success': True, 'quality': 'draft'}
+        store.record(job_id, 'preview', draft)
+        assert store.get_job(job_id)['status'] == 'queued'
+        assert ws.receive_json() == {'type': 'preview', 'result': draft}
+        status = ws.receive_json()
+        assert status['type'] == 'status' and status['text'].startswith('Draft ready')
+
+        store.record(job_id, 'done', {'success': True})
+        assert ws.receive_json()['type'] == 'done'
@@ -0,0 +1,35 @@
+import math
+
+import pytest
+
+from incremental import validate_delta
+from shapes import validate_shapes
+
+IDENTITY = [1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+
+
+@pytest.mark.parametrize('shape', [
+    {'type': 'cube', 'matrix': [math.nan] + IDENTITY[1:]},                  # Flat three.js matrix
+    {'type': 'cube', 'matrix': [[1, 0, 0, math.inf], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]},
+    {'type': 'cylinder', 'params': {'segments': 10_000_000}},
+    {'type': 'cone', 'params': {'segments': 2}},
+    {'type': 'sphere', 'params': {'radius': math.nan}},
+    {'type': 'cube', 'params': {'size': 1e12}},
+    {'type': 'mesh', 'vertices': [0, 0, math.inf, 1, 0, 0, 0, 1, 0]},
+])
+def test_rejects_invalid_shapes(shape):
+    with pytest.raises(ValueError):
+        validate_shapes([shape])
+
+
+def test_accepts_editor_shapes():
+    validate_shapes([
+        {'type': 'cube', 'params': {'size': 20}, 'matrix': IDENTITY},
+        {'type': 'cylinder', 'params': {'radius': 10, 'height': 20, 'segments': 32}, 'matrix': IDENTITY},
+        {'type': 'mesh', 'vertices': [0, 0, 0, 1, 0, 0, 0, 1, 0], 'faces': [0, 1, 2]},
+    ])
+
+
+def test_delta_rejects_non_finite_transform():
+    with pytest.raises(ValueError):
+        validate_delta({'transform': [math.nan] * 16})
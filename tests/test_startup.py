@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from startup_profile import BASE_DIR, IMPORT_BUDGET_MS, check, profile_import
+
+
+def test_api_server_import_loads_no_geometry_stack(tmp_path):
+    env = dict(os.environ, NAOSHI_JOB_DB=str(tmp_path / 'jobs.db'))
+    code = "import json, api_server, worker_entry; print(json.dumps(worker_entry.loaded_heavy_modules()))"
+    proc = subprocess.run([sys.executable, '-c', code], cwd=BASE_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
+
+
+# Wall-clock, so it depends on the machine: opt in with NAOSHI_TIMING_TESTS=1
+@pytest.mark.skipif(os.environ.get('NAOSHI_TIMING_TESTS') != '1', reason="timing test (NAOSHI_TIMING_TESTS=1)")
+def test_api_server_import_within_budget():
+    # Best of a few: the first import in a fresh checkout also pays for bytecode compilation
+    report = min((profile_import('api_server') for _ in range(3)), key=lambda r: r['import_ms'])
+    assert report['import_ms'] is not None
+    assert report['heavy_modules'] == []
+    assert check(report, IMPORT_BUDGET_MS) == []
@@ -0,0 +1,57 @@
+import zipfile
+
+import pytest
+
+import api_server
+
+LIMIT = 1000  # In-memory limit for the tests
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(api_server, 'IN_MEMORY_UPLOAD_SIZE', LIMIT)
+    monkeypatch.setattr(api_server, 'MAX_UPLOAD_SIZE', 100 * LIMIT)
+
+
+def binary_stl(faces, declared=None):
+    return b'\0' * 80 + (faces if declared is None else declared).to_bytes(4, 'little') + b'\0' * 50 * faces
+
+
+def ascii_stl(size):
+    return (b'solid part\n' + b' ' * size)[:size]
+
+
+@pytest.mark.parametrize('name, data, status', [
+    ('small.obj', b'v 0 0 0\n' * 100, 200),
+    ('large.stl', binary_stl(40), 200),                      # Binary: out-of-core when large
+    ('large.obj', b'v 0 0 0\n' * 300, 413),
+    ('large_ascii.stl', ascii_stl(2 * LIMIT), 413),
+    ('lying.stl', binary_stl(40, declared=30), 413),         # Header doesn't match the size
+    ('huge.stl', binary_stl(2100), 413),                     # Over MAX_UPLOAD_SIZE
+])
+def test_upload_limits(client, name, data, status):
+    response = client.post('/api/upload', files={'file': (name, data)})
+    assert response.status_code == status
+
+
+def upload_in_chunks(client, name, data):
+    response = client.post('/api/uploads', json={'filename': name, 'size': len(data)})
+    if response.status_code != 200:
+        return response
+    upload_id = response.json()['upload_id']
+    assert client.put(f'/api/uploads/{upload_id}', params={'offset': 0}, content=data).status_code == 200
+    return client.post(f'/api/uploads/{upload_id}/finalize')
+
+
+def test_chunked_upload_limits(client):
+    assert upload_in_chunks(client, 'large.obj', b'v 0 0 0\n' * 300).status_code == 413  # Refused up front
+    assert upload_in_chunks(client, 'large_ascii.stl', ascii_stl(2 * LIMIT)).status_code == 413  # On finalize
+    assert upload_in_chunks(client, 'large.stl', binary_stl(40)).status_code == 200
+
+
+def test_batch_zip_member_limits(client, tmp_path):
+    archive = tmp_path / 'parts.zip'
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('large.obj', b'v 0 0 0\n' * 300)
+    response = client.post('/api/batch', files={'files': ('parts.zip', archive.read_bytes())})
+    assert response.status_code == 413 and 'large.obj' in response.json()['detail']
@@ -0,0 +1,139 @@
+import io
+import os
+import struct
+import zipfile
+
+import pytest
+
+import mesh_storage
+from chunked_upload import ContentHasher
+from zip_stream import COPY_CHUNK, ZipStream, extract_meshes
+
+MB = 1024 * 1024
+
+
+def local_header(archive, info):
+    """(flag bits, extra field) of a member's local header."""
+    offset = info.header_offset
+    assert archive[offset:offset + 4] == b'PK\x03\x04'
+    flags, = struct.unpack('<H', archive[offset + 6:offset + 8])
+    name_len, extra_len = struct.unpack('<HH', archive[offset + 26:offset + 30])
+    start = offset + 30 + name_len
+    return flags, archive[start:start + extra_len]
+
+
+def test_stream_round_trips_through_zipfile(tmp_path):
+    plain = os.urandom(COPY_CHUNK + 12345)  # More than one copy chunk
+    packed = b'solid x\n' * 200_000
+    (tmp_path / 'a.stl').write_bytes(plain)
+    (tmp_path / 'b.stl').write_bytes(packed)
+    assert mesh_storage.compress(str(tmp_path / 'b.stl')).endswith(mesh_storage.SUFFIX)
+
+    stream = ZipStream()
+    pieces = list(stream.file_chunks('part.stl', str(tmp_path / 'a.stl')))
+    pieces += stream.file_chunks('part.stl', str(tmp_path / 'b.stl'))  # Same name: renamed
+    pieces.append(stream.write_bytes('report.json', b'{}'))
+    pieces.append(stream.close())
+    assert len(pieces) > 4  # Produced as it goes, not in one piece at the end
+    archive = b''.join(pieces)
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['part.stl', 'part (2).stl', 'report.json']
+        assert zf.read('part.stl') == plain
+        assert zf.read('part (2).stl') == packed
+        assert zf.read('report.json') == b'{}'
+
+        # Unseekable sink: sizes follow the data in descriptors
+        for info in zf.infolist():
+            assert local_header(archive, info)[0] & 0x08
+        # Source stored compressed, so its size is unknown up front: ZIP64 from the start
+        assert local_header(archive, zf.getinfo('part (2).stl'))[1][:2] == b'\x01\x00'
+        assert local_header(archive, zf.getinfo('part.stl'))[1][:2] != b'\x01\x00'
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def test_extract_meshes(tmp_path):
+    part = os.urandom(5000)
+    archive = make_zip(tmp_path / 'in.zip', {
+        'models/part.stl': part,
+        '../escape.obj': b'v 0 0 0\n',
+        '__MACOSX/models/._part.stl': b'junk',
+        'readme.txt': b'hello',
+    })
+    out = tmp_path / 'out'
+    out.mkdir()
+    parts, skipped = extract_meshes(archive, str(out), ('.stl', '.obj'), max_files=10, max_size=MB)
+
+    assert [p[0] for p in parts] == ['models/part.stl', 'escape.obj']
+    name, path, digest, size = parts[0]
+    hasher = ContentHasher()
+    hasher.update(part)
+    assert (digest, size) == (hasher.hexdigest(), len(part))
+    assert open(path, 'rb').read() == part
+    assert all(os.path.dirname(p[1]) == str(out) for p in parts)
+    assert skipped == ['__MACOSX/models/._part.stl', 'readme.txt']
+
+
+def test_rejects_high_ratio_member(tmp_path):
+    # 8 MB of zeros deflate to a few KB
+    archive = make_zip(tmp_path / 'bomb.zip', {'ok.stl': b'x' * 100, 'bomb.stl': bytes(8 * MB)})
+    assert os.path.getsize(archive) < 64 * 1024
+    out = tmp_path / 'out'
+    out.mkdir()
+    with pytest.raises(ValueError, match='too large'):
+        extract_meshes(archive, str(out), ('.stl',), max_files=10, max_size=MB)
+    assert os.listdir(out) == []  # The part extracted before it is removed too
+
+
+def test_rejects_member_lying_about_its_size(tmp_path):
+    archive = make_zip(tmp_path / 'bomb.zip', {'bomb.stl': bytes(8 * MB)})
+    data = bytearray(open(archive, 'rb').read())
+    central = data.index(b'PK\x01\x02')
+    data[central + 24:central + 28] = struct.pack('<I', 100)  # Declared uncompressed size
+    open(archive, 'wb').write(bytes(data))
+    out = tmp_path / 'out'
+    out.mkdir()
+    with pytest.raises(zipfile.BadZipFile):  # zipfile stops at the declared size; the CRC then fails
+        extract_meshes(archive, str(out), ('.stl',), max_files=10, max_size=MB)
+    assert os.listdir(out) == []
+
+
+def test_rejects_too_many_parts(tmp_path):
+    archive = make_zip(tmp_path / 'many.zip', {f'p{i}.stl': b'x' for i in range(4)})
+    out = tmp_path / 'out'
+    out.mkdir()
+    with pytest.raises(ValueError, match='Too many parts'):
+        extract_meshes(archive, str(out), ('.stl',), max_files=3, max_size=MB)
+    assert os.listdir(out) == []
+
+
+def test_rejects_compression_ratio_within_size_limit(tmp_path):
+    archive = make_zip(tmp_path / 'bomb.zip', {'bomb.stl': bytes(4 * MB)})  # Under max_size, ~1000:1
+    out = tmp_path / 'out'
+    out.mkdir()
+    with pytest.raises(ValueError, match='compressed more than'):
+        extract_meshes(archive, str(out), ('.stl',), max_files=10, max_size=64 * MB)
+    assert os.listdir(out) == []
+
+    # Small members are exempt; real mesh data stays far below the ratio
+    tiny = make_zip(tmp_path / 'tiny.zip', {'tiny.stl': bytes(1000), 'part.stl': os.urandom(2 * MB)})
+    parts, _ = extract_meshes(tiny, str(out), ('.stl',), max_files=10, max_size=64 * MB)
+    assert len(parts) == 2
+
+
+def test_rejects_batch_over_total_size(tmp_path):
+    archive = make_zip(tmp_path / 'many.zip', {f'p{i}.stl': os.urandom(MB) for i in range(3)})
+    out = tmp_path / 'out'
+    out.mkdir()
+    with pytest.raises(ValueError, match='Batch too large'):
+        extract_meshes(archive, str(out), ('.stl',), max_files=10, max_size=MB, max_total=2 * MB + 1)
+    assert os.listdir(out) == []
+    parts, _ = extract_meshes(archive, str(out), ('.stl',), max_files=10, max_size=MB, max_total=3 * MB)
+    assert len(parts) == 3
@@ -1,6 +1,7 @@
 import * as THREE from 'three';
 import { ModelViewer } from './viewer.js?v=79';
 import { MeshEditor } from './mesh-editor.js?v=79';
+import { decodeCompactMesh } from './mesh-format.js';
 import { STLExporter } from 'three/examples/jsm/exporters/STLExporter.js';
 import { BackgroundEffect } from './background_effect.js';
 import { Animations } from './animations.js';
@@ -752,6 +753,12 @@ class ZenNaoshi {
         // Store original color for selection toggle
         mesh.userData.originalColor = 0x2563EB;
         mesh.userData.isShape = true;
+        // Parameters the server rebuilds the primitive from (see shapePayload)
+        mesh.userData.shapeSpec = {
+            type,
+            params: type === 'cube' ? { size } : type === 'sphere' ? { radius: size / 2 }
+                : { radius: size / 2, height: size, segments: 32 }
+        };
 
         this.viewer.scene.add(mesh);
         this.shapes.push(mesh);
@@ -913,6 +920,33 @@ class ZenNaoshi {
         this.validateMesh();
     }
 
+    shapePayload() {
+        // Shapes for the repair request, merged into the model by boolean union on the server.
+        // Primitives go as parameters, everything else as indexed geometry; matrices place them
+        // relative to the model as uploaded (the viewer centers its geometry).
+        const model = this.viewer.mesh;
+        const shapes = this.shapes.filter(s => s !== model);
+        if (!model || shapes.length === 0) return null;
+
+        model.updateMatrixWorld();
+        const center = this.viewer.sourceCenter || new THREE.Vector3();
+        const toModel = new THREE.Matrix4().makeTranslation(center.x, center.y, center.z)
+            .multiply(model.matrixWorld.clone().invert());
+
+        return shapes.map(s => {
+            s.updateMatrixWorld();
+            const spec = s.userData.shapeSpec || { type: 'mesh' };
+            const shape = { type: spec.type, matrix: toModel.clone().multiply(s.matrixWorld).elements };
+            if (spec.type === 'mesh') {
+                shape.vertices = Array.from(s.geometry.attributes.position.array);
+                if (s.geometry.index) shape.faces = Array.from(s.geometry.index.array);
+            } else {
+                shape.params = spec.params;
+            }
+            return shape;
+        });
+    }
+
     async validateMesh() {
         if (!this.viewer.mesh && this.shapes.length === 0) {
             this.showToast('No mesh to validate');
@@ -1427,11 +1461,8 @@ class ZenNaoshi {
 
     async uploadFile(file) {
         try {
-            const formData = new FormData();
-            formData.append('file', file);
-            const upRes = await fetch('/api/upload', { method: 'POST', body: formData });
-            if (!upRes.ok) throw new Error("Server upload error");
-            const upData = await upRes.json();
+            const upData = await this.uploadChunked(file);
+            if (upData.deduplicated) console.log("Upload matched an existing file on the server");
             this.serverId = upData.id;
             return this.serverId;
         } catch (e) {
@@ -1441,6 +1472,72 @@ class ZenNaoshi {
         }
     }
 
+    // Resumable upload: parallel block-aligned chunks, retried from the server's missing list
+    async uploadChunked(file, parallel = 3, attempts = 4) {
+        const createRes = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        if (!createRes.ok) throw new Error("Server upload error");
+        const { upload_id, block_size } = await createRes.json();
+        const chunkSize = block_size * 2;
+
+        const sendRanges = async (ranges) => {
+            const chunks = [];
+            for (const [start, end] of ranges) {
+                for (let offset = start; offset < end; offset += chunkSize) {
+                    chunks.push([offset, Math.min(end, offset + chunkSize)]);
+                }
+            }
+            const worker = async () => {
+                while (chunks.length) {
+                    const [offset, end] = chunks.shift();
+                    // Failures are left for the next status round to pick up
+                    await fetch(`/api/uploads/${upload_id}?offset=${offset}`, {
+                        method: 'PUT', body: file.slice(offset, end)
+                    }).catch(e => console.warn("Chunk upload failed", offset, e));
+                }
+            };
+            await Promise.all(Array.from({ length: parallel }, worker));
+        };
+
+        let missing = [[0, file.size]];
+        for (let i = 0; i < attempts && missing.length; i++) {
+            await sendRanges(missing);
+            const statusRes = await fetch(`/api/uploads/${upload_id}`);
+            if (!statusRes.ok) throw new Error("Upload status unavailable");
+            missing = (await statusRes.json()).missing;
+        }
+        if (missing.length) throw new Error("Upload incomplete");
+
+        const finalRes = await fetch(`/api/uploads/${upload_id}/finalize`, { method: 'POST' });
+        if (!finalRes.ok) throw new Error("Upload finalize failed");
+        return finalRes.json();
+    }
+
+    // Leave repair mode with the result on screen: download button shown, repair button reset
+    showResultControls() {
+        // 3. Exit repair-active mode
+        document.body.classList.remove('repair-active');
+
+        // 4. Show download button (DIRECT DOM ACCESS - guaranteed to work)
+        const btnDownload = document.getElementById('btn-download');
+        if (btnDownload) {
+            btnDownload.classList.remove('hidden');
+            btnDownload.style.display = 'flex';
+            console.log("Download button shown");
+        }
+
+        // 5. Reset repair button (DIRECT DOM ACCESS - guaranteed to work)
+        const btnStartRepair = document.getElementById('btn-start-repair');
+        if (btnStartRepair) {
+            btnStartRepair.innerHTML = '<i class="ph ph-sparkle"></i> Repair Model';
+            btnStartRepair.disabled = false;
+            console.log("Repair button reset successfully");
+        }
+    }
+
     async startRepair() {
         this.setState('repairing');
 
@@ -1451,8 +1548,10 @@ class ZenNaoshi {
             if (!this.serverId) await this.uploadPromise;
 
             const currentMatrix = this.viewer.getCurrentTransformArray();
-            const body = {};
+            const body = { progressive: true };
             if (currentMatrix) body.transform = currentMatrix;
+            const shapes = this.shapePayload();
+            if (shapes) body.shapes = shapes;
             this.updateStatus('Starting Repair...', 0);
 
             // Trigger Cinematic Start
@@ -1473,7 +1572,36 @@ class ZenNaoshi {
             const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
             const ws = new WebSocket(`${protocol}//${window.location.host}/ws/progress/${this.serverId}`);
 
+            // Progress frames (binary, compact mesh encoding): decoded one at a time, and
+            // only the newest that arrived meanwhile is decoded next
+            ws.binaryType = 'arraybuffer';
+            let decodingFrame = false;
+            let nextFrame = null;
+            const showFrame = async (buffer) => {
+                if (decodingFrame) {
+                    nextFrame = buffer;
+                    return;
+                }
+                decodingFrame = true;
+                try {
+                    const geometry = await decodeCompactMesh(buffer);
+                    if (this.viewer) this.viewer.showRepairFrame(geometry);
+                } catch (e) {
+                    console.warn("Progress frame skipped:", e);
+                }
+                decodingFrame = false;
+                if (nextFrame) {
+                    const buffer = nextFrame;
+                    nextFrame = null;
+                    showFrame(buffer);
+                }
+            };
+
             ws.onmessage = (event) => {
+                if (event.data instanceof ArrayBuffer) {
+                    showFrame(event.data);
+                    return;
+                }
                 const data = JSON.parse(event.data);
                 console.log("WS Message:", data);
 
@@ -1483,8 +1611,19 @@ class ZenNaoshi {
                     if (this.viewer) this.viewer.updateRepairProgress(data.value);
                 } else if (data.type === 'status') {
                     this.updateStatus(data.text, null);
+                } else if (data.type === 'preview') {
+                    // Progressive repair: a draft to look at (and download) while the full-quality
+                    // result is computed; 'done' follows with the refined model
+                    this.updateStatus('Draft ready - refining...', 100);
+                    this.showToast("Draft ready! Refining in the background...");
+                    if (this.viewer) this.viewer.finishRepair();
+                    this.viewer.loadCompact(`/api/download/${this.serverId}`, () => this.showResultControls(), true);
                 } else if (data.type === 'done') {
                     this.updateStatus('Complete', 100);
+                    const fidelity = data.result && data.result.fidelity;
+                    if (fidelity) {
+                        this.addLogBubble(`Max deviation ${(fidelity.hausdorff_rel * 100).toFixed(2)}% of size (mean ${(fidelity.mean_rel * 100).toFixed(3)}%)`);
+                    }
                     if (this.viewer) this.viewer.updateRepairProgress(1.0); // Force complete
                     this.showToast("Repair Complete! Loading...");
 
@@ -1495,30 +1634,38 @@ class ZenNaoshi {
                         // 1. Finish repair mode (cleanup anime state)
                         if (self.viewer) self.viewer.finishRepair();
 
-                        // 2. Load the fixed model
-                        self.viewer.loadSTL(resultUrl, () => {
-                            console.log("loadSTL callback executing - resetting UI");
-                            self.showToast("Fixed Model Loaded");
-
-                            // 3. Exit repair-active mode
-                            document.body.classList.remove('repair-active');
-
-                            // 4. Show download button (DIRECT DOM ACCESS - guaranteed to work)
-                            const btnDownload = document.getElementById('btn-download');
-                            if (btnDownload) {
-                                btnDownload.classList.remove('hidden');
-                                btnDownload.style.display = 'flex';
-                                console.log("Download button shown");
+                        // Optional deviation heatmap (requested with deviation_map: true; full mesh only)
+                        const showDeviation = () => {
+                            if (data.result && data.result.deviation_map) {
+                                fetch(`/api/deviation/${self.serverId}`)
+                                    .then(r => r.ok ? r.arrayBuffer() : null)
+                                    .then(buf => { if (buf) self.viewer.applyDeviationColors(new Float32Array(buf)); })
+                                    .catch(e => console.warn("Deviation map unavailable", e));
                             }
+                        };
 
-                            // 5. Reset repair button (DIRECT DOM ACCESS - guaranteed to work)
-                            const btnStartRepair = document.getElementById('btn-start-repair');
-                            if (btnStartRepair) {
-                                btnStartRepair.innerHTML = '<i class="ph ph-sparkle"></i> Repair Model';
-                                btnStartRepair.disabled = false;
-                                console.log("Repair button reset successfully");
-                            }
-                        }, true); // Keep Camera
+                        const onResultShown = () => {
+                            console.log("Result load callback executing - resetting UI");
+                            self.showToast("Fixed Model Loaded");
+                            self.showResultControls();
+                        };
+
+                        // 2. Load the fixed model: the coarsest preview first if there is one,
+                        // then the full mesh in the background
+                        const previews = (data.result && data.result.previews) || [];
+                        const serverId = self.serverId;
+                        if (previews.length) {
+                            self.viewer.loadCompact(`/api/preview/${serverId}?lod=${previews[0].lod}`, () => {
+                                onResultShown();
+                                if (self.serverId !== serverId) return; // Another model was opened meanwhile
+                                self.viewer.loadCompact(resultUrl, showDeviation, true);
+                            }, true); // Keep Camera
+                        } else {
+                            self.viewer.loadCompact(resultUrl, () => {
+                                onResultShown();
+                                showDeviation();
+                            }, true); // Keep Camera
+                        }
                     }, 1500); // 1.5s Delay for "Glory Moment"
 
 
@@ -0,0 +1,60 @@
+import * as THREE from 'three';
+
+// Decoder for the compact mesh download (mesh_codec.py): quantized, delta-coded positions
+// and delta/zigzag-coded indices behind a gzip (or zstd) body. Face order matches the STL.
+export const MESH_MEDIA_TYPE = 'application/vnd.naoshi.mesh';
+const MAGIC = 0x48534d4e; // 'NMSH' little-endian
+const HEADER_SIZE = 40;
+const CODEC_GZIP = 1;
+
+export async function decodeCompactMesh(buffer) {
+    const header = new DataView(buffer, 0, HEADER_SIZE);
+    if (header.getUint32(0, true) !== MAGIC || header.getUint16(4, true) !== 1) {
+        throw new Error('Not a Naoshi mesh encoding');
+    }
+    if (header.getUint16(6, true) !== CODEC_GZIP) {
+        throw new Error('Unsupported mesh codec (the browser decodes gzip only)');
+    }
+    const vertexCount = header.getUint32(8, true);
+    const faceCount = header.getUint32(12, true);
+    const origin = [0, 1, 2].map(i => header.getFloat32(16 + i * 4, true));
+    const step = [0, 1, 2].map(i => header.getFloat32(28 + i * 4, true));
+
+    const stream = new Blob([buffer.slice(HEADER_SIZE)]).stream().pipeThrough(new DecompressionStream('gzip'));
+    const body = await new Response(stream).arrayBuffer();
+    const view = new DataView(body);
+
+    const positions = new Float32Array(vertexCount * 3);
+    for (let axis = 0; axis < 3; axis++) {
+        const base = axis * vertexCount * 2;
+        let q = 0;
+        for (let i = 0; i < vertexCount; i++) {
+            q = (q + view.getUint16(base + i * 2, true)) & 0xffff;
+            positions[i * 3 + axis] = origin[axis] + q * step[axis];
+        }
+    }
+
+    const indexCount = faceCount * 3;
+    const indices = vertexCount > 65535 ? new Uint32Array(indexCount) : new Uint16Array(indexCount);
+    const indexBase = vertexCount * 6;
+    let index = 0;
+    for (let i = 0; i < indexCount; i++) {
+        const zigzag = view.getUint32(indexBase + i * 4, true);
+        index += (zigzag >>> 1) ^ -(zigzag & 1);
+        indices[i] = index;
+    }
+
+    const geometry = new THREE.BufferGeometry();
+    geometry.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+    geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+    return geometry;
+}
+
+export async function loadCompactMesh(url) {
+    const response = await fetch(url, { headers: { Accept: MESH_MEDIA_TYPE } });
+    if (!response.ok) throw new Error(`Download failed (${response.status})`);
+    if (!(response.headers.get('Content-Type') || '').startsWith(MESH_MEDIA_TYPE)) {
+        throw new Error('Server did not return the compact mesh encoding');
+    }
+    return decodeCompactMesh(await response.arrayBuffer());
+}
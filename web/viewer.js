@@ -1,6 +1,7 @@
 import * as THREE from 'three';
 import { OrbitControls } from 'three/examples/jsm/controls/OrbitControls.js';
 import { STLLoader } from 'three/examples/jsm/loaders/STLLoader.js';
+import { loadCompactMesh } from './mesh-format.js';
 import { TransformControls } from 'three/examples/jsm/controls/TransformControls.js';
 // Post Processing imports
 import { EffectComposer } from 'three/examples/jsm/postprocessing/EffectComposer.js';
@@ -187,78 +188,12 @@ export class ModelViewer {
     }
 
     loadSTL(url, onLoadCallback = null, keepCamera = false) {
-        // Reset Repair State
-        this.isRepairing = false;
-        this.resetScene();
-        this.idleRotation = false;
         console.log("Loading STL from:", url);
 
         const loader = new STLLoader();
         loader.load(
             url,
-            (geometry) => {
-                try {
-                    // console.log("STL Loaded, Geometry:", geometry);
-                    geometry.center();
-                    geometry.computeVertexNormals();
-
-                    // SAFE MATERIAL: Lambert "Matte Clay" (Professional CAD Look)
-                    // High Contrast Dark Grey against Light Background
-                    const material = new THREE.MeshLambertMaterial({
-                        color: 0x333333, // Charcoal
-                        emissive: 0x000000
-                    });
-
-                    this.mesh = new THREE.Mesh(geometry, material);
-                    this.solidMaterial = material;
-                    this.mesh.castShadow = true;
-                    this.mesh.receiveShadow = true;
-                    this.mesh.visible = true;
-
-                    // 2. Wireframe Overlay (Subtle Tech)
-                    this.wireMaterial = new THREE.MeshBasicMaterial({
-                        color: 0x4f46e5, // Indigo
-                        wireframe: true,
-                        transparent: true,
-                        opacity: 0.0
-                    });
-                    this.wireMesh = new THREE.Mesh(geometry, this.wireMaterial);
-                    this.mesh.add(this.wireMesh);
-
-                    // NUCLEAR OPTION: DO NOT CREATE ANIME MESHES HERE.
-                    this.holoMesh = null;
-                    this.sparkles = null;
-                    this.bgMesh = null;
-                    this.magicCircle = null;
-
-                    this.scene.add(this.mesh);
-
-                    // Auto-Fit Camera (Non-destructive)
-                    if (!keepCamera) {
-                        this.fitCameraToMesh();
-                    }
-
-                    // Re-init Raycaster
-                    this.raycaster = new THREE.Raycaster();
-                    this.mouse = new THREE.Vector2();
-
-                    // VISIBILITY FIX: Ensure model starts clean
-                    this.targetProgress = 0.0;
-                    this.visualProgress = 0.0;
-
-                    // Force Background
-                    this.scene.background = new THREE.Color(0xf5f7fa);
-                    if (this.renderer) this.renderer.setClearColor(0xf5f7fa, 1);
-
-                    console.log("Model setup complete (CAD Mode), calling callback.");
-                    if (onLoadCallback) onLoadCallback();
-
-                } catch (e) {
-                    console.error("Error in STL processing:", e);
-                    // Still call callback on error so UI can reset
-                    if (onLoadCallback) onLoadCallback();
-                }
-            },
+            (geometry) => this.showGeometry(geometry, onLoadCallback, keepCamera),
             (xhr) => {
                 // Progress
                 // console.log((xhr.loaded / xhr.total * 100) + '% loaded');
@@ -271,6 +206,90 @@ export class ModelViewer {
         );
     }
 
+    // Repair results in the compact indexed encoding (about a tenth of the STL download).
+    // Falls back to the STL if the server or browser can't provide it.
+    loadCompact(url, onLoadCallback = null, keepCamera = false) {
+        console.log("Loading compact mesh from:", url);
+        loadCompactMesh(url)
+            .then(geometry => this.showGeometry(geometry, onLoadCallback, keepCamera))
+            .catch(e => {
+                console.warn("Compact mesh unavailable, loading STL:", e);
+                this.loadSTL(url, onLoadCallback, keepCamera);
+            });
+    }
+
+    showGeometry(geometry, onLoadCallback = null, keepCamera = false) {
+        // Reset Repair State
+        this.isRepairing = false;
+        this.resetScene();
+        this.idleRotation = false;
+
+        try {
+            // Remember the offset center() removes: shapes sent with a repair are placed in file coordinates
+            geometry.computeBoundingBox();
+            this.sourceCenter = geometry.boundingBox.getCenter(new THREE.Vector3());
+            geometry.center();
+            geometry.computeVertexNormals();
+
+            // SAFE MATERIAL: Lambert "Matte Clay" (Professional CAD Look)
+            // High Contrast Dark Grey against Light Background
+            const material = new THREE.MeshLambertMaterial({
+                color: 0x333333, // Charcoal
+                emissive: 0x000000,
+                flatShading: !!geometry.index // Faceted like the STL
+            });
+
+            this.mesh = new THREE.Mesh(geometry, material);
+            this.solidMaterial = material;
+            this.mesh.castShadow = true;
+            this.mesh.receiveShadow = true;
+            this.mesh.visible = true;
+
+            // 2. Wireframe Overlay (Subtle Tech)
+            this.wireMaterial = new THREE.MeshBasicMaterial({
+                color: 0x4f46e5, // Indigo
+                wireframe: true,
+                transparent: true,
+                opacity: 0.0
+            });
+            this.wireMesh = new THREE.Mesh(geometry, this.wireMaterial);
+            this.mesh.add(this.wireMesh);
+
+            // NUCLEAR OPTION: DO NOT CREATE ANIME MESHES HERE.
+            this.holoMesh = null;
+            this.sparkles = null;
+            this.bgMesh = null;
+            this.magicCircle = null;
+
+            this.scene.add(this.mesh);
+
+            // Auto-Fit Camera (Non-destructive)
+            if (!keepCamera) {
+                this.fitCameraToMesh();
+            }
+
+            // Re-init Raycaster
+            this.raycaster = new THREE.Raycaster();
+            this.mouse = new THREE.Vector2();
+
+            // VISIBILITY FIX: Ensure model starts clean
+            this.targetProgress = 0.0;
+            this.visualProgress = 0.0;
+
+            // Force Background
+            this.scene.background = new THREE.Color(0xf5f7fa);
+            if (this.renderer) this.renderer.setClearColor(0xf5f7fa, 1);
+
+            console.log("Model setup complete (CAD Mode), calling callback.");
+            if (onLoadCallback) onLoadCallback();
+
+        } catch (e) {
+            console.error("Error in STL processing:", e);
+            // Still call callback on error so UI can reset
+            if (onLoadCallback) onLoadCallback();
+        }
+    }
+
     applyMatrix(matrixArray) {
         if (!this.mesh) return;
 
@@ -585,6 +604,46 @@ export class ModelViewer {
         };
     }
 
+    // Color the loaded mesh by per-corner deviation from the input.
+    // values: Float32Array with one value per face corner (3 per face, STL face order).
+    applyDeviationColors(values, maxValue = null) {
+        if (!this.mesh) return;
+        let geometry = this.mesh.geometry;
+        if (geometry.index && values.length === geometry.index.count) {
+            // Per-corner colors need unshared corners
+            geometry = geometry.toNonIndexed();
+            geometry.computeVertexNormals();
+            this.mesh.geometry = geometry;
+            if (this.wireMesh) this.wireMesh.geometry = geometry;
+        }
+        if (values.length !== geometry.attributes.position.count) {
+            console.warn("Deviation map does not match geometry:", values.length, geometry.attributes.position.count);
+            return;
+        }
+
+        let max = maxValue;
+        if (!max) {
+            max = 0;
+            for (let i = 0; i < values.length; i++) max = Math.max(max, values[i]);
+        }
+        max = max || 1;
+
+        // Blue (exact) -> Red (max deviation)
+        const colors = new Float32Array(values.length * 3);
+        const color = new THREE.Color();
+        for (let i = 0; i < values.length; i++) {
+            const t = Math.min(values[i] / max, 1.0);
+            color.setHSL(0.66 * (1.0 - t), 0.9, 0.5);
+            colors[i * 3] = color.r;
+            colors[i * 3 + 1] = color.g;
+            colors[i * 3 + 2] = color.b;
+        }
+        geometry.setAttribute('color', new THREE.BufferAttribute(colors, 3));
+
+        this.mesh.material = new THREE.MeshLambertMaterial({ vertexColors: true });
+        this.solidMaterial = this.mesh.material;
+    }
+
     analyzeMesh() {
         if (!this.mesh) return { waterproof: 'Unknown' };
 
@@ -755,6 +814,29 @@ export class ModelViewer {
         console.log("=== startRepair() END - Toon Shader Active ===");
     }
 
+    // Intermediate geometry from the server (progress frames): replaces the hologram's
+    // geometry, centered like a loaded result, so the sweep plays over the real mesh
+    showRepairFrame(geometry) {
+        if (!this.isRepairing || !this.holoMesh || !this.toonMaterial) {
+            geometry.dispose();
+            return;
+        }
+        geometry.center();
+        geometry.computeVertexNormals();
+
+        const previous = this.holoMesh.geometry;
+        this.holoMesh.geometry = geometry;
+        this.holoMesh.position.set(0, 0, 0);
+        this.holoMesh.rotation.set(0, 0, 0);
+        this.holoMesh.scale.set(1, 1, 1);
+        this.holoMesh.updateMatrixWorld(true);
+        previous.dispose();
+
+        const box = new THREE.Box3().setFromObject(this.holoMesh);
+        this.toonMaterial.uniforms.uMinY.value = box.min.y;
+        this.toonMaterial.uniforms.uMaxY.value = box.max.y;
+    }
+
     updateRepairProgress(progress) {
         this.targetProgress = progress;
         console.log("updateRepairProgress called with:", progress);
@@ -0,0 +1,269 @@
+"""
+Remote repair worker agent.
+
+Leases repair jobs from a Naoshi API server over HTTP, runs repair_worker locally and
+reports back: progress events are batched to the server (which also renews the lease),
+the repaired mesh is uploaded before 'done' is sent. If the agent dies, its leases
+expire on the server and the jobs are re-queued for another worker.
+
+    python worker_agent.py --server http://localhost:8000 --slots 2
+
+Start several on one machine (each is its own agent) to try it locally; run the server
+with NAOSHI_REPAIR_WORKERS=0 to leave all repairs to agents.
+"""
+import os
+import sys
+import time
+import queue
+import socket
+import shutil
+import signal
+import argparse
+import multiprocessing
+
+import httpx
+
+from mesh_repair import repair_worker, deviation_map_path
+import mesh_lod
+import mesh_storage
+import memory_guard
+
+POLL_INTERVAL = 0.25   # seconds between event drains
+EVENT_INTERVAL = 0.5   # min seconds between event posts per job (progress is batched)
+IDLE_INTERVAL = 1.0    # seconds between lease requests when the server has no work
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class AgentJob:
+    """One leased job running in a local repair process."""
+
+    def __init__(self, lease, work_dir):
+        self.job_id = lease['job_id']
+        self.attempt = lease['attempt']
+        self.options = lease['options']
+        self.lease_seconds = lease['lease_seconds']
+        self.dir = os.path.join(work_dir, f"{self.job_id}_{self.attempt}")
+        self.input_path = os.path.join(self.dir, f"input{lease['input_ext']}")
+        self.output_path = os.path.join(self.dir, f"fixed_{lease['filename']}")
+        self.queue = None
+        self.process = None
+        self.pending = []
+        self.done = None
+        self.done_type = None
+        self.last_post = 0.0
+        self.finished = False
+
+    def start(self):
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=repair_worker, daemon=True,
+                                               args=(self.input_path, self.output_path, self.queue, self.options))
+        self.process.start()
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+            if self.process.is_alive():
+                # Forked children inherit our SIGTERM handler, which can't run inside a native filter
+                self.process.kill()
+                self.process.join()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class WorkerAgent:
+    def __init__(self, server, name=None, slots=1, work_dir=None, token=None):
+        self.server = server.rstrip('/')
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.slots = max(1, slots)
+        self.work_dir = work_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agent_work', self.name.replace(':', '_'))
+        self.client = httpx.Client(timeout=httpx.Timeout(60.0, connect=10.0),
+                                   headers={'X-Agent-Token': token} if token else {})
+        self.jobs = {}
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def log(self, msg):
+        print(f"[agent {self.name}] {msg}", flush=True)
+
+    def params(self, job):
+        return {'agent': self.name, 'attempt': job.attempt}
+
+    def check(self, response):
+        if response.status_code == 409:
+            raise LeaseLost(response.json().get('detail', 'Lease lost'))
+        response.raise_for_status()
+        return response
+
+    # --- Protocol ---
+
+    def lease(self):
+        response = self.client.post(f"{self.server}/api/agent/lease", json={'agent': self.name})
+        if response.status_code == 204:
+            return None
+        return self.check(response).json()
+
+    def fetch_input(self, job):
+        os.makedirs(job.dir, exist_ok=True)
+        with self.client.stream('GET', f"{self.server}/api/agent/jobs/{job.job_id}/input",
+                                params=self.params(job)) as response:
+            self.check(response)
+            with open(job.input_path, 'wb') as f:
+                for chunk in response.iter_bytes(1024 * 1024):
+                    f.write(chunk)
+
+    def upload(self, job, path, kind, **params):
+        with open(path, 'rb') as f:
+            self.check(self.client.put(f"{self.server}/api/agent/jobs/{job.job_id}/result",
+                                       params={**self.params(job), 'kind': kind, **params}, content=f))
+
+    def post_events(self, job):
+        response = self.client.post(f"{self.server}/api/agent/jobs/{job.job_id}/events",
+                                    params={'agent': self.name},
+                                    json={'attempt': job.attempt, 'events': job.pending})
+        status = self.check(response).json()['status']
+        job.pending = []
+        job.last_post = time.time()
+        if status == 'cancelled':
+            raise LeaseLost('Job cancelled')
+
+    # --- Loop ---
+
+    def start_job(self, lease):
+        job = AgentJob(lease, self.work_dir)
+        self.log(f"Leased {job.job_id} (attempt {job.attempt})")
+        try:
+            self.fetch_input(job)
+            job.start()
+        except Exception as e:
+            job.stop()
+            self.log(f"Could not start {job.job_id}: {e}")
+            try:
+                job.pending = [['error', f"Agent {self.name} could not start the job: {e}"]]
+                self.post_events(job)
+            except Exception:
+                pass  # Lease expiry re-queues it
+            return
+        self.jobs[job.job_id] = job
+
+    def service(self, job):
+        """Forwards a job's events; uploads the result before passing 'done' (or a draft's 'preview') on."""
+        while job.done is None and not job.finished:
+            try:
+                msg_type, content = job.queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg_type in ('preview', 'done'):
+                job.done, job.done_type = content, msg_type
+                break
+            if msg_type == 'frame':
+                continue  # Frame geometry stays in this machine's files
+            job.pending.append([msg_type, content])
+            if msg_type == 'error':
+                job.finished = True
+                break
+
+        if job.done is not None and not job.finished:
+            self.post_events(job)  # Flush progress first so the server sees it in order
+            try:
+                if mesh_storage.is_compressed(job.output_path):
+                    # Compressed here (options['compress_output']): sent and stored as it is
+                    self.upload(job, mesh_storage.stored(job.output_path), 'mesh', encoding=mesh_storage.ENCODING)
+                else:
+                    self.upload(job, job.output_path, 'mesh')
+                if job.done.get('deviation_map') and os.path.exists(deviation_map_path(job.output_path)):
+                    self.upload(job, deviation_map_path(job.output_path), 'deviation')
+                for preview in job.done.get('previews') or []:
+                    self.upload(job, mesh_lod.lod_path(job.output_path, preview['lod']), 'preview', lod=preview['lod'])
+                job.pending.append([job.done_type, job.done])
+            except httpx.HTTPError as e:
+                job.pending.append(['error', f"Result upload failed: {e}"])
+            job.finished = True
+        elif not job.finished and not job.process.is_alive() and job.queue.empty():
+            options = None
+            if memory_guard.is_memory_failure(job.process.exitcode):
+                options = memory_guard.downgrade_options(job.options, job.input_path)
+            if options is not None:
+                # Hit the memory ceiling: restart one rung down the ladder (we still hold the lease)
+                job.options = options
+                job.pending.append(['status', f"Out of memory; retrying at memory level {options['memory_level']}"])
+                job.start()
+            else:
+                job.pending.append(['error', 'Out of memory even at the lowest settings'
+                                    if memory_guard.is_memory_failure(job.process.exitcode)
+                                    else 'Process terminated unexpectedly'])
+                job.finished = True
+
+        # Posting (even with no events) renews the lease; stay well inside it
+        interval = EVENT_INTERVAL if job.pending else job.lease_seconds / 3
+        if job.finished or time.time() - job.last_post >= interval:
+            self.post_events(job)
+
+    def run(self, max_jobs=None):
+        self.log(f"Serving {self.server} with {self.slots} slot(s)")
+        started = 0
+        last_lease = 0.0
+        try:
+            while True:
+                for job_id, job in list(self.jobs.items()):
+                    try:
+                        self.service(job)
+                    except LeaseLost as e:
+                        self.log(f"Dropping {job_id}: {e}")
+                        job.finished = True
+                    except httpx.HTTPError as e:
+                        # Server unreachable: keep working, the next post retries (lease permitting)
+                        self.log(f"Server error for {job_id}: {e}")
+                        continue
+                    if job.finished:
+                        job.stop()
+                        del self.jobs[job_id]
+                        self.log(f"Finished {job_id}")
+
+                if max_jobs is not None and started >= max_jobs and not self.jobs:
+                    return started
+
+                free = self.slots - len(self.jobs)
+                if free > 0 and (max_jobs is None or started < max_jobs) and time.time() - last_lease >= IDLE_INTERVAL:
+                    try:
+                        lease = self.lease()
+                    except httpx.HTTPError as e:
+                        self.log(f"Lease request failed: {e}")
+                        lease = None
+                    if lease is None:
+                        last_lease = time.time()
+                    else:
+                        started += 1
+                        self.start_job(lease)
+                        continue
+                time.sleep(POLL_INTERVAL)
+        finally:
+            for job in self.jobs.values():
+                job.stop()
+            self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run repair jobs leased from a Naoshi API server.")
+    parser.add_argument('--server', default=os.environ.get('NAOSHI_SERVER', 'http://localhost:8000'))
+    parser.add_argument('--slots', type=int, default=1, help="Concurrent repairs on this machine")
+    parser.add_argument('--name', help="Agent name (default host:pid)")
+    parser.add_argument('--work-dir', help="Scratch directory for inputs/outputs")
+    parser.add_argument('--token', default=os.environ.get('NAOSHI_AGENT_TOKEN'))
+    parser.add_argument('--max-jobs', type=int, help="Exit after this many jobs (for testing)")
+    args = parser.parse_args()
+
+    agent = WorkerAgent(args.server, args.name, args.slots, args.work_dir, args.token)
+    # Exit through run()'s cleanup so repair processes don't outlive the agent
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        agent.run(args.max_jobs)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""
+Entry points for the processes the API server starts: repair processes and the orientation
+pool. Each imports its pipeline inside the child, so the server process itself never loads
+the geometry stacks (pymeshlab, trimesh, scipy) and starts in a fraction of the time.
+Importing this module costs only the standard library.
+"""
+import importlib
+import sys
+
+HEAVY_MODULES = ('pymeshlab', 'trimesh', 'scipy')  # Kept out of the API process
+WARM_MODULES = ('calculate_orientation',)  # Pre-imported in the orientation pool at startup
+
+
+def repair_worker(filepath, output_path, result_queue, options=None):
+    """mesh_repair.repair_worker, imported in the repair process."""
+    from mesh_repair import repair_worker
+    return repair_worker(filepath, output_path, result_queue, options)
+
+
+def compute_orientation(filepath, *args):
+    """calculate_orientation.compute_orientation, imported in the pool process."""
+    from calculate_orientation import compute_orientation
+    return compute_orientation(filepath, *args)
+
+
+def warm_up(modules=WARM_MODULES):
+    """Imports `modules` ahead of the first request that needs them. Returns the names."""
+    for name in modules:
+        importlib.import_module(name)
+    return list(modules)
+
+
+def loaded_heavy_modules():
+    """HEAVY_MODULES already imported in this process."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
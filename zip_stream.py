@@ -0,0 +1,143 @@
+"""
+ZIP helpers for batch repairs: unpacking uploaded archives into individual parts, and
+writing the results archive as a stream while the parts are still finishing.
+"""
+import io
+import os
+import time
+import uuid
+import zipfile
+
+import mesh_storage
+from chunked_upload import ContentHasher
+
+COPY_CHUNK = 4 * 1024 * 1024
+# Meshes deflate by about 2-10x; far higher ratios are bombs (zeros deflate about 1000x).
+# Members up to RATIO_FREE_SIZE bytes are exempt, as tiny files can compress oddly well
+MAX_COMPRESSION_RATIO = 100
+RATIO_FREE_SIZE = 1024 * 1024
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable write target that hands back whatever was written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ZipStream:
+    """
+    Builds a ZIP archive incrementally for a streaming response. Entries are written with
+    data descriptors (the sink can't seek), so only the current chunk is ever held in memory.
+    Every method returns the archive bytes produced by that step.
+    """
+
+    def __init__(self, compresslevel=1):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self._names = set()
+
+    def unique_name(self, name):
+        """name, or 'name (2).ext' etc. if already used in this archive."""
+        base, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate in self._names:
+            n += 1
+            candidate = f"{base} ({n}){ext}"
+        self._names.add(candidate)
+        return candidate
+
+    def file_chunks(self, name, path):
+        """
+        Generator adding the file at `path` (stored plain or compressed, see mesh_storage) as
+        `name`, yielding archive bytes per COPY_CHUNK read.
+        """
+        info = zipfile.ZipInfo(self.unique_name(name), date_time=time.localtime(mesh_storage.getmtime(path))[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        compressed = mesh_storage.is_compressed(path)
+        if not compressed:
+            info.file_size = os.path.getsize(path)  # Lets zipfile pick ZIP64 up front
+        with self._zip.open(info, 'w', force_zip64=compressed) as dest:  # Content size unknown: always ZIP64
+            for data in mesh_storage.chunks(path, COPY_CHUNK):
+                dest.write(data)
+                yield self._sink.take()
+        yield self._sink.take()
+
+    def write_bytes(self, name, data):
+        self._zip.writestr(self.unique_name(name), data)
+        return self._sink.take()
+
+    def close(self):
+        """Writes the central directory."""
+        self._zip.close()
+        return self._sink.take()
+
+
+def safe_member_name(name):
+    """ZIP member path with absolute, '.' and '..' components dropped ('' if nothing is left)."""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return '/'.join(parts)
+
+
+def extract_meshes(zip_path, dest_dir, extensions, max_files, max_size, max_total=None,
+                   max_ratio=MAX_COMPRESSION_RATIO):
+    """
+    Extracts the mesh members of an uploaded ZIP into dest_dir under fresh names.
+    Returns ([(member name, path, content hash, size)], [skipped member names]).
+    Raises ValueError (leaving nothing behind) past max_files parts, for a member over
+    max_size bytes or compressed more than max_ratio:1, or past max_total bytes in all.
+    """
+    parts, skipped = [], []
+    too_large = f"too large (max {max_size // (1024 * 1024)}MB)"
+    total = 0
+
+    def check(name, size, compressed):
+        if size > max_size:
+            raise ValueError(f"{name} is {too_large}")
+        if size > RATIO_FREE_SIZE and size > max_ratio * max(compressed, 1):
+            raise ValueError(f"{name} is compressed more than {max_ratio}:1")
+        if max_total is not None and total + size > max_total:
+            raise ValueError(f"Batch too large (max {max_total // (1024 * 1024)}MB extracted)")
+
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            for info in zf.infolist():
+                name = safe_member_name(info.filename)
+                if info.is_dir() or not name:
+                    continue
+                ext = os.path.splitext(name)[1].lower()
+                if name.startswith('__MACOSX/') or os.path.basename(name).startswith('.') or ext not in extensions:
+                    skipped.append(name)
+                    continue
+                if len(parts) >= max_files:
+                    raise ValueError("Too many parts in the batch")
+                check(name, info.file_size, info.compress_size)
+
+                path = os.path.join(dest_dir, f"{uuid.uuid4()}{ext}")
+                parts.append((name, path, None, 0))
+                hasher = ContentHasher()
+                with zf.open(info) as src, open(path, 'wb') as dest:
+                    while data := src.read(COPY_CHUNK):
+                        hasher.update(data)
+                        check(name, hasher.size, info.compress_size)  # Don't trust the declared size
+                        dest.write(data)
+                parts[-1] = (name, path, hasher.hexdigest(), hasher.size)
+                total += hasher.size
+    except Exception:
+        for part in parts:
+            if os.path.exists(part[1]):
+                os.remove(part[1])
+        raise
+    return parts, skipped